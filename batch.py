@@ -0,0 +1,694 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import heapq
+import logging
+import random
+
+from controller import ControllerBank, numpy
+from scenario import default_scenario
+
+log = logging.getLogger(__name__)
+
+# task status in the batch arrays
+IDLE = 0
+QUEUED = 1
+RUNNING = 2
+COMPLETED = 3
+
+# outcome of examining a queued task in a placement round (see BatchSimulator._evaluate())
+SKIP = 0
+NO_RESOURCE = 1
+NO_RESOURCE_OVER_LIMIT = 2
+INSUFFICIENT_SPACE = 3
+INSUFFICIENT_MEMORY = 4
+PLACE = 5
+OUTCOMES = 6
+
+
+class BatchSimulator:
+    """
+    Lockstep simulation of a batch of independent replicas of a scenario over the same workflow, which may differ in
+    seed and PID configuration. Every replica follows the event-driven loop of PIDScheduler with the random policy,
+    the latest-started preemption, static estimations, and shared storage only, and it ends with the same summary.
+
+    The per-replica state lives in arrays with one row per replica: task status, compute unit end and start times,
+    available storage and memory, file residency and reference counts, and the controllers (a 2-D ControllerBank).
+    Every iteration of the batch loop advances each replica by one scheduling step: next event times, finished tasks,
+    controller inputs, and the outcome of every queued task in placement rounds are computed for all the replicas at
+    once. The random draws and the bookkeeping of placed, finished, and preempted tasks remain per replica.
+    """
+
+    # placement passes with fewer replicas evaluate their candidates one at a time (cheaper than the vectorized
+    # evaluation of all the candidates)
+    VECTORIZED_ROWS = 16
+
+    def __init__(self, workflow, scenario=None):
+        """
+        Build the static structure of the workflow and the platform shared by every replica.
+        :param workflow: workflow object (only its structure is used, its state is not modified)
+        :param scenario: scenario object (default: the default scenario)
+        """
+        if numpy is None:
+            raise ImportError("BatchSimulator requires numpy")
+        scenario = scenario or default_scenario()
+        scenario.check_workflow(workflow)
+        for r in scenario.compute_resources:
+            if r['local_storage_capacity'] > 0:
+                raise ValueError("BatchSimulator only simulates shared storage (resource %s has a local storage)"
+                                 % r['id'])
+        self.scenario = scenario
+        self.storage_capacity = scenario.storage_capacity
+
+        tasks = workflow.task_list
+        position = dict((t.id, i) for i, t in enumerate(tasks))
+        self.num_tasks = len(tasks)
+        self.num_files = len(workflow.file_list)
+
+        # file sizes, the extra file (the last one) pads the file matrix: it has no size and it is always stored
+        self.file_size = [0.0] * (self.num_files + 1)
+        for f in workflow.file_list:
+            self.file_size[f.id] = f.size
+        self.file_size_array = numpy.array(self.file_size)
+
+        # compute resources (the extra resource pads the eligibility matrix: it never has idle units), and compute
+        # units (unit u of resource r is column unit_offset[r] + u)
+        resources = scenario.compute_resources
+        self.num_resources = len(resources)
+        self.memory_capacity = numpy.array([int(r['memory_capacity']) for r in resources], dtype=numpy.int64)
+        self.num_units = [r['compute_units'] for r in resources]
+        self.unit_offset = []
+        self.unit_resource = []
+        for i, n in enumerate(self.num_units):
+            self.unit_offset.append(len(self.unit_resource))
+            self.unit_resource.extend([i] * n)
+        self.num_columns = len(self.unit_resource)
+
+        # estimations and eligible compute resources (in resource order) by transformation
+        transformations = sorted(set(t.transformation for t in tasks))
+        index = dict((tr, i) for i, tr in enumerate(transformations))
+        self.storage_estimation = [scenario.storage_estimation[tr] for tr in transformations]
+        self.memory_estimation = [scenario.memory_estimation[tr] for tr in transformations]
+        self.storage_estimation_array = numpy.array(self.storage_estimation, dtype=float)
+        self.memory_estimation_array = numpy.array(self.memory_estimation, dtype=float)
+        eligible = [[i for i, r in enumerate(resources) if tr in r['accepted_tasks']] for tr in transformations]
+        self.eligible_resources = eligible
+        self.eligible = numpy.full((len(transformations), max(len(e) for e in eligible)), self.num_resources,
+                                   dtype=numpy.intp)
+        for i, e in enumerate(eligible):
+            self.eligible[i, :len(e)] = e
+
+        # task structure: files in the order in which they are stored, used, and removed
+        self.transformation = [index[t.transformation] for t in tasks]
+        self.transformation_array = numpy.array(self.transformation, dtype=numpy.intp)
+        self.duration = [t.duration for t in tasks]
+        self.peak_memory = [t.peak_memory for t in tasks]
+        self.peak_memory_array = numpy.array(self.peak_memory, dtype=numpy.int64)
+        self.input_files = [[f.id for f in t.input_data.values()] for t in tasks]
+        self.removed_files = [[f.id for l in (t.input_data, t.intermediate_data) for f in l.values()] for t in tasks]
+        self.task_files = [[f.id for l in (t.input_data, t.intermediate_data, t.output_data) for f in l.values()]
+                           for t in tasks]
+        self.files = numpy.full((self.num_tasks, max([len(f) for f in self.task_files] + [1])), self.num_files,
+                                dtype=numpy.intp)
+        for i, f in enumerate(self.task_files):
+            self.files[i, :len(f)] = f
+
+        self.children = [[position[c.id] for c in workflow.children[t.id]] for t in tasks]
+        self.num_parents = [len(t.parent_tasks) for t in tasks]
+        self.roots = [i for i, t in enumerate(tasks) if not t.parent_tasks]
+        self.required_files = [0] * (self.num_files + 1)
+        for files in self.input_files:
+            for f in files:
+                self.required_files[f] += 1
+
+    def run(self, seeds, configs=None, enable_pid=True):
+        """
+        Simulate one replica per seed.
+        :param seeds: list of seeds of the random task selection
+        :param configs: list of PID controllers configurations, one per seed (default: the scenario configuration)
+        :param enable_pid: whether the PID controllers are enabled
+        :return: list of simulation summaries (as returned by PIDScheduler.get_summary()), with None for the
+                 replicas that have stalled
+        """
+        num_replicas = len(seeds)
+        configs = configs or [self.scenario.config] * num_replicas
+        if len(configs) != num_replicas:
+            raise ValueError("Expected one configuration per seed (%s seeds, %s configurations)"
+                             % (num_replicas, len(configs)))
+        self._init_run_state(seeds, configs, enable_pid)
+
+        now = self.now
+        unit_end = self.unit_end
+        changed = self.changed
+        inf = float("inf")
+        summaries = [None] * num_replicas
+        active = range(num_replicas)
+
+        while active:
+            rows = numpy.array(active)
+
+            # next event time of every replica
+            next_time = now[rows] + 1
+            waiting = ~changed[rows]
+            if waiting.any():
+                end_time = numpy.ceil(unit_end[rows[waiting]].min(axis=1))
+                stalled = end_time == inf
+                if stalled.any():
+                    for b in rows[waiting][stalled].tolist():
+                        log.info("[%s] Simulation stalled (seed: %s): there are no running tasks and the schedule "
+                                 "has not changed.", now[b], seeds[b])
+                    active = [b for b in active if not (not changed[b] and unit_end[b].min() == inf)]
+                    continue
+                next_time[waiting] = numpy.maximum(next_time[waiting], end_time)
+            now[rows] = next_time
+            self.steps[rows] += 1
+
+            # process finished tasks, by resource order and compute unit id
+            finished_rows, finished_columns = (unit_end[rows] <= next_time[:, None]).nonzero()
+            finished = set()
+            for i, w in zip(finished_rows.tolist(), finished_columns.tolist()):
+                b = active[i]
+                self._finish(b, w)
+                finished.add(b)
+
+            step_rows = [b for b in active if changed[b] or b in finished]
+            if step_rows:
+                self._schedule(step_rows)
+
+            done = [b for b in step_rows if self.pending_count[b] == 0]
+            if done:
+                for b in done:
+                    summaries[b] = self._get_summary(b)
+                done = set(done)
+                active = [b for b in active if b not in done]
+
+        return summaries
+
+    def _init_run_state(self, seeds, configs, enable_pid):
+        num_replicas = len(seeds)
+        num_resources = self.num_resources
+        self.enable_pid = enable_pid
+        self.random = [random.Random(seed) for seed in seeds]
+
+        # clock and statistics
+        self.now = numpy.zeros(num_replicas, dtype=numpy.int64)
+        self.changed = numpy.ones(num_replicas, dtype=bool)
+        self.steps = numpy.zeros(num_replicas, dtype=numpy.int64)
+        self.preempted_tasks = [0] * num_replicas
+        self.overflow_steps = [0] * num_replicas
+        self.peak_storage_usage = numpy.zeros(num_replicas)
+        self.peak_memory_usage = numpy.zeros(num_replicas, dtype=numpy.int64)
+
+        # tasks
+        self.status = numpy.zeros((num_replicas, self.num_tasks), dtype=numpy.int8)
+        self.unfinished_parents = [list(self.num_parents) for _ in range(num_replicas)]
+        self.pending_count = [self.num_tasks] * num_replicas
+        self.ready = [list(self.roots) for _ in range(num_replicas)]
+        self.queue = [[] for _ in range(num_replicas)]
+        self.cleanup_files = [[] for _ in range(num_replicas)]
+        self.cleanup_duration = [[] for _ in range(num_replicas)]
+        self.cleanup_status = [[] for _ in range(num_replicas)]
+
+        # compute units: end time of the running task (inf if idle), start time of the running non-cleanup task
+        # (-inf otherwise, victims are the latest started tasks), and running task (cleanup tasks are numbered after
+        # the workflow tasks)
+        self.unit_end = numpy.full((num_replicas, self.num_columns), numpy.inf)
+        self.unit_start = numpy.full((num_replicas, self.num_columns), -numpy.inf)
+        self.unit_task = [[-1] * self.num_columns for _ in range(num_replicas)]
+        self.idle_units = [[range(n) for n in self.num_units] for _ in range(num_replicas)]
+        self.idle_count = numpy.tile(self.num_units + [0], (num_replicas, 1))
+        self.running_count = [0] * num_replicas
+
+        # storage and memory
+        self.available = numpy.full(num_replicas, self.storage_capacity, dtype=float)
+        self.available_memory = numpy.tile(numpy.append(self.memory_capacity, 0), (num_replicas, 1))
+        self.stored = numpy.zeros((num_replicas, self.num_files + 1), dtype=bool)
+        self.stored[:, self.num_files] = True
+        # file reference counts (updated one task at a time, thus kept as lists)
+        self.pending_refs = [list(self.required_files) for _ in range(num_replicas)]
+        self.running_refs = [[0] * (self.num_files + 1) for _ in range(num_replicas)]
+        # orphan files (same insertion and removal sequence as Storage.orphans, so cleanup tasks list their files in
+        # the same order), and their total size
+        self.orphans = [{} for _ in range(num_replicas)]
+        self.orphan_size = [0.0] * num_replicas
+
+        # controllers: the storage controller and one memory controller per compute resource in every row
+        storage_limit = numpy.array([c.storage_limit for c in configs], dtype=float)[:, None]
+        memory_setpoint = numpy.array([c.memory_threshold for c in configs], dtype=float)[:, None] \
+            * self.memory_capacity
+        gains = dict((g, numpy.array([[getattr(c, "sto_" + g)] + [getattr(c, "mem_" + g)] * num_resources
+                                      for c in configs], dtype=float)) for g in ("kp", "ki", "kd"))
+        self.controllers = ControllerBank(numpy.hstack([storage_limit, memory_setpoint]), **gains)
+        self.controller_limits = numpy.append(numpy.inf, self.memory_capacity)
+        self.storage_limit = storage_limit[:, 0]
+        self.storage_budget = numpy.zeros(num_replicas)
+        self.memory_budget = numpy.zeros((num_replicas, num_resources + 1))
+
+        # placement rounds: remaining candidates, and outcome of the remaining (non-cleanup) candidates by task
+        # (outcome + compute resource index * OUTCOMES)
+        self.candidates = [None] * num_replicas
+        self.outcomes = [None] * num_replicas
+        self.placed = [None] * num_replicas
+        self.insufficient_space = [False] * num_replicas
+
+    def _schedule(self, rows):
+        """
+        Feed the controllers, queue the ready tasks, then place queued tasks or preempt running tasks in every
+        replica that has reached a scheduling step.
+        :param rows: list of replicas
+        """
+        enable_pid = self.enable_pid
+        num_tasks = self.num_tasks
+        status = self.status
+        cleanup_status = self.cleanup_status
+        row_array = numpy.array(rows)
+
+        if enable_pid:
+            outputs = numpy.empty((len(rows), self.num_resources + 1))
+            outputs[:, 0] = self.storage_capacity - self.available[row_array]
+            outputs[:, 1:] = self.memory_capacity - self.available_memory[row_array, :-1]
+            inputs = self.controllers.process(outputs, rows=row_array, upper=self.controller_limits)
+            self.storage_budget[row_array] = inputs[:, 0]
+            self.memory_budget[row_array, :-1] = inputs[:, 1:]
+            storage_budget = inputs[:, 0].tolist()
+        else:
+            storage_budget = [0.0] * len(rows)
+
+        placing = []
+        for b, budget in zip(rows, storage_budget):
+            # add ready tasks to the queue
+            queue = self.queue[b]
+            for t in self.ready[b]:
+                if t < num_tasks:
+                    if status.item(b, t) == IDLE:
+                        queue.append(t)
+                        status[b, t] = QUEUED
+                elif cleanup_status[b][t - num_tasks] == IDLE:
+                    queue.append(t)
+                    cleanup_status[b][t - num_tasks] = QUEUED
+            self.ready[b] = []
+            self.changed[b] = False
+
+            if not enable_pid or budget > 0:
+                self.candidates[b] = list(queue)
+                self.placed[b] = []
+                self.insufficient_space[b] = False
+                placing.append(b)
+            elif budget < 0:
+                self._preempt(b)
+
+        # placement rounds: the outcome of the remaining candidates is evaluated again after every placement, the
+        # candidates of the last few replicas are evaluated one at a time as they are drawn
+        evaluating = placing
+        while evaluating:
+            if len(evaluating) >= BatchSimulator.VECTORIZED_ROWS:
+                self._evaluate(evaluating)
+            else:
+                for b in evaluating:
+                    self.outcomes[b] = None
+            evaluating = [b for b in evaluating if self._place_next(b)]
+
+        for b in placing:
+            placed = self.placed[b]
+            if placed:
+                placed = set(placed)
+                self.queue[b] = [t for t in self.queue[b] if t not in placed]
+            elif self.insufficient_space[b]:
+                self._create_cleanup_task(b)
+
+        used_memory = (self.memory_capacity - self.available_memory[row_array, :-1]).sum(axis=1)
+        self.peak_storage_usage[row_array] = numpy.maximum(self.peak_storage_usage[row_array],
+                                                           self.storage_capacity - self.available[row_array])
+        self.peak_memory_usage[row_array] = numpy.maximum(self.peak_memory_usage[row_array], used_memory)
+
+    def _evaluate(self, rows):
+        """
+        Evaluate the outcome of examining every remaining (non-cleanup) candidate of a placement round against the
+        current state of its replica: skipped (storage estimation above the storage controller budget), no eligible
+        resource with an idle unit and enough memory budget (and whether the storage usage is beyond the limit),
+        insufficient space, insufficient memory, or placement in the first such resource.
+        :param rows: list of replicas in a placement round
+        """
+        num_tasks = self.num_tasks
+        candidates = [[t for t in self.candidates[b] if t < num_tasks] for b in rows]
+        tasks = [t for c in candidates for t in c]
+        if not tasks:
+            for b in rows:
+                self.outcomes[b] = {}
+            return
+        replicas = numpy.repeat(rows, [len(c) for c in candidates])
+        task_array = numpy.array(tasks)
+        transformation = self.transformation_array[task_array]
+
+        # first eligible compute resource with an idle unit (and enough memory budget)
+        num_resources = self.num_resources
+        resource = numpy.full(len(tasks), num_resources, dtype=numpy.intp)
+        for eligible in self.eligible[transformation].T:
+            fits = self.idle_count[replicas, eligible] > 0
+            if self.enable_pid:
+                fits &= ~(self.memory_estimation_array[transformation] > self.memory_budget[replicas, eligible])
+            resource = numpy.where((resource == num_resources) & fits, eligible, resource)
+
+        # storage required by the files that are not stored yet (summed in file order)
+        required_storage = numpy.zeros(len(tasks))
+        for files in self.files[task_array].T:
+            required_storage += numpy.where(self.stored[replicas, files], 0.0, self.file_size_array[files])
+
+        outcome = numpy.full(len(tasks), PLACE, dtype=numpy.intp)
+        outcome[self.available_memory[replicas, resource] < self.peak_memory_array[task_array]] = INSUFFICIENT_MEMORY
+        outcome[self.available[replicas] < required_storage] = INSUFFICIENT_SPACE
+        no_resource = resource == num_resources
+        if self.enable_pid:
+            over_limit = self.storage_capacity - self.available[replicas] > self.storage_limit[replicas]
+            outcome[no_resource] = numpy.where(over_limit[no_resource], NO_RESOURCE_OVER_LIMIT, NO_RESOURCE)
+            outcome[self.storage_estimation_array[transformation] > self.storage_budget[replicas]] = SKIP
+        else:
+            outcome[no_resource] = NO_RESOURCE
+
+        outcome = (outcome + resource * OUTCOMES).tolist()
+        start = 0
+        for b, c in zip(rows, candidates):
+            self.outcomes[b] = dict(zip(c, outcome[start:start + len(c)]))
+            start += len(c)
+
+    def _place_next(self, b):
+        """
+        Examine the candidates of a replica in random order until a task is placed or the round ends (if the outcomes
+        of the candidates have not been evaluated, every candidate is evaluated when drawn and the round goes on after
+        a placement).
+        :param b: replica
+        :return: whether a task has been placed and the round goes on (thus the remaining candidates have to be
+                 evaluated again)
+        """
+        candidates = self.candidates[b]
+        draw = self.random[b].random
+        outcomes = self.outcomes[b]
+        num_tasks = self.num_tasks
+
+        while candidates:
+            t = candidates.pop(int(draw() * len(candidates)))
+            if t >= num_tasks:
+                placed = self._run_cleanup_task(b, t)
+            else:
+                o = outcomes[t] if outcomes is not None else self._evaluate_task(b, t)
+                outcome = o % OUTCOMES
+                if outcome == PLACE:
+                    self._run_task(b, t, o // OUTCOMES)
+                    placed = True
+                elif outcome == NO_RESOURCE_OVER_LIMIT:
+                    return False
+                else:
+                    if outcome == INSUFFICIENT_SPACE:
+                        self.insufficient_space[b] = True
+                    continue
+
+            if self.enable_pid and self.storage_capacity - self.available.item(b) > self.storage_limit.item(b):
+                return False
+            if placed and outcomes is not None:
+                return len(candidates) > 0
+        return False
+
+    def _evaluate_task(self, b, t):
+        """
+        Evaluate the outcome of examining a single candidate (same outcomes as _evaluate()).
+        :param b: replica
+        :param t: task index
+        :return: outcome + compute resource index * OUTCOMES
+        """
+        transformation = self.transformation[t]
+        if self.enable_pid and self.storage_estimation[transformation] > self.storage_budget.item(b):
+            return SKIP
+
+        resource = None
+        for r in self.eligible_resources[transformation]:
+            if self.enable_pid and self.memory_estimation[transformation] > self.memory_budget.item(b, r):
+                continue
+            if self.idle_count.item(b, r) > 0:
+                resource = r
+                break
+        if resource is None:
+            if self.enable_pid and self.storage_capacity - self.available.item(b) > self.storage_limit.item(b):
+                return NO_RESOURCE_OVER_LIMIT
+            return NO_RESOURCE
+
+        required_storage = 0.0
+        stored = self.stored[b]
+        for f in self.task_files[t]:
+            if not stored[f]:
+                required_storage += self.file_size[f]
+        if self.available.item(b) < required_storage:
+            return INSUFFICIENT_SPACE
+        if self.available_memory.item(b, resource) < self.peak_memory[t]:
+            return INSUFFICIENT_MEMORY
+        return PLACE + resource * OUTCOMES
+
+    def _run_task(self, b, t, r):
+        """
+        Start a task in the idle compute unit with the lowest id of a compute resource, and store its files.
+        :param b: replica
+        :param t: task index
+        :param r: compute resource index
+        """
+        size = self.file_size
+        stored = self.stored[b]
+        pending_refs = self.pending_refs[b]
+        running_refs = self.running_refs[b]
+        orphans = self.orphans[b]
+        available = float(self.available[b])
+        orphan_size = self.orphan_size[b]
+
+        files = self.task_files[t]
+        for f in files:
+            if not stored[f]:
+                stored[f] = True
+                available -= size[f]
+                if pending_refs[f] == 0 and running_refs[f] == 0:
+                    orphans[f] = size[f]
+                    orphan_size += size[f]
+        self.available_memory[b, r] -= self.peak_memory[t]
+
+        w = self.unit_offset[r] + heapq.heappop(self.idle_units[b][r])
+        self.idle_count[b, r] -= 1
+        for f in files:
+            running_refs[f] += 1
+            if running_refs[f] == 1 and pending_refs[f] == 0 and orphans.pop(f, None) is not None:
+                orphan_size -= size[f]
+                if not orphans:
+                    orphan_size = 0.0
+
+        start_time = self.now.item(b)
+        self.unit_end[b, w] = start_time + self.duration[t]
+        self.unit_start[b, w] = start_time
+        self.unit_task[b][w] = t
+        self.status[b, t] = RUNNING
+        self.running_count[b] += 1
+        self.available[b] = available
+        self.orphan_size[b] = orphan_size
+        self.placed[b].append(t)
+        self.changed[b] = True
+        if self.enable_pid:
+            self.storage_budget[b] -= self.storage_estimation[self.transformation[t]]
+            self.memory_budget[b, r] -= self.memory_estimation[self.transformation[t]]
+
+    def _run_cleanup_task(self, b, t):
+        """
+        Start a cleanup task in the first compute resource with an idle unit.
+        :param b: replica
+        :param t: cleanup task index (numbered after the workflow tasks)
+        :return: whether the task has been started
+        """
+        for r in range(self.num_resources):
+            if self.idle_count.item(b, r) > 0:
+                w = self.unit_offset[r] + heapq.heappop(self.idle_units[b][r])
+                self.idle_count[b, r] -= 1
+                k = t - self.num_tasks
+                self.unit_end[b, w] = self.now.item(b) + self.cleanup_duration[b][k]
+                self.unit_task[b][w] = t
+                self.cleanup_status[b][k] = RUNNING
+                self.placed[b].append(t)
+                self.changed[b] = True
+                return True
+        return False
+
+    def _finish(self, b, w):
+        """
+        Process the task that has finished in a compute unit: release its memory and files, and the children that
+        have no unfinished parents left.
+        :param b: replica
+        :param w: compute unit column
+        """
+        t = self.unit_task[b][w]
+        r = self.unit_resource[w]
+        self.unit_end[b, w] = numpy.inf
+        self.unit_start[b, w] = -numpy.inf
+        heapq.heappush(self.idle_units[b][r], w - self.unit_offset[r])
+        self.idle_count[b, r] += 1
+        self.pending_count[b] -= 1
+
+        if t >= self.num_tasks:
+            k = t - self.num_tasks
+            files = self.cleanup_files[b][k]
+            self.cleanup_status[b][k] = COMPLETED
+            self._remove_files(b, files, keep_required=False)
+            self._release_inputs(b, files)
+            return
+
+        self.available_memory[b, r] += self.peak_memory[t]
+        self._release_files(b, self.task_files[t])
+        self._remove_files(b, self.removed_files[t], keep_required=False)
+        self.status[b, t] = COMPLETED
+        self.running_count[b] -= 1
+        self._release_inputs(b, self.input_files[t])
+
+        status = self.status[b]
+        unfinished_parents = self.unfinished_parents[b]
+        ready = self.ready[b]
+        for c in self.children[t]:
+            unfinished_parents[c] -= 1
+            if unfinished_parents[c] == 0 and status.item(c) == IDLE:
+                ready.append(c)
+
+    def _preempt(self, b):
+        """
+        Preempt the latest started tasks (ties are broken by resource order and compute unit id) until the storage
+        controller budget is no longer negative. The last running task is never preempted.
+        :param b: replica
+        """
+        self.overflow_steps[b] += 1
+        budget = float(self.storage_budget[b])
+        unit_start = self.unit_start[b]
+        while budget < 0 and self.running_count[b] > 1:
+            w = int(unit_start.argmax())
+            t = self.unit_task[b][w]
+            r = self.unit_resource[w]
+            self.unit_end[b, w] = numpy.inf
+            unit_start[w] = -numpy.inf
+            heapq.heappush(self.idle_units[b][r], w - self.unit_offset[r])
+            self.idle_count[b, r] += 1
+            self.status[b, t] = IDLE
+            self._release_files(b, self.task_files[t])
+            self._remove_files(b, self.removed_files[t], keep_required=True)
+            self.available_memory[b, r] += self.peak_memory[t]
+            self.ready[b].append(t)
+            self.running_count[b] -= 1
+            budget += self.storage_estimation[self.transformation[t]]
+            self.preempted_tasks[b] += 1
+            self.changed[b] = True
+        self.storage_budget[b] = budget
+
+    def _create_cleanup_task(self, b):
+        """
+        Create a cleanup task that removes the orphan files of a replica, if any.
+        :param b: replica
+        """
+        if self.orphan_size[b] <= 0:
+            return
+        files = list(self.orphans[b])
+        total_size = 0
+        for f in files:
+            total_size += self.file_size[f]
+        if total_size == 0:
+            return
+
+        self.cleanup_files[b].append(files)
+        self.cleanup_duration[b].append(total_size * 10)
+        self.cleanup_status[b].append(IDLE)
+        self.pending_count[b] += 1
+        self.ready[b].append(self.num_tasks + len(self.cleanup_files[b]) - 1)
+
+        pending_refs = self.pending_refs[b]
+        running_refs = self.running_refs[b]
+        for f in files:
+            pending_refs[f] += 1
+            if pending_refs[f] == 1 and running_refs[f] == 0:
+                self._discard_orphan(b, f)
+
+    def _release_files(self, b, files):
+        """
+        Release the files used by a task that has finished or has been preempted.
+        :param b: replica
+        :param files: list of file ids
+        """
+        pending_refs = self.pending_refs[b]
+        running_refs = self.running_refs[b]
+        for f in files:
+            running_refs[f] -= 1
+            if running_refs[f] == 0 and pending_refs[f] == 0:
+                self._add_orphan(b, f)
+
+    def _release_inputs(self, b, files):
+        """
+        Release the input files of a task that is no longer pending.
+        :param b: replica
+        :param files: list of file ids
+        """
+        pending_refs = self.pending_refs[b]
+        running_refs = self.running_refs[b]
+        for f in files:
+            pending_refs[f] -= 1
+            if pending_refs[f] == 0 and running_refs[f] == 0:
+                self._add_orphan(b, f)
+
+    def _remove_files(self, b, files, keep_required):
+        """
+        Remove the stored files that are not used by running tasks.
+        :param b: replica
+        :param files: list of file ids
+        :param keep_required: whether files required by pending tasks should not be removed
+        """
+        stored = self.stored[b]
+        pending_refs = self.pending_refs[b]
+        running_refs = self.running_refs[b]
+        for f in files:
+            if running_refs[f] > 0 or (keep_required and pending_refs[f] > 0):
+                continue
+            if stored[f]:
+                stored[f] = False
+                self.available[b] = float(self.available[b]) + self.file_size[f]
+                self._discard_orphan(b, f)
+
+    def _add_orphan(self, b, f):
+        if self.stored[b, f] and f not in self.orphans[b]:
+            self.orphans[b][f] = self.file_size[f]
+            self.orphan_size[b] += self.file_size[f]
+
+    def _discard_orphan(self, b, f):
+        orphans = self.orphans[b]
+        if orphans.pop(f, None) is not None:
+            self.orphan_size[b] -= self.file_size[f]
+            if not orphans:
+                # do not accumulate rounding errors
+                self.orphan_size[b] = 0.0
+
+    def _get_summary(self, b):
+        """
+        Get summary statistics of a replica.
+        :param b: replica
+        :return: dictionary of summary statistics
+        """
+        return {
+            'makespan': self.now.item(b),
+            'steps': int(self.steps[b]),
+            'completed_tasks': int((self.status[b] == COMPLETED).sum()),
+            'preempted_tasks': self.preempted_tasks[b],
+            'overflow_steps': self.overflow_steps[b],
+            'cleanup_tasks': len(self.cleanup_files[b]),
+            'peak_storage': float(self.peak_storage_usage[b]),
+            'peak_memory': int(self.peak_memory_usage[b])
+        }
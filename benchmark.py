@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from StringIO import StringIO
+from batch import BatchSimulator
+from compiled_workflow import load_workflow
+from generate_workflow import generate_parametric, workflow_trace
+from pid_scheduler import PIDScheduler, SimulationStalled
+from scenario import Scenario
+from simulator import create_resources
+from stats import timer
+from workflow import parse_workflow
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+log = logging.getLogger(__name__)
+
+# workflow files shipped with the simulator, and the scenario (platform and estimations) they are simulated with
+WORKFLOWS = [("workflows/test-workflow.csv", "scenarios/test-workflow.json"),
+             ("workflows/1000genome.csv", "scenarios/1000genome.json")]
+
+# workflow, scenario, and number of replicas of the batch cases (replicas simulated in lockstep compared to the same
+# replicas simulated one after another); the quick benchmark only runs the smallest batch
+BATCH = [("workflows/1000genome.csv", "scenarios/1000genome.json", 16),
+         ("workflows/1000genome.csv", "scenarios/1000genome.json", 64)]
+
+# synthetic workflows (chromosomes, populations, individuals tasks per chromosome) and the platform scale they are
+# simulated with
+SYNTHETIC = [(22, 7, 1, 1), (44, 14, 1, 2), (66, 21, 1, 3)]
+
+# synthetic workflows only included on request, since they take minutes per run
+SYNTHETIC_LARGE = [(88, 28, 1, 4)]
+
+# synthetic workflows with a wide fan-in (every pair and frequency task depends on all the individuals tasks of its
+# chromosome), always included; larger ones stall on the simulated platform, thus they are only measured when loaded
+SYNTHETIC_WIDE = [(2, 7, 32, 1)]
+
+# synthetic workflows (chromosomes, populations, individuals tasks per chromosome) whose memory footprint and
+# loading time are measured
+MEMORY = [(88, 28, 1), (176, 56, 1)]
+
+# wide fan-in workflows whose memory footprint and loading time are measured, always included
+MEMORY_WIDE = [(4, 7, 800)]
+
+# workflow used as trace to sample the synthetic workflows from
+SYNTHETIC_TRACE = "workflows/1000genome.csv"
+
+# metrics compared against a baseline (a higher value is worse)
+COMPARED_METRICS = ["wall_time", "load_time", "clone_time", "peak_rss", "workflow_rss"]
+
+# compared metrics that are times (in seconds)
+TIME_METRICS = ["wall_time", "load_time", "clone_time"]
+
+
+def get_memory_status(field):
+    """
+    Get a memory figure of the current process from /proc (Linux only).
+    :param field: status field (e.g., VmHWM for the peak resident set size, VmRSS for the current one)
+    :return: value in kB, or None if not available
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def create_platform(scale=1):
+    """
+    Create the simulated platform of the synthetic workflows, with every compute resource replicated a number of
+    times.
+    :param scale: number of replicas of each compute resource
+    :return: shared storage and list of compute resources
+    """
+    shared_storage, compute_resources = create_resources()
+    for i in range(2, scale + 1):
+        for cr in compute_resources[:3]:
+            replica = cr.clone(shared_storage)
+            replica.id = "%s-%s" % (cr.id, i)
+            compute_resources.append(replica)
+    return shared_storage, compute_resources
+
+
+def load_case_workflow(case, result):
+    """
+    Load (or generate) the workflow of a benchmark case, and measure the time to load (or parse, the generation is
+    not measured) and to clone it.
+    :param case: benchmark case dictionary
+    :param result: dictionary of results, the load_time and clone_time metrics are added to it
+    :return: workflow object
+    """
+    start_time = timer()
+    if 'chromosomes' not in case:
+        workflow = load_workflow(case['workflow'])
+    else:
+        output = StringIO()
+        generate_parametric(workflow_trace(load_workflow(SYNTHETIC_TRACE)), case['chromosomes'],
+                            case['populations'], case['individuals'], output, seed=case['seed'])
+        output.seek(0)
+        start_time = timer()
+        workflow = parse_workflow(output)
+    result['load_time'] = timer() - start_time
+
+    start_time = timer()
+    workflow.clone()
+    result['clone_time'] = timer() - start_time
+    return workflow
+
+
+def run_case(case):
+    """
+    Run a benchmark case (in a fresh worker process, so the peak RSS only accounts for this case).
+    :param case: benchmark case dictionary
+    :return: dictionary of results
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    result = {}
+    workflow = load_case_workflow(case, result)
+    result['tasks'] = len(workflow.tasks)
+
+    if 'scenario' in case:
+        scheduler = Scenario.load(case['scenario']).create_scheduler(workflow, seed=case['seed'])
+    else:
+        shared_storage, compute_resources = create_platform(case['scale'])
+        scheduler = PIDScheduler(workflow, compute_resources, shared_storage, seed=case['seed'])
+    result['compute_resources'] = len(scheduler.compute_resources)
+
+    wall_times = []
+    for i in range(0, case['repeat']):
+        scheduler.reset(seed=case['seed'])
+        gc.collect()
+        start_time = timer()
+        try:
+            scheduler.start(enable_pid=case['enable_pid'], event_driven=case['event_driven'])
+        except SimulationStalled as e:
+            result['skipped'] = str(e)
+            return result
+        wall_times.append(timer() - start_time)
+
+    summary = scheduler.get_summary()
+    result['wall_time'] = min(wall_times)
+    result['wall_time_mean'] = sum(wall_times) / len(wall_times)
+    result['makespan'] = summary['makespan']
+    result['steps'] = summary['steps']
+    result['steps_per_second'] = summary['steps'] / result['wall_time']
+    result['tasks_per_second'] = (summary['completed_tasks'] + summary['cleanup_tasks']) / result['wall_time']
+    result['peak_rss'] = get_memory_status("VmHWM")
+
+    # allocations are measured in a separate run, since tracing them slows the simulation down
+    objects = len(gc.get_objects())
+    scheduler.reset(seed=case['seed'])
+    if tracemalloc:
+        tracemalloc.start()
+    scheduler.start(enable_pid=case['enable_pid'], event_driven=case['event_driven'])
+    if tracemalloc:
+        _, result['allocated_peak'] = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    result['gc_objects'] = len(gc.get_objects()) - objects
+    return result
+
+
+def run_batch_case(case):
+    """
+    Run a batch case: simulate a batch of replicas (consecutive seeds) one after another by resetting a scheduler, then
+    in lockstep with the batch simulator, and check that both give the same summaries.
+    :param case: benchmark case dictionary
+    :return: dictionary of results
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    result = {}
+    workflow = load_case_workflow(case, result)
+    result['tasks'] = len(workflow.tasks)
+    scenario = Scenario.load(case['scenario'])
+    scheduler = scenario.create_scheduler(workflow)
+    simulator = BatchSimulator(workflow, scenario)
+    seeds = range(case['seed'], case['seed'] + case['batch'])
+
+    gc.collect()
+    start_time = timer()
+    summaries = []
+    for seed in seeds:
+        scheduler.reset(seed=seed)
+        try:
+            scheduler.start(enable_pid=case['enable_pid'], event_driven=True)
+            summaries.append(scheduler.get_summary())
+        except SimulationStalled:
+            summaries.append(None)
+    result['sequential_time'] = timer() - start_time
+
+    gc.collect()
+    start_time = timer()
+    batch_summaries = simulator.run(seeds, enable_pid=case['enable_pid'])
+    result['wall_time'] = timer() - start_time
+
+    if batch_summaries != summaries:
+        raise AssertionError("Batch and sequential summaries differ (seeds: %s-%s)" % (seeds[0], seeds[-1]))
+    result['replicas'] = case['batch']
+    result['stalled'] = summaries.count(None)
+    result['scenarios_per_second'] = case['batch'] / result['wall_time']
+    result['sequential_scenarios_per_second'] = case['batch'] / result['sequential_time']
+    result['speedup'] = result['sequential_time'] / result['wall_time']
+    result['peak_rss'] = get_memory_status("VmHWM")
+    return result
+
+
+def measure_workflow(case):
+    """
+    Measure the memory footprint of a parsed workflow (in a fresh worker process, so the memory released by other
+    cases is not reused).
+    :param case: benchmark case dictionary
+    :return: dictionary of results
+    """
+    gc.collect()
+    rss = get_memory_status("VmRSS")
+    start_time = timer()
+    workflow = parse_workflow(case['workflow'])
+    load_time = timer() - start_time
+    gc.collect()
+    result = {'tasks': len(workflow.tasks), 'files': len(workflow.files), 'load_time': load_time}
+    if rss is not None:
+        result['workflow_rss'] = get_memory_status("VmRSS") - rss
+        result['bytes_per_task'] = result['workflow_rss'] * 1024.0 / len(workflow.tasks)
+
+    # the clone is measured last, so it is not accounted in the memory footprint
+    start_time = timer()
+    workflow.clone()
+    result['clone_time'] = timer() - start_time
+    return result
+
+
+def get_cases(quick=False, large=False, repeat=3, event_driven=True, seed=0):
+    """
+    Get the benchmark cases: every workflow with and without PID controllers.
+    :param quick: whether only the shipped workflows and the smallest synthetic workflow are included
+    :param large: whether the large synthetic workflows are included
+    :param repeat: number of timed runs per case (the fastest is reported)
+    :param event_driven: whether the clock jumps to the next event instead of advancing one time step at a time
+    :param seed: seed of the random task selection and of the synthetic workflows
+    :return: list of benchmark case dictionaries
+    """
+    workflows = [dict(name=w.split("/")[-1].split(".")[0], workflow=w, scenario=scenario, scale=1)
+                 for w, scenario in WORKFLOWS]
+    synthetic = SYNTHETIC[:1] if quick else SYNTHETIC
+    if large:
+        synthetic = synthetic + SYNTHETIC_LARGE
+    for chromosomes, populations, individuals, scale in synthetic + SYNTHETIC_WIDE:
+        workflows.append(dict(name="synthetic-%s-r%s" % (_synthetic_name(chromosomes, populations, individuals), scale),
+                              chromosomes=chromosomes, populations=populations, individuals=individuals, scale=scale))
+
+    cases = []
+    for w in workflows:
+        for enable_pid in [True, False]:
+            case = dict(w, enable_pid=enable_pid, event_driven=event_driven, repeat=repeat, seed=seed)
+            case['name'] = "%s/%s" % (w['name'], "pid" if enable_pid else "no-pid")
+            cases.append(case)
+
+    for w, scenario, batch in (BATCH[:1] if quick else BATCH):
+        for enable_pid in [True, False]:
+            cases.append(dict(name="batch/%s-b%s/%s" % (w.split("/")[-1].split(".")[0], batch,
+                                                         "pid" if enable_pid else "no-pid"),
+                              workflow=w, scenario=scenario, batch=batch, enable_pid=enable_pid,
+                              event_driven=True, seed=seed))
+
+    for chromosomes, populations, individuals in (MEMORY[:1] if quick else MEMORY) + MEMORY_WIDE:
+        cases.append(dict(name="memory/synthetic-%s" % _synthetic_name(chromosomes, populations, individuals),
+                          memory=True, chromosomes=chromosomes, populations=populations, individuals=individuals,
+                          seed=seed))
+    return cases
+
+
+def _synthetic_name(chromosomes, populations, individuals):
+    # the number of individuals tasks is only part of the name of wide fan-in workflows (names of the other cases
+    # are unchanged, so older results can be compared)
+    if individuals == 1:
+        return "%sx%s" % (chromosomes, populations)
+    return "%sx%sx%s" % (chromosomes, populations, individuals)
+
+
+def run_benchmark(cases):
+    """
+    Run the benchmark cases, one worker process per case.
+    :param cases: list of benchmark case dictionaries
+    :return: benchmark results dictionary
+    """
+    results = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': {}
+    }
+    trace = None
+    directory = tempfile.mkdtemp()
+    try:
+        for case in cases:
+            if case.get('memory'):
+                # the workflow file is generated beforehand, so the generator does not use the measured memory
+                trace = trace or workflow_trace(load_workflow(SYNTHETIC_TRACE))
+                case = dict(case, workflow=os.path.join(directory, "workflow.csv"))
+                with open(case['workflow'], "w") as f:
+                    generate_parametric(trace, case['chromosomes'], case['populations'], case['individuals'], f,
+                                        seed=case['seed'])
+
+            pool = multiprocessing.Pool(1)
+            try:
+                if case.get('memory'):
+                    function = measure_workflow
+                elif case.get('batch'):
+                    function = run_batch_case
+                else:
+                    function = run_case
+                result = pool.apply(function, (case,))
+            finally:
+                pool.close()
+                pool.join()
+            if not case.get('memory'):
+                result['event_driven'] = case['event_driven']
+            results['cases'][case['name']] = result
+            log.info("%s: %s", case['name'], format_result(result))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def compare(baseline, current, threshold=0.1, min_time=0.01):
+    """
+    Compare benchmark results against a baseline.
+    :param baseline: baseline benchmark results dictionary
+    :param current: current benchmark results dictionary
+    :param threshold: relative increase of a metric that is reported as a regression
+    :param min_time: absolute increase (in seconds) below which a time is not reported as a regression, since the
+                     relative change of times of a few milliseconds is mostly noise
+    :return: list of (case name, metric, baseline value, current value, relative change, regression) tuples
+    """
+    rows = []
+    for name in sorted(current['cases']):
+        if name not in baseline['cases']:
+            continue
+        for metric in COMPARED_METRICS:
+            old = baseline['cases'][name].get(metric)
+            new = current['cases'][name].get(metric)
+            if not old or new is None:
+                continue
+            change = float(new - old) / old
+            regression = change > threshold and (metric not in TIME_METRICS or new - old >= min_time)
+            rows.append((name, metric, old, new, change, regression))
+    return rows
+
+
+def format_result(result):
+    if 'skipped' in result:
+        return "skipped (%s)" % result['skipped']
+    if 'speedup' in result:
+        return "%s replicas in %.3fs (%.1f scenarios/s), sequentially in %.3fs (%.1f scenarios/s), speedup: %.2f" \
+               % (result['replicas'], result['wall_time'], result['scenarios_per_second'], result['sequential_time'],
+                  result['sequential_scenarios_per_second'], result['speedup'])
+    if 'steps' not in result:
+        return "%s tasks, %s files, %s kB (%.0f bytes per task), loaded in %.3fs, cloned in %.3fs" \
+               % (result['tasks'], result['files'], result.get('workflow_rss'), result.get('bytes_per_task', 0),
+                  result['load_time'], result['clone_time'])
+    return "%.3fs, %s steps (%.0f steps/s), makespan: %s, peak RSS: %s kB" \
+           % (result['wall_time'], result['steps'], result['steps_per_second'], result['makespan'],
+              result['peak_rss'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the simulator over shipped and synthetic workflows.")
+    parser.add_argument("--output", help="write the results (json) to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare the results against a baseline results file")
+    parser.add_argument("--current", help="results file to compare against the baseline (instead of running)")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative increase reported as a regression (default: 0.1)")
+    parser.add_argument("--min-time", type=float, default=0.01,
+                        help="absolute increase (in seconds) below which a time is not reported as a regression "
+                             "(default: 0.01)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs per case (default: 3)")
+    parser.add_argument("--quick", action="store_true", help="only run the smallest synthetic workflow")
+    parser.add_argument("--large", action="store_true", help="also run the large synthetic workflows")
+    parser.add_argument("--tick", dest="event_driven", action="store_false",
+                        help="advance the clock one time step at a time instead of jumping to the next event")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the simulations and synthetic workflows")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.current:
+        with open(args.current) as f:
+            results = json.load(f)
+    else:
+        results = run_benchmark(get_cases(args.quick, args.large, args.repeat, args.event_driven, args.seed))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = 0
+        for name, metric, old, new, change, regression in compare(baseline, results, args.threshold, args.min_time):
+            print "%-40s %-10s %12.4f %12.4f %+7.1f%%%s" % (name, metric, old, new, change * 100,
+                                                           "  REGRESSION" if regression else "")
+            regressions += regression
+        if regressions:
+            print "%s regression(s) beyond %.0f%% (and %ss for times)" % (regressions, args.threshold * 100,
+                                                                        args.min_time)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import struct
+
+from array import array
+from file import File, FileLink
+from task import FileSet, Task, TaskSet
+from workflow import Element, Workflow
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"PIDWF\0"
+VERSION = 1
+COMPILED_EXTENSION = ".wfc"
+
+# magic, version, source size, source mtime, number of strings, tasks, files, uses, depends
+HEADER = struct.Struct("<6sHqdIIIII")
+
+LINKS = [FileLink.INPUT, FileLink.INTERMEDIATE, FileLink.OUTPUT]
+
+
+class CompiledWorkflow:
+    """
+    Workflow structure stored as flat typed arrays: an interned string table, and integer ids for tasks and files.
+    Tasks, files, uses, and dependencies keep the order in which they appear in the source csv file.
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.task_names = array("i")
+        self.task_durations = array("d")
+        self.task_peak_memory = array("l")
+        self.file_names = array("i")
+        self.file_sizes = array("d")
+        self.use_tasks = array("i")
+        self.use_files = array("i")
+        self.use_links = array("b")
+        self.depend_children = array("i")
+        self.depend_parents = array("i")
+        self.source_size = 0
+        self.source_mtime = 0.0
+
+    def to_workflow(self):
+        """
+        Build a workflow object from the compiled structure. Tasks, files, and their relations are created directly
+        from the id arrays (in the same order as when the csv file is parsed), without name lookups.
+        :return: workflow object
+        """
+        wf = Workflow()
+        strings = self.strings
+
+        files = [File(strings[name], size, i) for i, (name, size) in enumerate(zip(self.file_names, self.file_sizes))]
+        wf.file_list = files
+        wf.files = dict((f.name, f) for f in files)
+        wf.file_references.set_counts([0] * len(files), [0] * len(files))
+
+        tasks = [Task(strings[name], duration, peak_memory) for name, duration, peak_memory in
+                 zip(self.task_names, self.task_durations, self.task_peak_memory)]
+        wf.task_list = tasks
+        wf.tasks = dict((task.id, task) for task in tasks)
+
+        # files used by each task, by link (input, intermediate, and output, as in LINKS)
+        uses = [([], [], []) for _ in tasks]
+        for task_id, file_id, link in zip(self.use_tasks, self.use_files, self.use_links):
+            uses[task_id][link].append(files[file_id])
+
+        # parents and children of each task (repeated dependencies are only counted once)
+        parents = [[] for _ in tasks]
+        children = [[] for _ in tasks]
+        dependencies = zip(self.depend_children, self.depend_parents)
+        if len(set(dependencies)) != len(dependencies):
+            dependencies = _first_unique(dependencies)
+        for child_id, parent_id in dependencies:
+            parents[child_id].append(tasks[parent_id])
+            children[parent_id].append(tasks[child_id])
+
+        for task, (input_data, intermediate_data, output_data), task_parents, task_children in \
+                zip(tasks, uses, parents, children):
+            task.input_data = FileSet(_last_unique(input_data))
+            task.intermediate_data = FileSet(_last_unique(intermediate_data))
+            task.output_data = FileSet(_last_unique(output_data))
+            task.parent_tasks = TaskSet(task_parents)
+            wf.children[task.id] = task_children
+
+        wf.reset()
+        return wf
+
+    def digest(self):
+        """
+        Get a hash of the workflow structure (the source file size and modification time are not included, thus
+        identical workflows have the same digest wherever they are stored).
+        :return: hexadecimal digest
+        """
+        h = hashlib.sha1(struct.pack("<H", VERSION))
+        for values in self._arrays(array("I", [len(self.strings)])):
+            h.update(struct.pack("<Q", len(values)))
+            h.update(values.tostring())
+        for s in self.strings:
+            h.update(struct.pack("<I", len(s)))
+            h.update(s)
+        return h.hexdigest()
+
+    def save(self, path):
+        """
+        Write the compiled workflow (written to a temporary file first, then renamed). The temporary file is removed
+        if the compiled workflow cannot be written.
+        :param path: compiled workflow file path
+        """
+        blob = b"".join(self.strings)
+        offsets = array("I", [0])
+        for s in self.strings:
+            offsets.append(offsets[-1] + len(s))
+
+        tmp_path = "%s.%s.tmp" % (path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, self.source_size, self.source_mtime, len(self.strings),
+                                    len(self.task_names), len(self.file_names), len(self.use_tasks),
+                                    len(self.depend_children)))
+                for values in self._arrays(offsets):
+                    values.tofile(f)
+                f.write(blob)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def load(path):
+        """
+        Read a compiled workflow through a memory map (arrays are filled straight from the mapped file).
+        :param path: compiled workflow file path
+        :return: compiled workflow object
+        """
+        cw = CompiledWorkflow()
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                magic, version, cw.source_size, cw.source_mtime, num_strings, num_tasks, num_files, num_uses, \
+                    num_depends = HEADER.unpack_from(data, 0)
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError("%s is not a compiled workflow (version %s)" % (path, VERSION))
+
+                offsets = array("I")
+                lengths = [num_strings + 1, num_tasks, num_tasks, num_tasks, num_files, num_files, num_uses,
+                           num_uses, num_uses, num_depends, num_depends]
+                position = HEADER.size
+                for values, length in zip(cw._arrays(offsets), lengths):
+                    end = position + values.itemsize * length
+                    values.fromstring(buffer(data, position, end - position))
+                    position = end
+
+                blob = data[position:position + offsets[-1]]
+                cw.strings = [blob[offsets[i]:offsets[i + 1]] for i in range(0, num_strings)]
+            finally:
+                data.close()
+
+        return cw
+
+    def _arrays(self, offsets):
+        return [offsets, self.task_names, self.task_durations, self.task_peak_memory, self.file_names,
+                self.file_sizes, self.use_tasks, self.use_files, self.use_links, self.depend_children,
+                self.depend_parents]
+
+
+def _first_unique(values):
+    """
+    :return: list of values without repetitions, in order of their first occurrence
+    """
+    seen = set()
+    unique = []
+    for value in values:
+        if value not in seen:
+            seen.add(value)
+            unique.append(value)
+    return unique
+
+
+def _last_unique(files):
+    """
+    :return: list of files without repetitions (by name), in order of their last occurrence (the order in which a
+             task data mapping keeps repeated uses of a file)
+    """
+    if len(files) < 2 or len(set(f.name for f in files)) == len(files):
+        return files
+    seen = set()
+    unique = []
+    for f in reversed(files):
+        if f.name not in seen:
+            seen.add(f.name)
+            unique.append(f)
+    unique.reverse()
+    return unique
+
+
+def compile_workflow(csv_path, compiled_path=None):
+    """
+    Compile a workflow csv file into its binary form.
+    :param csv_path: workflow file path (csv)
+    :param compiled_path: compiled workflow file path (default: csv path + '.wfc')
+    :return: compiled workflow object
+    """
+    cw = read_workflow_csv(csv_path)
+    cw.save(compiled_path or csv_path + COMPILED_EXTENSION)
+    return cw
+
+
+def read_workflow_csv(csv_path):
+    """
+    Read a workflow csv file into its compiled form (without writing it).
+    :param csv_path: workflow file path (csv)
+    :return: compiled workflow object
+    """
+    cw = CompiledWorkflow()
+    st = os.stat(csv_path)
+    cw.source_size = st.st_size
+    cw.source_mtime = st.st_mtime
+
+    string_ids = {}
+    task_ids = {}
+    file_ids = {}
+
+    def intern_string(value):
+        if value not in string_ids:
+            string_ids[value] = len(cw.strings)
+            cw.strings.append(value)
+        return string_ids[value]
+
+    with open(csv_path) as wf_file:
+        for line in wf_file:
+            l = line.strip()
+            if len(l) > 0 and not l.startswith("#"):
+                v = l.lower().split(",")
+                element_type = str(v[0])
+
+                if element_type == Element.TASK:
+                    task_ids[v[1]] = len(cw.task_names)
+                    cw.task_names.append(intern_string(v[1]))
+                    cw.task_durations.append(float(v[2]))
+                    cw.task_peak_memory.append(int(v[3]))
+
+                elif element_type == Element.FILE:
+                    if v[1] not in file_ids:
+                        file_ids[v[1]] = len(cw.file_names)
+                        cw.file_names.append(intern_string(v[1]))
+                        cw.file_sizes.append(float(v[2]))
+
+                elif element_type == Element.USES:
+                    cw.use_tasks.append(task_ids[v[1]])
+                    cw.use_files.append(file_ids[v[2]])
+                    cw.use_links.append(LINKS.index(v[3]))
+
+                elif element_type == Element.DEPENDS:
+                    cw.depend_children.append(task_ids[v[1]])
+                    cw.depend_parents.append(task_ids[v[2]])
+
+    return cw
+
+
+def load_compiled_workflow(csv_path):
+    """
+    Load the compiled form of a workflow csv file, (re)compiling it if it is missing or if the csv file has
+    changed since it was compiled. If the compiled workflow cannot be written (e.g., read-only directory), the
+    workflow is compiled in memory only.
+    :param csv_path: workflow file path (csv)
+    :return: compiled workflow object
+    """
+    compiled_path = csv_path + COMPILED_EXTENSION
+    if os.path.exists(compiled_path):
+        try:
+            cw = CompiledWorkflow.load(compiled_path)
+            st = os.stat(csv_path)
+            if cw.source_size == st.st_size and cw.source_mtime == st.st_mtime:
+                return cw
+        except (ValueError, struct.error, EnvironmentError) as e:
+            log.warning("Unable to read %s: %s", compiled_path, e)
+
+    log.info("Compiling %s into %s", csv_path, compiled_path)
+    cw = read_workflow_csv(csv_path)
+    try:
+        cw.save(compiled_path)
+    except (IOError, OSError) as e:
+        log.warning("Unable to write %s (the compiled workflow is only kept in memory): %s", compiled_path, e)
+    return cw
+
+
+def load_workflow(path):
+    """
+    Load a workflow from a csv file (through its compiled form) or from a compiled workflow file.
+    :param path: workflow file path
+    :return: workflow object
+    """
+    if path.endswith(COMPILED_EXTENSION):
+        return CompiledWorkflow.load(path).to_workflow()
+    return load_compiled_workflow(path).to_workflow()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a workflow csv file into its binary form.")
+    parser.add_argument("workflow", help="workflow file (csv)")
+    parser.add_argument("-o", "--output", help="compiled workflow file (default: <workflow>%s)" % COMPILED_EXTENSION)
+    args = parser.parse_args()
+
+    cw = compile_workflow(args.workflow, args.output)
+    print "Compiled %s tasks, %s files, %s uses, and %s dependencies into %s" \
+          % (len(cw.task_names), len(cw.file_names), len(cw.use_tasks), len(cw.depend_children),
+             args.output or args.workflow + COMPILED_EXTENSION)
+
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,11 @@ import logging
 
 from abc import ABCMeta, abstractmethod
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 log = logging.getLogger(__name__)
 
 
@@ -51,3 +56,155 @@ class Controller:
         self.previous_error = error
 
         return controller_input
+
+
+class ControllerBank:
+    """
+    Set of PID controllers updated in a single vectorized call. Setpoints, gains, deadband tolerances, and
+    cumulative and previous errors are kept as NumPy arrays of any shape (e.g., one controller per resource, or one
+    row of controllers per simulation replica). process() has the same semantics as Controller.process(), including
+    the reset of the cumulative error within the deadband.
+    """
+
+    def __init__(self, setpoints, kp=1, ki=1, kd=1, error=0.05):
+        """
+
+        :param setpoints: array of controller setpoints
+        :param kp: proportional constant(s), scalar or array broadcastable to the setpoints shape
+        :param ki: integral constant(s)
+        :param kd: derivative constant(s)
+        :param error: deadband tolerance(s), as a fraction of the setpoint
+        """
+        if numpy is None:
+            raise ImportError("ControllerBank requires numpy")
+        self.setpoint = numpy.array(setpoints, dtype=float)
+        shape = self.setpoint.shape
+        self.kp = numpy.array(numpy.broadcast_to(numpy.asarray(kp, dtype=float), shape))
+        self.ki = numpy.array(numpy.broadcast_to(numpy.asarray(ki, dtype=float), shape))
+        self.kd = numpy.array(numpy.broadcast_to(numpy.asarray(kd, dtype=float), shape))
+        self.error = numpy.array(numpy.broadcast_to(numpy.asarray(error, dtype=float), shape))
+        self.cumulative_error = numpy.zeros(shape)
+        self.previous_error = numpy.zeros(shape)
+
+    @staticmethod
+    def from_controllers(controllers):
+        """
+        Create a bank from controller objects, including their accumulated errors.
+        :param controllers: list of controller objects
+        :return: controller bank object
+        """
+        bank = ControllerBank([c.setpoint for c in controllers], kp=[c.kp for c in controllers],
+                              ki=[c.ki for c in controllers], kd=[c.kd for c in controllers],
+                              error=[c.error for c in controllers])
+        bank.cumulative_error[:] = [c.cumulative_error for c in controllers]
+        bank.previous_error[:] = [c.previous_error for c in controllers]
+        return bank
+
+    def process(self, output_values, active=None, upper=None, rows=None):
+        """
+        Feed every controller with its current output value.
+        :param output_values: array of output values (same shape as the setpoints, or one row per index of rows)
+        :param active: boolean array of the controllers to be processed (default: all); the others keep their
+                       errors and their input is 0
+        :param upper: if set, controller inputs are capped to these values (scalar or array)
+        :param rows: if set, only the controllers at these indices of the first axis are processed (e.g., the
+                     replicas of a batch that reach a scheduling step), and one row of inputs is returned per index
+                     (active is ignored)
+        :return: array of controller inputs
+        """
+        if rows is not None:
+            setpoint, tolerance = self.setpoint[rows], self.error[rows]
+            kp, ki, kd = self.kp[rows], self.ki[rows], self.kd[rows]
+            previous_cumulative_error, previous_error = self.cumulative_error[rows], self.previous_error[rows]
+        else:
+            setpoint, tolerance = self.setpoint, self.error
+            kp, ki, kd = self.kp, self.ki, self.kd
+            previous_cumulative_error, previous_error = self.cumulative_error, self.previous_error
+
+        error = setpoint - numpy.asarray(output_values, dtype=float)
+        deadband = numpy.abs(error) < 0 + (setpoint * tolerance)
+
+        # PID (same operation order as Controller.process)
+        controller_input = kp * error + ki * previous_cumulative_error + kd * previous_error
+        controller_input[deadband] = 0.0
+
+        # update errors
+        cumulative_error = numpy.where(deadband, 0.0, previous_cumulative_error + error)
+        if rows is not None:
+            self.cumulative_error[rows] = cumulative_error
+            self.previous_error[rows] = error
+        elif active is None:
+            self.cumulative_error = cumulative_error
+            self.previous_error = error
+        else:
+            active = numpy.asarray(active, dtype=bool)
+            self.cumulative_error = numpy.where(active, cumulative_error, self.cumulative_error)
+            self.previous_error = numpy.where(active, error, self.previous_error)
+            controller_input[~active] = 0.0
+
+        if upper is not None:
+            controller_input = numpy.minimum(controller_input, upper)
+        return controller_input
+
+    def get_controller(self, index):
+        """
+        Get a view of one controller of the bank, which can be used in place of a controller object.
+        :param index: index of the controller in the bank arrays
+        :return: banked controller object
+        """
+        return BankedController(self, index)
+
+    def __len__(self):
+        return self.setpoint.size
+
+
+class BankedController(object):
+    """
+    View of one controller of a ControllerBank, with the attributes and the process() method of a Controller.
+    """
+    __slots__ = ("bank", "index")
+
+    def __init__(self, bank, index):
+        self.bank = bank
+        self.index = index
+
+    def _get(name):
+        def getter(self):
+            return getattr(self.bank, name)[self.index].item()
+
+        def setter(self, value):
+            getattr(self.bank, name)[self.index] = value
+
+        return property(getter, setter)
+
+    setpoint = _get("setpoint")
+    kp = _get("kp")
+    ki = _get("ki")
+    kd = _get("kd")
+    error = _get("error")
+    cumulative_error = _get("cumulative_error")
+    previous_error = _get("previous_error")
+    del _get
+
+    def process(self, output_value):
+        """
+        Feed this controller only (scalar arithmetic, same semantics as Controller.process()).
+        :param output_value: current output value
+        :return: controller input
+        """
+        bank = self.bank
+        i = self.index
+        error = bank.setpoint[i].item() - float(output_value)
+
+        if abs(error) < 0 + (bank.setpoint[i].item() * bank.error[i].item()):
+            bank.previous_error[i] = error
+            bank.cumulative_error[i] = 0
+            return 0
+
+        controller_input = bank.kp[i].item() * error + bank.ki[i].item() * bank.cumulative_error[i].item() \
+            + bank.kd[i].item() * bank.previous_error[i].item()
+
+        bank.cumulative_error[i] += error
+        bank.previous_error[i] = error
+
+        return controller_input
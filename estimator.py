@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import logging
+
+from collections import OrderedDict
+from task import TaskType
+
+log = logging.getLogger(__name__)
+
+
+class P2Quantile(object):
+    """
+    Streaming estimation of a quantile with the P-square algorithm (Jain and Chlamtac, 1985): five markers (minimum,
+    maximum, the quantile, and two intermediate quantiles) are adjusted with a piecewise-parabolic interpolation at
+    every observation, thus updates cost O(1) time and memory. Up to five observations, the exact quantile is used.
+    """
+    __slots__ = ("p", "count", "heights", "positions", "desired", "increments")
+
+    def __init__(self, p):
+        """
+
+        :param p: quantile (between 0 and 1)
+        """
+        if not 0.0 <= p <= 1.0:
+            raise ValueError("Invalid quantile: %s (should be between 0 and 1)" % p)
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1.0, 1.0 + 2 * p, 1.0 + 4 * p, 3.0 + 2 * p, 5.0]
+        self.increments = [0.0, p / 2.0, p, (1.0 + p) / 2.0, 1.0]
+
+    def add(self, x):
+        """
+        Add an observation.
+        :param x: observed value
+        """
+        x = float(x)
+        self.count += 1
+        q = self.heights
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+
+        # cell of the observation, extreme markers are updated if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        desired = self.desired
+        for i in range(0, 5):
+            desired[i] += self.increments[i]
+
+        # adjust the heights of the middle markers that are off their desired positions
+        for i in range(1, 4):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + float(d) / (n[i + 1] - n[i - 1]) \
+                    * ((n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                       + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    # the parabolic prediction is not monotonic, thus the linear one is used
+                    height = q[i] + float(d) * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def value(self):
+        """
+        :return: estimated quantile, or None if there are no observations
+        """
+        if self.count == 0:
+            return None
+        if self.count > 5:
+            return self.heights[2]
+
+        # exact quantile (linear interpolation between the closest ranks)
+        q = self.heights
+        rank = self.p * (len(q) - 1)
+        i = int(rank)
+        if i + 1 >= len(q):
+            return q[-1]
+        return q[i] + (rank - i) * (q[i + 1] - q[i])
+
+    def get_state(self):
+        return self.count, tuple(self.heights), tuple(self.positions), tuple(self.desired)
+
+    def set_state(self, state):
+        count, heights, positions, desired = state
+        self.count = count
+        self.heights = list(heights)
+        self.positions = list(positions)
+        self.desired = list(desired)
+
+
+class ResourceEstimator:
+    """
+    Storage and memory estimations of the tasks of each transformation, used by the scheduler to admit tasks within
+    the controller budgets. Estimations are kept in dictionaries (by transformation) that are updated in place, thus
+    policies holding them always see the current estimations. The storage of a task is the total size of its input,
+    intermediate, and output data, and its memory is its peak memory.
+    """
+
+    def __init__(self, storage_estimation, memory_estimation):
+        """
+
+        :param storage_estimation: dictionary of (initial) storage estimation by transformation
+        :param memory_estimation: dictionary of (initial) memory estimation by transformation
+        """
+        self.storage_table = dict(storage_estimation)
+        self.memory_table = dict(memory_estimation)
+        self.storage = dict(storage_estimation)
+        self.memory = dict(memory_estimation)
+
+    def update(self, task):
+        """
+        Account for a task that has finished.
+        :param task: finished task object
+        """
+        pass
+
+    def reset(self):
+        """
+        Discard the observations, estimations go back to the initial tables.
+        """
+        self.storage.clear()
+        self.storage.update(self.storage_table)
+        self.memory.clear()
+        self.memory.update(self.memory_table)
+
+    def get_state(self):
+        """
+        :return: state of the estimator (None if the estimations never change)
+        """
+        return None
+
+    def set_state(self, state):
+        """
+        Restore a state captured by get_state().
+        :param state: estimator state (None resets the estimator)
+        """
+        self.reset()
+
+    def clone(self):
+        """
+        Create an estimator with the same configuration, without observations.
+        :return: estimator object
+        """
+        return self.__class__(self.storage_table, self.memory_table)
+
+
+class StaticEstimator(ResourceEstimator):
+    """
+    Estimations are the fixed values of the tables (the default estimator).
+    """
+
+
+class OnlineEstimator(ResourceEstimator):
+    """
+    Estimations are learned from the tasks that finish: per transformation, a running mean of the storage and
+    memory of the tasks, or a quantile of them estimated with a P-square sketch (higher quantiles admit fewer tasks
+    per controller budget, and lead to fewer overflows). The table value is the first observation of every
+    transformation, thus it is the estimation until tasks of the transformation finish, and its weight fades as
+    they do. Updates cost O(1).
+    """
+
+    def __init__(self, storage_estimation, memory_estimation, quantile=None):
+        """
+
+        :param storage_estimation: dictionary of initial storage estimation by transformation
+        :param memory_estimation: dictionary of initial memory estimation by transformation
+        :param quantile: estimated quantile (between 0 and 1), or None for the mean
+        """
+        ResourceEstimator.__init__(self, storage_estimation, memory_estimation)
+        if quantile is not None and not 0.0 <= quantile <= 1.0:
+            raise ValueError("Invalid quantile: %s (should be between 0 and 1)" % quantile)
+        self.quantile = quantile
+        # statistics of the storage and memory of each transformation
+        self.storage_stats = {}
+        self.memory_stats = {}
+        self.reset()
+
+    def update(self, task):
+        if task.type == TaskType.CLEANUP:
+            return
+        transformation = task.transformation
+        if transformation not in self.storage_stats:
+            self._add_transformation(transformation)
+
+        storage = 0.0
+        for data in (task.input_data, task.intermediate_data, task.output_data):
+            for f in data.values():
+                storage += f.size
+        self.storage[transformation] = self._add(self.storage_stats[transformation], storage)
+        self.memory[transformation] = self._add(self.memory_stats[transformation], task.peak_memory)
+
+    def reset(self):
+        ResourceEstimator.reset(self)
+        self.storage_stats = {}
+        self.memory_stats = {}
+        for transformation in set(self.storage_table) | set(self.memory_table):
+            self._add_transformation(transformation)
+
+    def get_state(self):
+        return tuple((t, self._get_stats_state(self.storage_stats[t]), self._get_stats_state(self.memory_stats[t]))
+                     for t in sorted(self.storage_stats))
+
+    def set_state(self, state):
+        self.reset()
+        if state is None:
+            return
+        for transformation, storage_state, memory_state in state:
+            if transformation not in self.storage_stats:
+                self._add_transformation(transformation)
+            self.storage[transformation] = self._set_stats_state(self.storage_stats[transformation], storage_state)
+            self.memory[transformation] = self._set_stats_state(self.memory_stats[transformation], memory_state)
+
+    def clone(self):
+        return OnlineEstimator(self.storage_table, self.memory_table, quantile=self.quantile)
+
+    def _add_transformation(self, transformation):
+        """
+        Create the statistics of a transformation, seeded with the table values (if any).
+        :param transformation: transformation name
+        """
+        self.storage_stats[transformation] = self._create_stats()
+        self.memory_stats[transformation] = self._create_stats()
+        if transformation in self.storage_table:
+            self._add(self.storage_stats[transformation], self.storage_table[transformation])
+        if transformation in self.memory_table:
+            self._add(self.memory_stats[transformation], self.memory_table[transformation])
+
+    def _create_stats(self):
+        # running mean: [count, mean]
+        return P2Quantile(self.quantile) if self.quantile is not None else [0, 0.0]
+
+    def _add(self, stats, value):
+        """
+        Add an observation to the statistics of a transformation.
+        :return: current estimation
+        """
+        if self.quantile is not None:
+            stats.add(value)
+            return stats.value()
+        stats[0] += 1
+        stats[1] += (value - stats[1]) / stats[0]
+        return stats[1]
+
+    def _get_stats_state(self, stats):
+        return stats.get_state() if self.quantile is not None else tuple(stats)
+
+    def _set_stats_state(self, stats, state):
+        if self.quantile is not None:
+            stats.set_state(state)
+            return stats.value()
+        stats[:] = state
+        return stats[1]
+
+
+# resource estimators by name
+ESTIMATORS = OrderedDict([
+    ("static", StaticEstimator),
+    ("online", OnlineEstimator)
+])
+
+
+def create_estimator(name, storage_estimation, memory_estimation, quantile=None):
+    """
+    Create a resource estimator by name.
+    :param name: estimator name (static or online)
+    :param storage_estimation: dictionary of (initial) storage estimation by transformation
+    :param memory_estimation: dictionary of (initial) memory estimation by transformation
+    :param quantile: estimated quantile of the online estimator (None for the mean)
+    :return: estimator object
+    """
+    if name not in ESTIMATORS:
+        raise ValueError("Unknown estimator: %s (available: %s)" % (name, ", ".join(ESTIMATORS)))
+    if name == "online":
+        return OnlineEstimator(storage_estimation, memory_estimation, quantile=quantile)
+    if quantile is not None:
+        raise ValueError("The %s estimator does not take a quantile" % name)
+    return ESTIMATORS[name](storage_estimation, memory_estimation)
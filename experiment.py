@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import argparse
+import itertools
+import logging
+import math
+import multiprocessing
+
+from batch import BatchSimulator
+from compiled_workflow import COMPILED_EXTENSION, CompiledWorkflow, load_compiled_workflow
+from pid_scheduler import PIDConfiguration, SimulationStalled
+from estimator import ESTIMATORS
+from policy import POLICIES, create_policy
+from preemption import PREEMPTIONS, create_preemption
+from result_cache import DEFAULT_MAX_SIZE, ResultCache, describe_platform
+from scenario import Scenario, default_scenario
+
+log = logging.getLogger(__name__)
+
+# metrics aggregated for each configuration
+METRICS = ["makespan", "preempted_tasks", "peak_storage", "peak_memory"]
+
+# two-sided 95% critical values of the Student's t distribution (indexed by degrees of freedom)
+T_CRITICAL_95 = [None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160,
+                 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052,
+                 2.048, 2.045, 2.042]
+
+# scheduler (workflow and platform) built once per worker process, and reset between simulations
+_scheduler = None
+_scenario = None
+
+# batch simulator of the worker process (built on its first batch of replicas)
+_batch_simulator = None
+
+# result cache of the worker process (if any), and hash of the workflow structure used in the cache keys
+_cache = None
+_workflow_digest = None
+
+
+def _init_worker(workflow_path, cache_directory=None, cache_size=DEFAULT_MAX_SIZE, scenario=None):
+    """
+    Parse the workflow and build the platform once per worker process.
+    :param workflow_path: workflow file path
+    :param cache_directory: result cache directory (optional)
+    :param cache_size: bound of the result cache size (bytes)
+    :param scenario: scenario object (default: the default scenario)
+    """
+    global _scheduler, _scenario, _batch_simulator, _cache, _workflow_digest
+    logging.getLogger().setLevel(logging.WARNING)
+    if workflow_path.endswith(COMPILED_EXTENSION):
+        cw = CompiledWorkflow.load(workflow_path)
+    else:
+        cw = load_compiled_workflow(workflow_path)
+    _scenario = scenario or default_scenario()
+    _scheduler = _scenario.create_scheduler(cw.to_workflow())
+    _batch_simulator = None
+
+    _cache = None
+    if cache_directory:
+        _cache = ResultCache(cache_directory, max_size=cache_size)
+        _workflow_digest = cw.digest()
+
+
+def simulate(parameters, seed, enable_pid=True, time_limit=None, policy="random", preemption="latest-started",
+             estimator="static", quantile=None):
+    """
+    Simulate the workflow parsed by the current worker process.
+    :param parameters: dictionary of PID configuration parameters (missing parameters take the value of the
+                       scenario configuration)
+    :param seed: seed of the random task selection
+    :param enable_pid: whether the PID controllers are enabled
+    :param time_limit: abort the simulation once the clock would go beyond this time
+    :param policy: scheduling policy name
+    :param preemption: preemption criterion name
+    :param estimator: resource estimator name
+    :param quantile: estimated quantile of the online estimator (None for the mean)
+    :return: simulation summary, or None if the simulation has been aborted or has stalled
+    """
+    scheduler = _scheduler
+    config = _create_config(parameters)
+
+    key = None
+    if _cache is not None:
+        key = _cache_key(config, seed, enable_pid, policy, preemption, estimator, quantile)
+        cached = _cache.get(key)
+        if cached is not None:
+            summary = cached[0]
+            # a simulation completes within a time limit iff its makespan does not exceed it
+            if summary is None or (time_limit is not None and summary['makespan'] > time_limit):
+                return None
+            return summary
+
+    scheduler.reset(config=config, seed=seed, policy=create_policy(policy), preemption=create_preemption(preemption),
+                    estimator=_scenario.create_estimator(estimator, quantile))
+    try:
+        if scheduler.start(enable_pid=enable_pid, event_driven=True, time_limit=time_limit) is None:
+            # aborted simulations are not cached
+            return None
+    except SimulationStalled as e:
+        log.warning("%s (seed: %s, configuration: %s)", e, seed, parameters)
+        if key:
+            _cache.put(key, None)
+        return None
+
+    summary = scheduler.get_summary()
+    if key:
+        _cache.put(key, summary)
+    return summary
+
+
+def simulate_batch(parameters, seeds, enable_pid=True):
+    """
+    Simulate a batch of replicas of the workflow parsed by the current worker process in lockstep (random policy,
+    latest-started preemption, and static estimator only).
+    :param parameters: dictionary of PID configuration parameters (missing parameters take the value of the
+                       scenario configuration)
+    :param seeds: list of seeds of the random task selection (one replica per seed)
+    :param enable_pid: whether the PID controllers are enabled
+    :return: list of simulation summaries (one per seed), with None for the simulations that have stalled
+    """
+    global _batch_simulator
+    config = _create_config(parameters)
+
+    summaries = [None] * len(seeds)
+    keys = [None] * len(seeds)
+    missing = []
+    for i, seed in enumerate(seeds):
+        if _cache is not None:
+            keys[i] = _cache_key(config, seed, enable_pid, "random", "latest-started", "static", None)
+            cached = _cache.get(keys[i])
+            if cached is not None:
+                summaries[i] = cached[0]
+                continue
+        missing.append(i)
+
+    if missing:
+        if _batch_simulator is None:
+            _batch_simulator = BatchSimulator(_scheduler.workflow, _scenario)
+        results = _batch_simulator.run([seeds[i] for i in missing], [config] * len(missing), enable_pid=enable_pid)
+        for i, summary in zip(missing, results):
+            if summary is None:
+                log.warning("Simulation stalled (seed: %s, configuration: %s)", seeds[i], parameters)
+            summaries[i] = summary
+            if keys[i]:
+                _cache.put(keys[i], summary)
+    return summaries
+
+
+def _create_config(parameters):
+    """
+    Create the PID configuration of a simulation.
+    :param parameters: dictionary of PID configuration parameters (missing parameters take the value of the
+                       scenario configuration)
+    :return: PID configuration object
+    """
+    values = _scenario.config.to_dict()
+    values.update(parameters)
+    return PIDConfiguration.from_dict(values)
+
+
+def _cache_key(config, seed, enable_pid, policy, preemption, estimator, quantile):
+    """
+    Compute the result cache key of a simulation run by the current worker process.
+    :param config: PID configuration object
+    :param seed: seed of the random task selection
+    :param enable_pid: whether the PID controllers are enabled
+    :param policy: scheduling policy name
+    :param preemption: preemption criterion name
+    :param estimator: resource estimator name
+    :param quantile: estimated quantile of the online estimator (None for the mean)
+    :return: cache key
+    """
+    scheduler = _scheduler
+    return ResultCache.key(_workflow_digest, dict((p, float(v)) for p, v in config.to_dict().items()),
+                           scheduler.estimator.storage_table, scheduler.estimator.memory_table,
+                           describe_platform(scheduler.shared_storage, scheduler.compute_resources), seed,
+                           enable_pid=enable_pid, policy=policy, preemption=preemption, estimator=estimator,
+                           quantile=quantile)
+
+
+def run_simulation(job):
+    """
+    Run a single simulation in a worker process.
+    :param job: tuple of (configuration index, configuration parameters, seed, enable_pid, policy name,
+                preemption criterion name, estimator name, quantile)
+    :return: tuple of (configuration index, seed, simulation summary)
+    """
+    index, parameters, seed, enable_pid, policy, preemption, estimator, quantile = job
+    return index, seed, simulate(parameters, seed, enable_pid, policy=policy, preemption=preemption,
+                                 estimator=estimator, quantile=quantile)
+
+
+def run_simulation_batch(job):
+    """
+    Run a batch of simulations in a worker process.
+    :param job: tuple of (configuration index, configuration parameters, list of seeds, enable_pid)
+    :return: list of tuples of (configuration index, seed, simulation summary)
+    """
+    index, parameters, seeds, enable_pid = job
+    return [(index, seed, summary) for seed, summary in zip(seeds, simulate_batch(parameters, seeds, enable_pid))]
+
+
+def generate_configurations(grid):
+    """
+    Generate all combinations of the parameter values in a grid.
+    :param grid: dictionary of parameter name to list of values
+    :return: list of dictionaries of parameter values
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[n] for n in names])]
+
+
+def mean_confidence_interval(values):
+    """
+    Compute the mean and the half-width of the 95% confidence interval of the mean.
+    :param values: list of values
+    :return: mean and confidence interval half-width
+    """
+    n = len(values)
+    mean = float(sum(values)) / n
+    if n < 2:
+        return mean, 0.0
+
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+    t = T_CRITICAL_95[n - 1] if n - 1 < len(T_CRITICAL_95) else 1.96
+    return mean, t * math.sqrt(variance / n)
+
+
+def run_experiment(workflow_path, configurations, seeds, enable_pid=True, processes=None, policy="random",
+                   preemption="latest-started", cache_directory=None, cache_size=DEFAULT_MAX_SIZE, scenario=None,
+                   estimator="static", quantile=None, batch=None):
+    """
+    Run every configuration with every seed across a pool of worker processes.
+    :param workflow_path: workflow file path
+    :param configurations: list of dictionaries of PID configuration parameters
+    :param seeds: list of seeds (one replica per seed)
+    :param enable_pid: whether the PID controllers are enabled
+    :param processes: number of worker processes (default: number of CPUs)
+    :param policy: scheduling policy name
+    :param preemption: preemption criterion name
+    :param cache_directory: result cache directory (optional): cached simulations are not run again
+    :param cache_size: bound of the result cache size (bytes)
+    :param scenario: scenario object (default: the default scenario)
+    :param estimator: resource estimator name
+    :param quantile: estimated quantile of the online estimator (None for the mean)
+    :param batch: number of replicas of a configuration simulated in lockstep by a worker process (random policy,
+                  latest-started preemption, and static estimator only; default: one simulation at a time)
+    :return: list of summaries (one per configuration) and list of per-run results
+    """
+    pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(workflow_path, cache_directory, cache_size, scenario))
+    try:
+        if batch:
+            if (policy, preemption, estimator) != ("random", "latest-started", "static"):
+                raise ValueError("Batches of replicas require the random policy, the latest-started preemption, and "
+                                 "the static estimator")
+            jobs = [(i, c, seeds[s:s + batch], enable_pid)
+                    for i, c in enumerate(configurations) for s in range(0, len(seeds), batch)]
+            results = [r for rs in pool.map(run_simulation_batch, jobs, chunksize=1) for r in rs]
+        else:
+            jobs = [(i, c, s, enable_pid, policy, preemption, estimator, quantile)
+                    for i, c in enumerate(configurations) for s in seeds]
+            results = pool.map(run_simulation, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    summaries = []
+    for i, parameters in enumerate(configurations):
+        runs = [r for index, seed, r in results if index == i and r]
+        summary = dict(parameters)
+        summary['replicas'] = len(runs)
+        summary['stalled'] = len(seeds) - len(runs)
+        for metric in METRICS:
+            if runs:
+                summary[metric], summary[metric + "_ci"] = mean_confidence_interval([r[metric] for r in runs])
+            else:
+                summary[metric], summary[metric + "_ci"] = float("nan"), float("nan")
+        summaries.append(summary)
+
+    return summaries, results
+
+
+def write_summary(summaries, parameters, output):
+    """
+    Write the summary table in csv format.
+    :param summaries: list of configuration summaries
+    :param parameters: list of parameter names (table columns)
+    :param output: file object
+    """
+    columns = parameters + ["replicas", "stalled"] + [c for m in METRICS for c in (m, m + "_ci")]
+    output.write(",".join(columns) + "\n")
+    for summary in summaries:
+        output.write(",".join("%s" % summary[c] for c in columns) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a grid of PID configurations over several seeded replicas.")
+    parser.add_argument("workflow", help="workflow file (csv)")
+    parser.add_argument("--scenario", help="scenario file (json) describing the platform, controllers, and "
+                                           "estimations (its controllers give the default parameter values)")
+    for p in PIDConfiguration.PARAMETERS:
+        parser.add_argument("--" + p.replace("_", "-"), dest=p, type=float, nargs="+", metavar="VALUE",
+                            help="values of %s (default: %s)" % (p, getattr(PIDConfiguration(), p)))
+    parser.add_argument("--replicas", type=int, default=10, help="number of replicas per configuration")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first replica (seeds are consecutive)")
+    parser.add_argument("--no-pid", dest="use_pid", action="store_false", help="disable the PID controllers")
+    parser.add_argument("--policy", choices=list(POLICIES), default="random",
+                        help="order in which queued tasks are examined (default: random)")
+    parser.add_argument("--preemption", choices=list(PREEMPTIONS), default="latest-started",
+                        help="order in which running tasks are preempted on storage overflow (default: latest-started)")
+    parser.add_argument("--estimator", choices=list(ESTIMATORS), default="static",
+                        help="storage and memory estimations used to admit tasks: static tables, or online "
+                             "statistics learned from finished tasks (default: static)")
+    parser.add_argument("--quantile", type=float,
+                        help="quantile estimated by the online estimator (default: the mean)")
+    parser.add_argument("--batch", type=int, metavar="N",
+                        help="simulate the replicas of a configuration in lockstep batches of N replicas (random "
+                             "policy, latest-started preemption, static estimator, and shared storage only)")
+    parser.add_argument("--processes", type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--cache", metavar="DIR", help="result cache directory (cached simulations are not run)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024), metavar="MB",
+                        help="bound of the result cache size (default: %(default)s MB)")
+    parser.add_argument("--output", help="write the summary table (csv) to this file")
+    args = parser.parse_args()
+    if args.quantile is not None and args.estimator != "online":
+        parser.error("--quantile requires the online estimator")
+    if args.batch is not None:
+        if args.batch < 1:
+            parser.error("--batch must be positive")
+        if (args.policy, args.preemption, args.estimator) != ("random", "latest-started", "static"):
+            parser.error("--batch requires the random policy, the latest-started preemption, and the static "
+                         "estimator")
+
+    scenario = Scenario.load(args.scenario) if args.scenario else None
+    grid = dict((p, getattr(args, p)) for p in PIDConfiguration.PARAMETERS if getattr(args, p))
+    configurations = generate_configurations(grid)
+    seeds = range(args.seed, args.seed + args.replicas)
+
+    summaries, results = run_experiment(args.workflow, configurations, seeds, enable_pid=args.use_pid,
+                                        processes=args.processes, policy=args.policy,
+                                        preemption=args.preemption, cache_directory=args.cache,
+                                        cache_size=args.cache_size * 1024 * 1024, scenario=scenario,
+                                        estimator=args.estimator, quantile=args.quantile, batch=args.batch)
+
+    parameters = sorted(grid)
+    if args.output:
+        with open(args.output, "w") as f:
+            write_summary(summaries, parameters, f)
+
+    for summary in summaries:
+        config = ", ".join("%s=%s" % (p, summary[p]) for p in parameters) or "default"
+        print "[%s] replicas: %s (stalled: %s), makespan: %.1f +/- %.1f, preempted tasks: %.1f +/- %.1f, " \
+              "peak storage: %.1f +/- %.1f, peak memory: %.1f +/- %.1f" \
+              % tuple([config, summary['replicas'], summary['stalled']]
+                      + [summary[c] for m in METRICS for c in (m, m + "_ci")])
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,8 @@ __author__ = "Rafael Ferreira da Silva"
 
 import logging
 
+from task import TaskType
+
 log = logging.getLogger(__name__)
 
 
@@ -28,13 +30,156 @@ class FileLink:
     INTERMEDIATE = "intermediate"
 
 
-class File:
-    def __init__(self, name, size):
+class File(object):
+    __slots__ = ("name", "size", "id")
+
+    def __init__(self, name, size, id=None):
+        """
+
+        :param name: file name
+        :param size: file size
+        :param id: dense integer id of the file within its workflow (assigned when the file is added to a workflow)
+        """
         self.name = name
         self.size = float(size)
+        self.id = id
 
     def __eq__(self, other):
         return self.name == other.name and self.size == other.size
 
     def __str__(self):
         return "File: {name: %s, size: %s}" % (self.name, self.size)
+
+
+class FileReferences:
+    """
+    Reference counts of the files read by pending tasks and used by running tasks, indexed by file id. Cleanup tasks
+    are pending consumers of the files they remove, but they are never counted as running consumers. Registered
+    storages are notified whenever a file becomes referenced or unreferenced, so they can keep track of their
+    orphan files.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.running = []
+        self.storages = []
+
+    def add_storage(self, storage):
+        """
+        Register a storage to be notified of reference changes.
+        :param storage: storage object
+        """
+        if not any(s is storage for s in self.storages):
+            self.storages.append(storage)
+        storage.set_file_references(self)
+
+    def clear(self):
+        """
+        Remove all references (files become unreferenced).
+        """
+        self.pending = [0] * len(self.pending)
+        self.running = [0] * len(self.running)
+        for storage in self.storages:
+            storage.update_orphans()
+
+    def set_counts(self, pending, running):
+        """
+        Replace the reference counts (e.g., when a simulation state is restored).
+        :param pending: list of pending reference counts by file id
+        :param running: list of running reference counts by file id
+        """
+        self.pending = list(pending)
+        self.running = list(running)
+        for storage in self.storages:
+            storage.update_orphans()
+
+    def add_file(self, file):
+        """
+        Register a file in the index.
+        :param file: file object (with an id)
+        """
+        if file.id >= len(self.pending):
+            extension = [0] * (file.id + 1 - len(self.pending))
+            self.pending.extend(extension)
+            self.running.extend(extension)
+
+    def add_pending_task(self, task):
+        """
+        Count the input files of a pending task as required.
+        :param task: pending task object
+        """
+        for f in task.input_data.values():
+            self.add_required_file(f)
+
+    def add_required_file(self, file):
+        """
+        Count a file as an input of one more pending task.
+        :param file: file object
+        """
+        self.pending[file.id] += 1
+        if self.pending[file.id] == 1 and self.running[file.id] == 0:
+            for storage in self.storages:
+                storage.discard_orphan(file)
+
+    def remove_pending_task(self, task):
+        """
+        Release the input files of a task that is no longer pending.
+        :param task: task object
+        """
+        pending = self.pending
+        for f in task.input_data.values():
+            pending[f.id] -= 1
+            if pending[f.id] == 0 and self.running[f.id] == 0:
+                for storage in self.storages:
+                    storage.add_orphan(f)
+
+    def add_running_task(self, task):
+        """
+        Count the input, intermediate, and output files of a running task as used.
+        :param task: running task object
+        """
+        if task.type == TaskType.CLEANUP:
+            return
+        running = self.running
+        for l in [task.input_data, task.intermediate_data, task.output_data]:
+            for f in l.values():
+                running[f.id] += 1
+                if running[f.id] == 1 and self.pending[f.id] == 0:
+                    for storage in self.storages:
+                        storage.discard_orphan(f)
+
+    def remove_running_task(self, task):
+        """
+        Release the files of a task that has finished or has been preempted.
+        :param task: task object
+        """
+        if task.type == TaskType.CLEANUP:
+            return
+        running = self.running
+        for l in [task.input_data, task.intermediate_data, task.output_data]:
+            for f in l.values():
+                running[f.id] -= 1
+                if running[f.id] == 0 and self.pending[f.id] == 0:
+                    for storage in self.storages:
+                        storage.add_orphan(f)
+
+    def is_required(self, file):
+        """
+        :param file: file object
+        :return: whether the file is an input of a pending task
+        """
+        return self.pending[file.id] > 0
+
+    def is_used(self, file):
+        """
+        :param file: file object
+        :return: whether the file is used by a running task
+        """
+        return self.running[file.id] > 0
+
+    def is_referenced(self, file):
+        """
+        :param file: file object
+        :return: whether the file is required by a pending task or used by a running task
+        """
+        return self.pending[file.id] > 0 or self.running[file.id] > 0
@@ -17,11 +17,17 @@
 #
 __author__ = "Rafael Ferreira da Silva"
 
+import argparse
+import random
 import sys
 
 from file import *
 from task import TaskTransformation
 
+# transformations whose tasks read an input file, and whose output files are read by pair and frequency tasks
+FIRST_LEVEL = [TaskTransformation.SIFTING, TaskTransformation.INDIVIDUALS, TaskTransformation.POPULATION]
+SECOND_LEVEL = [TaskTransformation.PAIR, TaskTransformation.FREQUENCY]
+
 
 def parse_task_transformation(value):
     if value.lower() == "sifting":
@@ -44,89 +50,200 @@ class Task:
         self.id = id
         self.duration = float(duration)
         self.memory_peak = int(memory_peak)
+        # names of the files and parent tasks
         self.input_files = []
         self.intermediate_files = []
         self.output_files = []
         self.parents = []
 
+    def get_name(self):
+        return "%s_%s" % (self.type, self.id)
+
     def __str__(self):
         return "Task,%s_%s,%s,%s" % (self.type, self.id, self.duration, self.memory_peak)
 
 
-def main():
-    args = sys.argv[1:]
-
-    # read and parse workflow csv file
-    wf_file = open(args[0])
-
+def read_trace(trace_path):
+    """
+    Read a 1000genome execution trace (csv): one task per line with its transformation, id, duration, memory peak,
+    and input, intermediate, and output data sizes.
+    :param trace_path: trace file path
+    :return: list of trace lines (lists of values)
+    """
+    with open(trace_path) as trace_file:
+        return [line.strip().split(",") for line in trace_file if line.strip()]
+
+
+def workflow_trace(workflow):
+    """
+    Build trace lines from the tasks of a 1000genome workflow (e.g., to generate synthetic workflows from a
+    workflow csv file when the original trace is not at hand).
+    :param workflow: workflow object
+    :return: list of trace lines (lists of values)
+    """
+    trace = []
+    for task in workflow.task_list:
+        sizes = []
+        for prefix in ["input", "intermediate", "output"]:
+            f = workflow.files.get("%s_%s" % (prefix, task.id))
+            sizes.append(f.size if f else 0)
+        trace.append([task.transformation, task.id.split("_")[1], task.duration, task.peak_memory] + sizes)
+    return trace
+
+
+def generate_from_trace(trace, output):
+    """
+    Write the workflow of a trace. The number of chromosomes is the number of sifting tasks in the trace, and pair
+    and frequency task ids enumerate the (population, chromosome) combinations.
+    :param trace: list of trace lines
+    :param output: file object
+    """
+    chromosomes = len([l for l in trace if parse_task_transformation(l[0]) == TaskTransformation.SIFTING])
     tasks = []
     files = []
+    file_index = {}
+    task_index = {}
+
+    def add_file(name, size):
+        f = File(name, size)
+        files.append(f)
+        file_index[f.name] = f
+        return f.name
 
-    for line in wf_file:
-        l = line.strip().split(",")
+    for l in trace:
         task = Task(parse_task_transformation(l[0]), l[1], l[2], l[3])
 
-        if task.type == TaskTransformation.SIFTING or task.type == TaskTransformation.INDIVIDUALS \
-                or task.type == TaskTransformation.POPULATION:
-            input_file = File("input_%s_%s" % (l[0], l[1]), l[4])
-            files.append(input_file)
-            task.input_files.append(input_file)
-
-        elif task.type == TaskTransformation.PAIR or task.type == TaskTransformation.FREQUENCY:
-            multiplier = int((int(task.id) - 1) / 22)
-            index = int(task.id) - multiplier * 22
-            task.input_files.append(find_file("output_%s_%s" % (TaskTransformation.INDIVIDUALS, index), files))
-            task.input_files.append(find_file("output_%s_%s" % (TaskTransformation.SIFTING, index), files))
-            task.input_files.append(find_file("output_%s_%s" % (TaskTransformation.POPULATION, multiplier + 1), files))
-            task.parents.append(find_task(TaskTransformation.INDIVIDUALS, index, tasks))
-            task.parents.append(find_task(TaskTransformation.SIFTING, index, tasks))
-            task.parents.append(find_task(TaskTransformation.POPULATION, multiplier + 1, tasks))
+        if task.type in FIRST_LEVEL:
+            task.input_files.append(add_file("input_%s_%s" % (l[0], l[1]), l[4]))
+
+        elif task.type in SECOND_LEVEL:
+            multiplier = (int(task.id) - 1) // chromosomes
+            index = int(task.id) - multiplier * chromosomes
+            for parent_type, parent_id in [(TaskTransformation.INDIVIDUALS, index), (TaskTransformation.SIFTING, index),
+                                           (TaskTransformation.POPULATION, multiplier + 1)]:
+                task.input_files.append(file_index["output_%s_%s" % (parent_type, parent_id)].name)
+                task.parents.append(task_index[(parent_type, parent_id)].get_name())
 
         if float(l[5]) > 0:
-            intermediate_file = File("intermediate_%s_%s" % (l[0], l[1]), l[5])
-            files.append(intermediate_file)
-            task.intermediate_files.append(intermediate_file)
+            task.intermediate_files.append(add_file("intermediate_%s_%s" % (l[0], l[1]), l[5]))
 
         if float(l[6]) > 0:
-            output_file = File("output_%s_%s" % (l[0], l[1]), l[6])
-            files.append(output_file)
-            task.output_files.append(output_file)
+            task.output_files.append(add_file("output_%s_%s" % (l[0], l[1]), l[6]))
 
         tasks.append(task)
+        task_index[(task.type, int(task.id))] = task
 
-    # print the workflow
-    for file in files:
-        print "File,%s,%s" % (file.name, file.size)
-
+    write_files(files, output)
     for task in tasks:
-        print task
-        task_name = "%s_%s" % (task.type, task.id)
-        print_uses(task_name, task.input_files, FileLink.INPUT)
-        print_uses(task_name, task.intermediate_files, FileLink.INTERMEDIATE)
-        print_uses(task_name, task.output_files, FileLink.OUTPUT)
+        write_task(task, output)
+
+
+def generate_parametric(trace, chromosomes, populations, individuals, output, seed=None):
+    """
+    Write a 1000genome-shaped workflow of arbitrary size. Each chromosome has one sifting task and a number of
+    individuals tasks, and there is one population task per population. Every (population, chromosome) combination
+    has a pair and a frequency task, which read the outputs of the chromosome's sifting and individuals tasks and of
+    the population task. Durations, memory peaks, and data sizes of each task are sampled (jointly) from the trace
+    lines of its transformation. Tasks are written as they are generated, so memory usage does not grow with the
+    workflow size.
+    :param trace: list of trace lines
+    :param chromosomes: number of chromosomes
+    :param populations: number of populations
+    :param individuals: number of individuals tasks per chromosome
+    :param output: file object
+    :param seed: seed of the random number generator
+    """
+    rng = random.Random(seed)
+    samples = {}
+    for l in trace:
+        samples.setdefault(parse_task_transformation(l[0]), []).append(l[2:7])
+    missing = [t for t in FIRST_LEVEL + SECOND_LEVEL if t not in samples]
+    if missing:
+        raise ValueError("The trace has no tasks of: %s" % ", ".join(missing))
+
+    def generate_task(transformation, id, input_files=(), parents=()):
+        duration, memory_peak, input_size, intermediate_size, output_size = rng.choice(samples[transformation])
+        task = Task(transformation, id, duration, memory_peak)
+        files = []
+        if transformation in FIRST_LEVEL:
+            files.append(File("input_%s_%s" % (transformation, id), input_size))
+            task.input_files.append(files[-1].name)
+        else:
+            task.input_files.extend(input_files)
+        if float(intermediate_size) > 0:
+            files.append(File("intermediate_%s_%s" % (transformation, id), intermediate_size))
+            task.intermediate_files.append(files[-1].name)
+        # outputs of first level tasks are always written, since they are read by the second level tasks
+        if float(output_size) > 0 or transformation in FIRST_LEVEL:
+            files.append(File("output_%s_%s" % (transformation, id), output_size))
+            task.output_files.append(files[-1].name)
+        task.parents.extend(parents)
+
+        write_files(files, output)
+        write_task(task, output)
+
+    for c in range(1, chromosomes + 1):
+        generate_task(TaskTransformation.SIFTING, c)
+    for i in range(1, chromosomes * individuals + 1):
+        generate_task(TaskTransformation.INDIVIDUALS, i)
+    for p in range(1, populations + 1):
+        generate_task(TaskTransformation.POPULATION, p)
+
+    for transformation in SECOND_LEVEL:
+        for p in range(1, populations + 1):
+            for c in range(1, chromosomes + 1):
+                parents = ["%s_%s" % (TaskTransformation.INDIVIDUALS, i)
+                           for i in range((c - 1) * individuals + 1, c * individuals + 1)]
+                parents.append("%s_%s" % (TaskTransformation.SIFTING, c))
+                parents.append("%s_%s" % (TaskTransformation.POPULATION, p))
+                generate_task(transformation, (p - 1) * chromosomes + c, ["output_%s" % t for t in parents], parents)
+
+
+def write_files(files_list, output):
+    for file in files_list:
+        output.write("File,%s,%s\n" % (file.name, file.size))
 
-        for parent in task.parents:
-            parent_name = "%s_%s" % (parent.type, parent.id)
-            print "Depends,%s,%s" % (task_name, parent_name)
 
+def write_task(task, output):
+    output.write("%s\n" % task)
+    task_name = task.get_name()
+    write_uses(task_name, task.input_files, FileLink.INPUT, output)
+    write_uses(task_name, task.intermediate_files, FileLink.INTERMEDIATE, output)
+    write_uses(task_name, task.output_files, FileLink.OUTPUT, output)
 
-def find_file(file_name, files_list):
-    for file in files_list:
-        if file.name == file_name:
-            return file
-    return None
+    for parent in task.parents:
+        output.write("Depends,%s,%s\n" % (task_name, parent))
 
 
-def find_task(task_type, task_id, tasks_list):
-    for task in tasks_list:
-        if task.type == task_type and int(task.id) == task_id:
-            return task
-    return None
+def write_uses(task_id, files_list, link, output):
+    for file_name in files_list:
+        output.write("Uses,%s,%s,%s\n" % (task_id, file_name, link))
 
 
-def print_uses(task_id, files_list, link):
-    for file in files_list:
-        print "Uses,%s,%s,%s" % (task_id, file.name, link)
+def main():
+    parser = argparse.ArgumentParser(description="Generate a 1000genome workflow (csv) from an execution trace.")
+    parser.add_argument("trace", help="execution trace file (csv)")
+    parser.add_argument("-o", "--output", help="workflow file to be written (default: standard output)")
+    parser.add_argument("--chromosomes", type=int,
+                        help="generate a synthetic workflow with this number of chromosomes, sampling task "
+                             "durations, memory peaks, and data sizes from the trace")
+    parser.add_argument("--populations", type=int, default=7,
+                        help="number of populations of the synthetic workflow (default: 7)")
+    parser.add_argument("--individuals", type=int, default=1,
+                        help="number of individuals tasks per chromosome of the synthetic workflow (default: 1)")
+    parser.add_argument("--seed", type=int, help="seed of the synthetic workflow sampling")
+    args = parser.parse_args()
+
+    trace = read_trace(args.trace)
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        if args.chromosomes:
+            generate_parametric(trace, args.chromosomes, args.populations, args.individuals, output, args.seed)
+        else:
+            generate_from_trace(trace, output)
+    finally:
+        if args.output:
+            output.close()
 
 
 if __name__ == '__main__':
@@ -17,14 +17,21 @@
 #
 __author__ = "Rafael Ferreira da Silva"
 
+import copy
+import json
+import math
 import random
 
+from estimator import StaticEstimator
+from policy import RandomPolicy
+from preemption import LatestStartedPreemption
 from resource import *
+from stats import Phase, SchedulerStats, timer
 from task import *
 
 log = logging.getLogger(__name__)
 
-# constants
+# default configuration (scenario files, see scenario.py, override the platform, controllers, and estimations)
 STORAGE_CAPACITY = 500000
 STORAGE_LIMIT = 450000
 MEMORY_THRESHOLD = 0.8
@@ -64,227 +71,621 @@ MEMORY_ESTIMATION = {
 }
 
 
+class SimulationStalled(Exception):
+    pass
+
+
+class PIDConfiguration:
+    PARAMETERS = ["storage_capacity", "storage_limit", "memory_threshold", "sto_kp", "sto_ki", "sto_kd", "mem_kp",
+                  "mem_ki", "mem_kd"]
+
+    def __init__(self, storage_capacity=STORAGE_CAPACITY, storage_limit=STORAGE_LIMIT,
+                 memory_threshold=MEMORY_THRESHOLD, sto_kp=STO_KP, sto_ki=STO_KI, sto_kd=STO_KD, mem_kp=MEM_KP,
+                 mem_ki=MEM_KI, mem_kd=MEM_KD):
+        """
+        PID controllers configuration (defaults to the module constants).
+        :param storage_capacity: shared storage capacity (used to bound the reported disk controller input)
+        :param storage_limit: disk controller setpoint
+        :param memory_threshold: memory controllers setpoint (fraction of the memory capacity)
+        :param sto_kp: disk controller proportional constant
+        :param sto_ki: disk controller integral constant
+        :param sto_kd: disk controller derivative constant
+        :param mem_kp: memory controllers proportional constant
+        :param mem_ki: memory controllers integral constant
+        :param mem_kd: memory controllers derivative constant
+        """
+        self.storage_capacity = storage_capacity
+        self.storage_limit = storage_limit
+        self.memory_threshold = memory_threshold
+        self.sto_kp = sto_kp
+        self.sto_ki = sto_ki
+        self.sto_kd = sto_kd
+        self.mem_kp = mem_kp
+        self.mem_ki = mem_ki
+        self.mem_kd = mem_kd
+
+    def to_dict(self):
+        return dict((p, getattr(self, p)) for p in PIDConfiguration.PARAMETERS)
+
+    def save(self, path):
+        """
+        Write the configuration to a json file.
+        :param path: file path
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def load(path):
+        """
+        Read a configuration from a json file (e.g., a gains file written by the tuner).
+        :param path: file path
+        :return: configuration object
+        """
+        with open(path) as f:
+            return PIDConfiguration.from_dict(json.load(f))
+
+    @staticmethod
+    def from_dict(values):
+        """
+        Create a configuration from a dictionary, missing parameters take their default value.
+        :param values: dictionary of parameter values
+        :return: configuration object
+        """
+        unknown = set(values) - set(PIDConfiguration.PARAMETERS)
+        if unknown:
+            raise ValueError("Unknown PID configuration parameters: %s" % ", ".join(sorted(unknown)))
+        return PIDConfiguration(**values)
+
+    def __str__(self):
+        return "PIDConfiguration: {%s}" % ", ".join("%s: %s" % (p, getattr(self, p))
+                                                    for p in PIDConfiguration.PARAMETERS)
+
+
+class SchedulerSnapshot:
+    """
+    Copy of the per-run state of a scheduler between two time steps: clock, controller errors, queue, task status,
+    running tasks, storage contents, memory, random number generator state, cleanup counter, estimator observations,
+    and statistics. The workflow structure, files, and platform configuration are referenced rather than copied. A
+    snapshot is never modified, thus it can be restored any number of times, into the scheduler it was taken from or
+    into its forks.
+    """
+
+    def __init__(self, scheduler):
+        """
+
+        :param scheduler: scheduler whose state is captured
+        """
+        self.config = scheduler.config
+        self.current_time = scheduler.current_time
+        self.changed_schedule = scheduler.changed_schedule
+        self.cleanup_task_id = scheduler.cleanup_task_id
+        self.random_state = scheduler.random.getstate()
+        self.queue = tuple(task.id for task in scheduler.policy.get_tasks())
+        self.stats = copy.deepcopy(scheduler.stats)
+        self.disk_controller = (scheduler.disk_controller.cumulative_error, scheduler.disk_controller.previous_error)
+        self.mem_controllers = tuple((cr.mem_controller.cumulative_error, cr.mem_controller.previous_error)
+                                     for cr in scheduler.compute_resources)
+        self.estimator = scheduler.estimator.get_state()
+        self.workflow = scheduler.workflow.get_state()
+        self.shared_storage = scheduler.shared_storage.get_state()
+        self.compute_resources = tuple(cr.get_state() for cr in scheduler.compute_resources)
+
+    def __str__(self):
+        return "SchedulerSnapshot: {time: %s, queued tasks: %s, cleanup tasks: %s}" \
+               % (self.current_time, len(self.queue), self.cleanup_task_id - 1)
+
+
 class PIDScheduler:
-    def __init__(self, workflow, compute_resources, shared_storage):
+    def __init__(self, workflow, compute_resources, shared_storage, recorder=None, profile=False, config=None,
+                 seed=None, policy=None, preemption=None, controller_bank=False, storage_estimation=None,
+                 memory_estimation=None, estimator=None):
         """
 
         :param workflow:
         :param compute_resources:
         :param shared_storage:
+        :param recorder: telemetry recorder fed at every time step (optional)
+        :param profile: whether wall time and call/iteration counts are accumulated per scheduling phase
+        :param config: PID controllers configuration (defaults to the module constants)
+        :param seed: seed of the random number generator used to pick tasks from the queue
+        :param policy: scheduling policy, which holds the queue of tasks (default: random)
+        :param preemption: preemption policy, which indexes the running tasks (default: latest started first)
+        :param controller_bank: whether the storage and memory controllers are updated in a single vectorized call
+                                (ControllerBank, requires numpy)
+        :param storage_estimation: dictionary of storage estimation by transformation (default: STORAGE_ESTIMATION)
+        :param memory_estimation: dictionary of memory estimation by transformation (default: MEMORY_ESTIMATION)
+        :param estimator: resource estimator, which provides the storage and memory estimations used to admit tasks
+                          (default: static estimations from the storage_estimation and memory_estimation tables)
         """
         self.workflow = workflow
         self.compute_resources = compute_resources
         self.shared_storage = shared_storage
-        self.disk_controller = Controller(STORAGE_LIMIT, kp=STO_KP, ki=STO_KI, kd=STO_KD)
-        self.queue = []
+        self.profile = profile
+        self.controller_bank = controller_bank
+        self.policy = policy if policy is not None else RandomPolicy()
+        self.preemption = preemption if preemption is not None else LatestStartedPreemption()
+        if estimator is None:
+            estimator = StaticEstimator(storage_estimation if storage_estimation is not None else STORAGE_ESTIMATION,
+                                        memory_estimation if memory_estimation is not None else MEMORY_ESTIMATION)
+        self._set_estimator(estimator)
+
+        # index of each compute resource (preemption ties are broken by resource order)
+        self.resource_order = dict((cr, i) for i, cr in enumerate(compute_resources))
+
+        # compute resources eligible to run each transformation
+        self.transformation_resources = {}
+        for cr in compute_resources:
+            for transformation in cr.accepted_tasks:
+                self.transformation_resources.setdefault(transformation, []).append(cr)
+            cr.set_file_references(workflow.file_references)
+
+        self._init_run_state(config, seed, recorder)
+
+    def reset(self, config=None, seed=None, recorder=None, policy=None, preemption=None, estimator=None):
+        """
+        Prepare a new simulation run over the same workflow structure and platform. Only the per-run state of the
+        workflow, storage, and compute resources is reinitialized, nothing is parsed or rebuilt.
+        :param config: PID controllers configuration (defaults to the module constants)
+        :param seed: seed of the random number generator used to pick tasks from the queue
+        :param recorder: telemetry recorder fed at every time step (optional)
+        :param policy: scheduling policy (default: keep the current policy)
+        :param preemption: preemption policy (default: keep the current policy)
+        :param estimator: resource estimator (default: keep the current estimator)
+        """
+        if policy is not None:
+            self.policy = policy
+        if preemption is not None:
+            self.preemption = preemption
+        self._set_estimator(estimator or self.estimator)
+        self.workflow.reset()
+        self.shared_storage.reset()
+        for cr in self.compute_resources:
+            cr.reset()
+        self._init_run_state(config, seed, recorder)
+
+    def _set_estimator(self, estimator):
+        """
+        Set the resource estimator, whose estimation dictionaries are shared with the policies.
+        :param estimator: resource estimator
+        """
+        self.estimator = estimator
+        self.storage_estimation = estimator.storage
+        self.memory_estimation = estimator.memory
+        self.policy.set_estimations(self.storage_estimation, self.memory_estimation)
+        self.preemption.set_estimations(self.storage_estimation)
+
+    def _init_run_state(self, config, seed, recorder):
+        self.config = config or PIDConfiguration()
+        self.random = random.Random(seed)
+        self.estimator.reset()
+        self.disk_controller = Controller(self.config.storage_limit, kp=self.config.sto_kp, ki=self.config.sto_ki,
+                                          kd=self.config.sto_kd)
+        self.policy.clear()
+        self.preemption.clear()
         self.current_time = 0
+        self.changed_schedule = True
         self.cleanup_task_id = 1
+        self.stats = SchedulerStats(profile=self.profile)
+        self.recorder = recorder
 
         # set memory controllers
-        for cr in compute_resources:
-            cr.set_mem_controller(memory_threshold=MEMORY_THRESHOLD, kp=MEM_KP, ki=MEM_KI, kd=MEM_KD)
+        for cr in self.compute_resources:
+            cr.set_mem_controller(memory_threshold=self.config.memory_threshold, kp=self.config.mem_kp,
+                                  ki=self.config.mem_ki, kd=self.config.mem_kd)
+
+        # the storage controller (index 0) and the memory controllers are replaced by views of a controller bank
+        self.controllers = None
+        if self.controller_bank:
+            self.controllers = ControllerBank.from_controllers(
+                [self.disk_controller] + [cr.mem_controller for cr in self.compute_resources])
+            self.controller_limits = [float("inf")] + [cr.memory['capacity'] for cr in self.compute_resources]
+            self.disk_controller = self.controllers.get_controller(0)
+            for i, cr in enumerate(self.compute_resources):
+                cr.mem_controller = self.controllers.get_controller(i + 1)
+
+    def snapshot(self):
+        """
+        Capture the current state of the simulation, e.g., after start() has been aborted by its time limit.
+        :return: snapshot object
+        """
+        return SchedulerSnapshot(self)
 
-    def start(self, enable_pid=True):
+    def restore(self, snapshot, config=None, seed=None, recorder=None):
+        """
+        Bring the simulation back to a snapshot, so that start() resumes from the snapshot time.
+        :param snapshot: snapshot taken from this scheduler or from a scheduler it has been forked from
+        :param config: PID controllers configuration (default: the snapshot configuration); the controller errors
+                       accumulated so far are kept
+        :param seed: if set, the random number generator is reseeded instead of restoring its state
+        :param recorder: telemetry recorder fed at every time step (optional)
+        """
+        self._init_run_state(config or snapshot.config, seed, recorder)
+        if seed is None:
+            self.random.setstate(snapshot.random_state)
+        self.current_time = snapshot.current_time
+        self.changed_schedule = snapshot.changed_schedule
+        self.cleanup_task_id = snapshot.cleanup_task_id
+        self.stats = copy.deepcopy(snapshot.stats)
+        self.estimator.set_state(snapshot.estimator)
+        self.disk_controller.cumulative_error, self.disk_controller.previous_error = snapshot.disk_controller
+        for cr, (cumulative_error, previous_error) in zip(self.compute_resources, snapshot.mem_controllers):
+            cr.mem_controller.cumulative_error, cr.mem_controller.previous_error = cumulative_error, previous_error
+
+        self.workflow.set_state(snapshot.workflow)
+        self.shared_storage.set_state(snapshot.shared_storage)
+        for cr, state in zip(self.compute_resources, snapshot.compute_resources):
+            cr.set_state(state, self.workflow.pending_tasks)
+            for _, cu in sorted(cr.compute_units.items()):
+                if cu.current_task and cu.current_task.type != TaskType.CLEANUP:
+                    self.preemption.add_task(cu.current_task, self.resource_order[cr], cr, cu)
+        for task_id in snapshot.queue:
+            self.policy.add_task(self.workflow.pending_tasks[task_id])
+
+    def fork(self, snapshot=None, config=None, seed=None, recorder=None, policy=None, preemption=None,
+             estimator=None):
+        """
+        Create an independent scheduler that continues the simulation from a snapshot (what-if analysis). The fork
+        shares the workflow files and task data with this scheduler, but has its own tasks, storage, and compute
+        resources, thus forks can be simulated side by side.
+        :param snapshot: snapshot to start from (default: the current state of this scheduler)
+        :param config: PID controllers configuration of the fork (default: the snapshot configuration)
+        :param seed: if set, the random number generator of the fork is reseeded
+        :param recorder: telemetry recorder fed at every time step (optional)
+        :param policy: scheduling policy of the fork (default: a policy of the same kind as this scheduler's)
+        :param preemption: preemption policy of the fork (default: a policy of the same kind as this scheduler's)
+        :param estimator: resource estimator of the fork (default: an estimator with the same configuration as this
+                          scheduler's), restored to the snapshot observations
+        :return: scheduler object
+        """
+        snapshot = snapshot or self.snapshot()
+        shared_storage = Storage(self.shared_storage.capacity)
+        compute_resources = [cr.clone(shared_storage) for cr in self.compute_resources]
+        scheduler = PIDScheduler(self.workflow.clone(), compute_resources, shared_storage, profile=self.profile,
+                                 controller_bank=self.controller_bank,
+                                 estimator=estimator if estimator is not None else self.estimator.clone(),
+                                 policy=policy if policy is not None else self.policy.__class__(),
+                                 preemption=preemption if preemption is not None else self.preemption.__class__())
+        scheduler.restore(snapshot, config=config, seed=seed, recorder=recorder)
+        return scheduler
+
+    def start(self, enable_pid=True, event_driven=False, sampling_period=None, time_limit=None):
         """
 
         :param enable_pid: whether the PID controller is enabled
+        :param event_driven: whether the clock jumps to the next event instead of advancing one time step at a time
+        :param sampling_period: if set, controllers are also sampled every sampling_period time steps
+        :param time_limit: if set, the simulation is aborted before advancing the clock beyond this time; calling
+                           start() again resumes it
+        :return: workflow makespan, or None if the simulation has been aborted
         """
-        changed_schedule = True
+        changed_schedule = self.changed_schedule
 
         while not self.workflow.is_completed():
 
             # advance time step
-            self.current_time += 1
-
-            # process finished tasks
-            finished_tasks = False
-            for compute_resource in self.compute_resources:
-                for compute_unit in compute_resource.compute_units.values():
-                    if compute_unit.current_task and compute_unit.current_task.end_time <= self.current_time:
-                        finished_task = compute_unit.current_task
-                        compute_resource.process_finished_task(compute_unit)
-                        del self.workflow.pending_tasks[finished_task.id]
-                        print "[%s] Finished %s" % (self.current_time, finished_task)
-                        finished_tasks = True
+            if event_driven:
+                next_time = self._get_next_event_time(changed_schedule, sampling_period)
+            else:
+                next_time = self.current_time + 1
+            if time_limit is not None and next_time > time_limit:
+                log.info("[%s] Simulation aborted: time limit (%s) reached", self.current_time, time_limit)
+                self.changed_schedule = changed_schedule
+                return None
+            finished_tasks, sampling_instant = self._advance(next_time, sampling_period)
 
             # feed the PID controllers with current output values
-            # TODO: only works for shared storage
             disk_controller_input = 0
             mem_controllers = {}
-            if enable_pid and (changed_schedule or finished_tasks):
-                disk_controller_input = self.disk_controller.process(self.shared_storage.current_used_storage())
+            if enable_pid and (changed_schedule or finished_tasks or sampling_instant):
+                disk_controller_input, mem_controllers = self._process_controllers()
+            self._end_controllers_phase(disk_controller_input, mem_controllers)
 
-                for cr in self.compute_resources:
-                    mem_controllers[cr] = cr.get_mem_controller_input()
+            if not finished_tasks and not changed_schedule and not sampling_instant:
+                continue
 
-            mem_controller_response = False
+            changed_schedule = self._schedule(enable_pid, disk_controller_input, mem_controllers)
+
+        self.changed_schedule = changed_schedule
+        return self.current_time
+
+    def _advance(self, next_time, sampling_period=None):
+        """
+        Move the clock to the next time step, and process the tasks that have finished by then.
+        :param next_time: next time step
+        :param sampling_period: controller sampling period (if any)
+        :return: whether tasks have finished, and whether the time step is a controller sampling instant
+        """
+        stats = self.stats
+        self.current_time = next_time
+        stats.steps += 1
+        sampling_instant = sampling_period and self.current_time % sampling_period == 0
+        if stats.profile:
+            self._phase_start = timer()
+
+        # process finished tasks
+        finished_tasks = False
+        num_finished_tasks = 0
+        for compute_resource in self.compute_resources:
+            for compute_unit in compute_resource.pop_finished_compute_units(self.current_time):
+                finished_task = compute_unit.current_task
+                compute_resource.process_finished_task(compute_unit)
+                self.estimator.update(finished_task)
+                self.preemption.remove_task(finished_task)
+                self.workflow.complete_task(finished_task)
+                log.info("[%s] Finished %s", self.current_time, finished_task)
+                finished_tasks = True
+                num_finished_tasks += 1
+
+        if stats.profile:
+            self._phase_start = stats.add_phase(Phase.FINISHED_TASKS, self._phase_start, num_finished_tasks)
+
+        return finished_tasks, sampling_instant
+
+    def _process_controllers(self):
+        """
+        Feed the storage and memory controllers with the current storage and memory usage.
+        :return: storage controller input, and dictionary of memory controller inputs by compute resource
+        """
+        # TODO: only works for shared storage
+        if self.controllers is not None:
+            outputs = [self.shared_storage.current_used_storage()]
+            outputs.extend(cr.get_current_used_memory() for cr in self.compute_resources)
+            inputs = self.controllers.process(outputs, upper=self.controller_limits).tolist()
+            return inputs[0], dict(zip(self.compute_resources, inputs[1:]))
+
+        disk_controller_input = self.disk_controller.process(self.shared_storage.current_used_storage())
+        mem_controllers = {}
+        for cr in self.compute_resources:
+            mem_controllers[cr] = cr.get_mem_controller_input()
+        return disk_controller_input, mem_controllers
+
+    def _end_controllers_phase(self, disk_controller_input, mem_controllers):
+        """
+        Log the controller inputs of the current time step, and account for the controllers phase.
+        :param disk_controller_input: storage controller input
+        :param mem_controllers: dictionary of memory controller inputs by compute resource
+        """
+        if log.isEnabledFor(logging.DEBUG):
             for cr in self.compute_resources:
-                if cr in mem_controllers:
-                    mem_controller_input = mem_controllers[cr]
-                else:
-                    mem_controller_input = 0.0
-                if mem_controller_input != 0:
-                    mem_controller_response = True
-                mci = mem_controller_input
+                mci = mem_controllers.get(cr, 0.0)
                 if mci > cr.memory['capacity']:
                     mci = cr.memory['capacity']
-                print "[%s] Mem Controller Input [%s]: %s - %s" % (self.current_time, cr.id, mci,
-                                                                   cr.get_current_used_memory())
+                log.debug("[%s] Mem Controller Input [%s]: %s - %s", self.current_time, cr.id, mci,
+                          cr.get_current_used_memory())
 
             dci = disk_controller_input
-            if dci > STORAGE_CAPACITY:
-                dci = STORAGE_CAPACITY
-            print "[%s] Disk Controller Input: %s - %s" % (self.current_time, dci,
-                                                           self.shared_storage.current_used_storage())
+            if dci > self.config.storage_capacity:
+                dci = self.config.storage_capacity
+            log.debug("[%s] Disk Controller Input: %s - %s", self.current_time, dci,
+                      self.shared_storage.current_used_storage())
 
-            if not finished_tasks and not changed_schedule:
-                continue
+        if self.stats.profile:
+            self._phase_start = self.stats.add_phase(Phase.CONTROLLERS, self._phase_start)
 
-            changed_schedule = False
-
-            # add ready jobs to the queue
-            for task in self.workflow.pending_tasks.values():
-                if task.status == TaskStatus.IDLE and task not in self.queue and task.is_ready():
-                    self.queue.append(task)
-                    task.status = TaskStatus.QUEUED
-
-            # tasks will be scheduled/preempted according to the controller information
-            diff_input = disk_controller_input
-
-            num_tasks_scheduled = 0
-            num_tasks_preempted = 0
-
-            # controllers indicate that more tasks may be scheduled
-            if not enable_pid or disk_controller_input > 0:
-
-                # associate tasks to compute units
-                insufficient_space_error = False
-
-                tasks_to_schedule = list(self.queue)
-
-                while len(tasks_to_schedule) > 0:
-                    task = random.choice(tasks_to_schedule)
-
-                    # check if task estimation is on the limits of the input control
-                    if enable_pid and task.type != TaskType.CLEANUP \
-                            and STORAGE_ESTIMATION[task.transformation] > diff_input:
-                        tasks_to_schedule.remove(task)
-                        continue
-
-                    try:
-                        for compute_resource in self.compute_resources:
-                            # test whether it has enough memory available (from estimation)
-                            if enable_pid and task.type != TaskType.CLEANUP \
-                                    and MEMORY_ESTIMATION[task.transformation] > mem_controllers[compute_resource]:
-                                continue
-
-                            compute_unit = compute_resource.run_task(task)
-                            if compute_unit:
-                                task.run(self.current_time)
-                                self.queue.remove(task)
-                                changed_schedule = True
-                                num_tasks_scheduled += 1
-                                if task.type != TaskType.CLEANUP:
-                                    diff_input -= STORAGE_ESTIMATION[task.transformation]
-                                    mem_controllers[compute_resource] -= MEMORY_ESTIMATION[task.transformation]
-                                break
-
-                        # TODO: only works for shared storage
-                        if enable_pid and self.shared_storage.current_used_storage() > STORAGE_LIMIT:
+    def _schedule(self, enable_pid, disk_controller_input, mem_controllers):
+        """
+        Queue the ready tasks, then place queued tasks or preempt running tasks according to the controller inputs.
+        :param enable_pid: whether the PID controllers are enabled
+        :param disk_controller_input: storage controller input
+        :param mem_controllers: dictionary of memory controller inputs by compute resource (modified)
+        :return: whether the schedule has changed
+        """
+        stats = self.stats
+        profile = stats.profile
+        changed_schedule = False
+
+        # idle time steps are not recorded: the controllers are not evaluated and no state changes in them
+        if self.recorder:
+            self.recorder.record(self.current_time, disk_controller_input,
+                                 self.shared_storage.current_used_storage(), len(self.policy), mem_controllers)
+
+        # add ready jobs to the queue
+        for task in self.workflow.pop_ready_tasks():
+            if task.status == TaskStatus.IDLE:
+                self.policy.add_task(task)
+                task.status = TaskStatus.QUEUED
+
+        if profile:
+            self._phase_start = stats.add_phase(Phase.READY_QUEUE, self._phase_start)
+
+        # tasks will be scheduled/preempted according to the controller information
+        diff_input = disk_controller_input
+
+        num_tasks_scheduled = 0
+        num_tasks_preempted = 0
+
+        # controllers indicate that more tasks may be scheduled
+        if not enable_pid or disk_controller_input > 0:
+
+            # associate tasks to compute units
+            insufficient_space_error = False
+            # smallest storage requirement among the tasks that could not be placed for lack of space
+            min_required_storage = None
+
+            policy = self.policy
+            policy.start_round(self.random)
+            storage_estimation = self.storage_estimation
+            memory_estimation = self.memory_estimation
+            tasks_examined = stats.tasks_examined
+
+            while True:
+                task = policy.next_task(diff_input if enable_pid else None, mem_controllers)
+                if task is None:
+                    break
+                stats.tasks_examined += 1
+
+                # check if task estimation is on the limits of the input control
+                if enable_pid and task.type != TaskType.CLEANUP \
+                        and storage_estimation[task.transformation] > diff_input:
+                    continue
+
+                try:
+                    for compute_resource in policy.order_resources(task, self._get_eligible_resources(task),
+                                                                   mem_controllers):
+                        # test whether it has enough memory available (from estimation)
+                        if enable_pid and task.type != TaskType.CLEANUP \
+                                and memory_estimation[task.transformation] > mem_controllers[compute_resource]:
+                            continue
+
+                        compute_unit = compute_resource.run_task(task, self.current_time)
+                        if compute_unit:
+                            policy.remove_task(task)
+                            if task.type != TaskType.CLEANUP:
+                                self.preemption.add_task(task, self.resource_order[compute_resource],
+                                                         compute_resource, compute_unit)
+                            changed_schedule = True
+                            num_tasks_scheduled += 1
+                            stats.tasks_placed += 1
+                            if enable_pid and task.type != TaskType.CLEANUP:
+                                diff_input -= storage_estimation[task.transformation]
+                                mem_controllers[compute_resource] -= memory_estimation[task.transformation]
                             break
 
-                    except InsufficientSpace as e:
-                        # add cleanup task if possible
-                        insufficient_space_error = True
-                    except InsufficientMemory as e:
-                        # there is nothing to do, just wait for other tasks to finish
-                        pass
-
-                    tasks_to_schedule.remove(task)
-
-                print "[%s] Tasks Scheduled: %s" % (self.current_time, num_tasks_scheduled)
-
-                # create cleanup tasks if no tasks could be scheduled due to insufficient disk space
-                if insufficient_space_error and not changed_schedule:
-                    cleanup_task = self._create_cleanup_task()
-                    if cleanup_task:
-                        self.workflow.pending_tasks[cleanup_task.id] = cleanup_task
-
-            # a controller is in overflow mode, thus tasks should be preempted
-            elif disk_controller_input < 0:
-                while diff_input < 0:
-                    total_running_tasks = 0
-                    latest_compute_resource = None
-                    latest_started_task = None
-
-                    for compute_resource in self.compute_resources:
-                        running_tasks = compute_resource.get_running_tasks()
-                        total_running_tasks += len(running_tasks)
-
-                        if len(running_tasks) > 0:
-                            for task in running_tasks:
-                                if not latest_started_task or latest_started_task.start_time < task.start_time:
-                                    latest_started_task = task
-                                    latest_compute_resource = compute_resource
-
-                    if total_running_tasks > 1:
-                        # preempt the latest started task
-                        preempted_task = latest_compute_resource.preempt_task(latest_started_task,
-                                                                              self._get_required_files())
-                        if preempted_task:
-                            diff_input += STORAGE_ESTIMATION[preempted_task.transformation]
-                            changed_schedule = True
-                            num_tasks_preempted += 1
-                            print "[PREEMPTED] %s" % preempted_task
-                    else:
+                    # TODO: only works for shared storage
+                    if enable_pid and self.shared_storage.current_used_storage() > self.config.storage_limit:
                         break
 
-                print "[%s] Tasks Preempted: %s" % (self.current_time, num_tasks_preempted)
+                except InsufficientSpace as e:
+                    # add cleanup task if possible
+                    insufficient_space_error = True
+                    stats.insufficient_space += 1
+                    if min_required_storage is None or e.required_storage < min_required_storage:
+                        min_required_storage = e.required_storage
+                except InsufficientMemory as e:
+                    # there is nothing to do, just wait for other tasks to finish
+                    stats.insufficient_memory += 1
+
+            log.debug("[%s] Tasks Scheduled: %s", self.current_time, num_tasks_scheduled)
+            if profile:
+                self._phase_start = stats.add_phase(Phase.PLACEMENT, self._phase_start,
+                                                    stats.tasks_examined - tasks_examined)
+
+            # create cleanup tasks if no tasks could be scheduled due to insufficient disk space
+            if insufficient_space_error and not changed_schedule:
+                cleanup_task = self._create_cleanup_task()
+                if cleanup_task:
+                    # the cleanup still runs (it lowers the storage usage seen by the controllers), but none of the
+                    # tasks that failed would fit once it completes
+                    if not self.shared_storage.can_free(min_required_storage):
+                        stats.futile_cleanups += 1
+                    self.workflow.add_pending_task(cleanup_task)
+                if profile:
+                    self._phase_start = stats.add_phase(Phase.CLEANUP, self._phase_start)
+
+        # a controller is in overflow mode, thus tasks should be preempted
+        elif disk_controller_input < 0:
+            stats.overflow_steps += 1
+            preemption = self.preemption
+            preemption.start_round(self.current_time)
+            while diff_input < 0:
+                # the last running task is never preempted
+                if len(preemption) > 1:
+                    task, compute_resource, compute_unit = preemption.pop_victim()
+                    preempted_task = compute_resource.preempt_task(task, compute_unit)
+                    if preempted_task:
+                        self.workflow.preempt_task(preempted_task)
+                        diff_input += self.storage_estimation[preempted_task.transformation]
+                        changed_schedule = True
+                        num_tasks_preempted += 1
+                        stats.preempted_tasks += 1
+                        log.info("[PREEMPTED] %s", preempted_task)
+                else:
+                    break
 
-            print "[Time] %s\n%s" % (self.current_time, print_dictionary_ids(self.compute_resources))
+            log.debug("[%s] Tasks Preempted: %s", self.current_time, num_tasks_preempted)
+            if profile:
+                self._phase_start = stats.add_phase(Phase.PREEMPTION, self._phase_start, num_tasks_preempted)
 
-        print "\nWorkflow Makespan: %s\n" % self.current_time
+        stats.update_peaks(self.shared_storage.current_used_storage(),
+                           sum(cr.get_current_used_memory() for cr in self.compute_resources))
 
-    def _create_cleanup_task(self):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("[Time] %s\n%s", self.current_time, print_dictionary_ids(self.compute_resources))
+
+        return changed_schedule
+
+    def get_summary(self):
         """
-        Create cleanup task to removed unused (and not required) data from disk.
-        :return: cleanup task object
+        Get summary statistics of the simulation.
+        :return: dictionary of summary statistics
+        """
+        return {
+            'makespan': self.current_time,
+            'steps': self.stats.steps,
+            'completed_tasks': len([t for t in self.workflow.tasks.values() if t.status == TaskStatus.COMPLETED]),
+            'preempted_tasks': self.stats.preempted_tasks,
+            'overflow_steps': self.stats.overflow_steps,
+            'cleanup_tasks': self.cleanup_task_id - 1,
+            'peak_storage': self.stats.peak_storage,
+            'peak_memory': self.stats.peak_memory
+        }
+
+    def _get_eligible_resources(self, task):
+        """
+        Get the compute resources that accept a task.
+        :param task: task object
+        :return: list of compute resources
+        """
+        if task.type == TaskType.CLEANUP:
+            return self.compute_resources
+        return self.transformation_resources.get(task.transformation, [])
+
+    def _get_next_event_time(self, changed_schedule, sampling_period=None):
         """
-        current_used_files = []
+        Get the next time step in which the scheduler state may change. Time steps in between are skipped, since
+        the step loop would not process any task or controller during them.
+        :param changed_schedule: whether the schedule has changed in the current time step
+        :param sampling_period: controller sampling period (if any)
+        :return: next event time
+        """
+        next_time = self.current_time + 1
+        if changed_schedule:
+            return next_time
+
+        next_event_time = None
         for compute_resource in self.compute_resources:
-            current_used_files.extend(compute_resource.get_list_of_current_used_files())
+            end_time = compute_resource.get_next_end_time()
+            if end_time is not None:
+                end_time = max(next_time, int(math.ceil(end_time)))
+                if next_event_time is None or end_time < next_event_time:
+                    next_event_time = end_time
 
-        required_files = self._get_required_files()
-        for f in current_used_files:
-            if f not in required_files:
-                required_files.append(f)
+        if sampling_period:
+            sampling_time = (self.current_time // sampling_period + 1) * sampling_period
+            if next_event_time is None or sampling_time < next_event_time:
+                next_event_time = sampling_time
 
-        task_id = "cleanup_%s" % self.cleanup_task_id
-        cleanup_task = Task(task_id, 0, type=TaskType.CLEANUP)
+        if next_event_time is None:
+            raise SimulationStalled("[%s] Simulation stalled: there are no running tasks and the schedule has not "
+                                    "changed." % self.current_time)
 
-        total_size = 0
-        for f in self.shared_storage.files.values():
-            if f not in required_files:
-                cleanup_task.input_data[f.name] = f
-                total_size += f.size
+        return next_event_time
+
+    def _create_cleanup_task(self):
+        """
+        Create cleanup task to removed unused (and not required) data from disk. Only the orphan files of the
+        storage (files neither required by pending tasks nor used by running tasks) are visited.
+        :return: cleanup task object, or None if there is nothing to remove
+        """
+        # nothing can be freed
+        if self.shared_storage.orphan_size <= 0:
+            return None
 
+        # the duration is summed over the files (in storage order) rather than taken from the running orphan_size,
+        # whose rounding depends on the order in which files became orphans
+        input_data = self.shared_storage.get_orphans()
+        total_size = 0
+        for f in input_data:
+            total_size += f.size
         if total_size == 0:
             return None
 
+        task_id = "cleanup_%s" % self.cleanup_task_id
+        cleanup_task = Task(task_id, 0, type=TaskType.CLEANUP)
+        cleanup_task.input_data = FileSet(input_data)
+
         cleanup_task.duration = total_size * 10
         self.cleanup_task_id += 1
         # print cleanup_task
         return cleanup_task
-
-    def _get_required_files(self):
-        """
-        Get list of required files by pending tasks.
-        :return: list of required files
-        """
-        required_files = []
-        for task in self.workflow.pending_tasks.values():
-            for f in task.input_data.values():
-                if f not in required_files:
-                    required_files.append(f)
-
-        return required_files
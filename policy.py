@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import logging
+
+from collections import deque, OrderedDict
+from task import TaskType
+
+log = logging.getLogger(__name__)
+
+
+class SchedulingPolicy:
+    """
+    Queue of the tasks waiting to be scheduled, and order in which they are examined at every scheduling round.
+    A round starts with start_round(), then next_task() hands out every queued task at most once (a task that is
+    handed out and not placed stays in the queue for the next round). The storage and memory budgets only decrease
+    during a round, thus a task that does not fit the budgets can be discarded for the rest of the round.
+    """
+
+    def __init__(self):
+        # sequence number of the queue entry of each queued task (by task id)
+        self.queue = {}
+        # queue entries (sequence number, task) in queue order; entries of removed tasks are discarded lazily
+        self.entries = []
+        self.sequence = 0
+        self.storage_estimation = {}
+        self.memory_estimation = {}
+
+    def set_estimations(self, storage_estimation, memory_estimation):
+        """
+        Set the storage and memory estimations of each transformation.
+        :param storage_estimation: dictionary of storage estimation by transformation
+        :param memory_estimation: dictionary of memory estimation by transformation
+        """
+        self.storage_estimation = storage_estimation
+        self.memory_estimation = memory_estimation
+
+    def add_task(self, task):
+        """
+        Add a task to the end of the queue.
+        :param task: task object
+        """
+        self.sequence += 1
+        self.queue[task.id] = self.sequence
+        self.entries.append((self.sequence, task))
+
+    def remove_task(self, task):
+        """
+        Remove a task (e.g., once it has been placed) from the queue.
+        :param task: task object
+        """
+        del self.queue[task.id]
+
+    def get_tasks(self):
+        """
+        :return: list of queued tasks, in queue order
+        """
+        queue = self.queue
+        self.entries = [e for e in self.entries if queue.get(e[1].id) == e[0]]
+        return [task for _, task in self.entries]
+
+    def clear(self):
+        self.queue.clear()
+        self.entries = []
+
+    def start_round(self, rng):
+        """
+        Start a scheduling round over the tasks currently in the queue.
+        :param rng: random number generator of the scheduler
+        """
+        raise NotImplementedError()
+
+    def next_task(self, storage_budget=None, memory_budgets=None):
+        """
+        Get the next task to be examined in the current round.
+        :param storage_budget: remaining storage controller budget (None if the controllers are disabled)
+        :param memory_budgets: dictionary of remaining memory controller budget by compute resource
+        :return: task object, or None if the round is over
+        """
+        raise NotImplementedError()
+
+    def order_resources(self, task, compute_resources, memory_budgets=None):
+        """
+        Order the compute resources in which a task is tried (first fit by default).
+        :param task: task object
+        :param compute_resources: list of eligible compute resources
+        :param memory_budgets: dictionary of remaining memory controller budget by compute resource
+        :return: list of compute resources
+        """
+        return compute_resources
+
+    def __len__(self):
+        return len(self.queue)
+
+
+class RandomPolicy(SchedulingPolicy):
+    """
+    Tasks are examined in random order (the default policy), with the exact sequence of choices of random.choice()
+    over a list from which examined tasks are removed. In large rounds, the remaining tasks are kept in a Fenwick
+    tree over their queue positions, so each pick (and its removal) costs O(log Q) instead of O(Q).
+    """
+
+    # rounds with up to this number of tasks remove picked tasks from a list (cheaper than the tree when small)
+    TREE_THRESHOLD = 1024
+
+    def __init__(self):
+        SchedulingPolicy.__init__(self)
+        self.rng = None
+        self.candidates = []
+        self.tree = []
+        self.remaining = 0
+
+    def start_round(self, rng):
+        self.rng = rng
+        self.candidates = self.get_tasks()
+        self.remaining = len(self.candidates)
+        if self.remaining <= RandomPolicy.TREE_THRESHOLD:
+            self.tree = None
+        else:
+            # every position is present: each node counts the positions it covers
+            self.tree = [i & -i for i in range(0, self.remaining + 1)]
+
+    def next_task(self, storage_budget=None, memory_budgets=None):
+        if self.remaining == 0:
+            return None
+
+        if self.tree is None:
+            self.remaining -= 1
+            return self.candidates.pop(int(self.rng.random() * len(self.candidates)))
+
+        # same draw as random.choice()
+        rank = int(self.rng.random() * self.remaining) + 1
+
+        # find the position of the rank-th remaining task
+        size = len(self.candidates)
+        position = 0
+        step = 1
+        while step * 2 <= size:
+            step *= 2
+        while step > 0:
+            if position + step <= size and self.tree[position + step] < rank:
+                position += step
+                rank -= self.tree[position]
+            step //= 2
+
+        # remove it from the tree
+        i = position + 1
+        while i <= size:
+            self.tree[i] -= 1
+            i += i & -i
+        self.remaining -= 1
+
+        return self.candidates[position]
+
+
+class FIFOPolicy(SchedulingPolicy):
+    """
+    Tasks are examined in the order they became ready.
+    """
+
+    def __init__(self):
+        SchedulingPolicy.__init__(self)
+        self.candidates = deque()
+
+    def start_round(self, rng):
+        self.candidates = deque(self.get_tasks())
+
+    def next_task(self, storage_budget=None, memory_budgets=None):
+        if not self.candidates:
+            return None
+        return self.candidates.popleft()
+
+
+class LargestStorageFirstPolicy(SchedulingPolicy):
+    """
+    Tasks are examined by decreasing storage estimation (cleanup tasks first, ready order within a transformation).
+    Tasks are bucketed by transformation, since estimations are per transformation.
+    """
+
+    def __init__(self):
+        SchedulingPolicy.__init__(self)
+        self.buckets = []
+
+    def start_round(self, rng):
+        buckets = OrderedDict()
+        for task in self.get_tasks():
+            key = task.type if task.type == TaskType.CLEANUP else task.transformation
+            if key not in buckets:
+                buckets[key] = deque()
+            buckets[key].append(task)
+
+        # buckets are popped from the end of the list
+        self.buckets = sorted(buckets.items(), key=lambda b: (b[0] == TaskType.CLEANUP, self._get_storage(b[0])))
+
+    def next_task(self, storage_budget=None, memory_budgets=None):
+        while self.buckets:
+            tasks = self.buckets[-1][1]
+            if tasks:
+                return tasks.popleft()
+            self.buckets.pop()
+        return None
+
+    def _get_storage(self, transformation):
+        return self.storage_estimation.get(transformation, 0.0)
+
+    def _get_memory(self, transformation):
+        return self.memory_estimation.get(transformation, 0.0)
+
+
+class BestFitPolicy(LargestStorageFirstPolicy):
+    """
+    Tasks are packed into the remaining controller budgets: the next task is taken from the transformation that
+    leaves the smallest fraction of the storage budget unused (then of the memory budget of its best compute
+    resource), among those that fit both budgets. Cleanup tasks are examined first. Transformations that no longer
+    fit are discarded for the rest of the round. Compute resources are tried from the tightest memory fit.
+    """
+
+    def next_task(self, storage_budget=None, memory_budgets=None):
+        best = None
+        best_score = None
+        for i in range(len(self.buckets) - 1, -1, -1):
+            key, tasks = self.buckets[i]
+            if not tasks:
+                del self.buckets[i]
+                continue
+            if key == TaskType.CLEANUP:
+                return tasks.popleft()
+
+            score = self._get_score(tasks[0], storage_budget, memory_budgets)
+            if score is None:
+                del self.buckets[i]
+            elif best_score is None or score < best_score:
+                best, best_score = tasks, score
+
+        return best.popleft() if best else None
+
+    def order_resources(self, task, compute_resources, memory_budgets=None):
+        if not memory_budgets or task.type == TaskType.CLEANUP:
+            return compute_resources
+        memory = self._get_memory(task.transformation)
+        return sorted(compute_resources, key=lambda cr: (memory_budgets[cr] < memory, memory_budgets[cr] - memory))
+
+    def _get_score(self, task, storage_budget, memory_budgets):
+        """
+        Get the unused fractions of the storage and memory budgets if a task is placed.
+        :return: tuple of unused fractions, or None if the task does not fit
+        """
+        if storage_budget is None:
+            return -self._get_storage(task.transformation), 0.0
+
+        storage = self._get_storage(task.transformation)
+        if storage > storage_budget:
+            return None
+
+        memory = self._get_memory(task.transformation)
+        memory_fit = None
+        for cr, budget in memory_budgets.items():
+            if cr.accepts(task) and memory <= budget:
+                fit = (budget - memory) / budget if budget > 0 else 0.0
+                if memory_fit is None or fit < memory_fit:
+                    memory_fit = fit
+        if memory_fit is None:
+            return None
+
+        return (storage_budget - storage) / storage_budget, memory_fit
+
+
+# scheduling policies by name
+POLICIES = OrderedDict([
+    ("random", RandomPolicy),
+    ("fifo", FIFOPolicy),
+    ("largest-storage", LargestStorageFirstPolicy),
+    ("best-fit", BestFitPolicy)
+])
+
+
+def create_policy(name):
+    """
+    Create a scheduling policy by name.
+    :param name: policy name (random, fifo, largest-storage, or best-fit)
+    :return: scheduling policy object
+    """
+    if name not in POLICIES:
+        raise ValueError("Unknown scheduling policy: %s (available: %s)" % (name, ", ".join(POLICIES)))
+    return POLICIES[name]()
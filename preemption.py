@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import heapq
+import logging
+
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class PreemptionPolicy:
+    """
+    Index of the running (non-cleanup) tasks that may be preempted when the storage controller is in overflow mode,
+    ordered by a preemption criterion. Ties are broken by compute resource order and then by compute unit id, which
+    is the order in which running tasks used to be scanned. Static criteria keep a persistent heap (entries of
+    finished or preempted tasks are discarded lazily); dynamic criteria, whose order depends on the current time,
+    rebuild the heap at the start of every preemption round.
+    """
+
+    # whether the order of running tasks depends on the current time
+    dynamic = False
+
+    def __init__(self):
+        # entry (order, sequence, compute resource, compute unit, task) of each running task (by task id)
+        self.running = {}
+        # heap of (key, order, sequence, entry)
+        self.heap = []
+        self.sequence = 0
+        self.storage_estimation = {}
+
+    def set_estimations(self, storage_estimation):
+        """
+        Set the storage estimation of each transformation.
+        :param storage_estimation: dictionary of storage estimation by transformation
+        """
+        self.storage_estimation = storage_estimation
+
+    def add_task(self, task, order, compute_resource, compute_unit):
+        """
+        Add a task that has started running.
+        :param task: task object
+        :param order: index of the compute resource in the scheduler
+        :param compute_resource: compute resource running the task
+        :param compute_unit: compute unit running the task
+        """
+        self.sequence += 1
+        entry = ((order, compute_unit.id), self.sequence, compute_resource, compute_unit, task)
+        self.running[task.id] = entry
+        if not self.dynamic:
+            heapq.heappush(self.heap, (self.get_key(task, None),) + entry[:2] + (entry,))
+            # discard the entries of tasks that are no longer running once they dominate the heap
+            if len(self.heap) > 2 * len(self.running) + 64:
+                self.heap = [e for e in self.heap if self.running.get(e[3][4].id) is e[3]]
+                heapq.heapify(self.heap)
+
+    def remove_task(self, task):
+        """
+        Remove a task that has finished or has been preempted.
+        :param task: task object
+        """
+        self.running.pop(task.id, None)
+
+    def clear(self):
+        self.running.clear()
+        self.heap = []
+
+    def start_round(self, current_time):
+        """
+        Start a preemption round.
+        :param current_time: current simulation time
+        """
+        if self.dynamic:
+            self.heap = [(self.get_key(e[4], current_time),) + e[:2] + (e,) for e in self.running.values()]
+            heapq.heapify(self.heap)
+
+    def pop_victim(self):
+        """
+        Get the next task to be preempted, and remove it from the index.
+        :return: tuple of (task, compute resource, compute unit), or None if no task is running
+        """
+        while self.heap:
+            entry = heapq.heappop(self.heap)[3]
+            task = entry[4]
+            if self.running.get(task.id) is entry:
+                del self.running[task.id]
+                return task, entry[2], entry[3]
+        return None
+
+    def get_key(self, task, current_time):
+        """
+        Get the preemption key of a running task (tasks with the lowest key are preempted first).
+        :param task: task object
+        :param current_time: current simulation time (None for static criteria)
+        :return: key
+        """
+        raise NotImplementedError()
+
+    def __len__(self):
+        return len(self.running)
+
+
+class LatestStartedPreemption(PreemptionPolicy):
+    """
+    The latest started task is preempted first (the default criterion).
+    """
+
+    def get_key(self, task, current_time):
+        return -task.start_time
+
+
+class LeastProgressPreemption(PreemptionPolicy):
+    """
+    The task with the smallest completed fraction of its duration is preempted first.
+    """
+    dynamic = True
+
+    def get_key(self, task, current_time):
+        if task.duration <= 0:
+            return 1.0
+        return (current_time - task.start_time) / task.duration
+
+
+class StorageReleasedPreemption(PreemptionPolicy):
+    """
+    The task that releases the largest storage estimation per unit of wasted work (time it has been running) is
+    preempted first.
+    """
+    dynamic = True
+
+    def get_key(self, task, current_time):
+        return -self.storage_estimation.get(task.transformation, 0.0) / max(current_time - task.start_time, 1.0)
+
+
+# preemption criteria by name
+PREEMPTIONS = OrderedDict([
+    ("latest-started", LatestStartedPreemption),
+    ("least-progress", LeastProgressPreemption),
+    ("storage-released", StorageReleasedPreemption)
+])
+
+
+def create_preemption(name):
+    """
+    Create a preemption policy by name.
+    :param name: preemption criterion name (latest-started, least-progress, or storage-released)
+    :return: preemption policy object
+    """
+    if name not in PREEMPTIONS:
+        raise ValueError("Unknown preemption criterion: %s (available: %s)" % (name, ", ".join(PREEMPTIONS)))
+    return PREEMPTIONS[name]()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import logging
+import sys
+
+from array import array
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class TelemetryRecorder:
+    """
+    Records per-step controller and resource samples into preallocated numeric arrays (one per column). Only the
+    time steps in which the scheduler evaluates the controllers are recorded, thus samples should be read as a step
+    function of the time column. Recorded data is saved as a typed binary file (columns stored one after the other)
+    and a CSV file describing the columns.
+    """
+
+    def __init__(self, compute_resources, capacity=1024):
+        """
+
+        :param compute_resources: list of compute resources to be recorded
+        :param capacity: initial number of samples allocated per column
+        """
+        self.compute_resources = compute_resources
+        self.resource_ids = [cr.id for cr in compute_resources]
+        self.capacity = max(1, capacity)
+        self.size = 0
+        self.columns = OrderedDict()
+        self._add_column("time", "l")
+        self._add_column("disk_controller_input", "d")
+        self._add_column("shared_storage_used", "d")
+        self._add_column("queued_tasks", "l")
+        self._add_column("running_tasks", "l")
+        for resource_id in self.resource_ids:
+            self._add_column("memory_used[%s]" % resource_id, "d")
+            self._add_column("mem_controller_input[%s]" % resource_id, "d")
+        self._column_list = list(self.columns.values())
+
+    def record(self, time, disk_controller_input, shared_storage_used, queued_tasks, mem_controllers):
+        """
+        Append a sample.
+        :param time: simulation time
+        :param disk_controller_input: disk controller input
+        :param shared_storage_used: shared storage usage
+        :param queued_tasks: number of queued tasks
+        :param mem_controllers: dictionary of memory controller inputs per compute resource
+        """
+        if self.size == self.capacity:
+            self._grow()
+
+        i = self.size
+        columns = self._column_list
+        columns[0][i] = time
+        columns[1][i] = disk_controller_input
+        columns[2][i] = shared_storage_used
+        columns[3][i] = queued_tasks
+
+        running_tasks = 0
+        c = 5
+        for cr in self.compute_resources:
+            running_tasks += len(cr.compute_units) - len(cr.idle_units)
+            columns[c][i] = cr.memory['capacity'] - cr.memory['available']
+            columns[c + 1][i] = mem_controllers.get(cr, 0.0)
+            c += 2
+        columns[4][i] = running_tasks
+        self.size += 1
+
+    def get_column(self, name):
+        """
+        Get the recorded samples of a column.
+        :param name: column name
+        :return: array of samples
+        """
+        return self.columns[name][:self.size]
+
+    def save(self, prefix):
+        """
+        Write the recorded samples to <prefix>.bin and the column descriptions to <prefix>.csv.
+        :param prefix: output file prefix
+        """
+        offset = 0
+        with open(prefix + ".bin", "wb") as data_file, open(prefix + ".csv", "w") as header_file:
+            header_file.write("# byteorder,%s\n" % sys.byteorder)
+            header_file.write("name,typecode,itemsize,offset,length\n")
+            for name, values in self.columns.items():
+                values[:self.size].tofile(data_file)
+                header_file.write("%s,%s,%s,%s,%s\n" % (name, values.typecode, values.itemsize, offset, self.size))
+                offset += values.itemsize * self.size
+
+        log.info("Telemetry (%s samples) written to %s.bin", self.size, prefix)
+
+    @staticmethod
+    def load(prefix):
+        """
+        Read samples saved by save().
+        :param prefix: input file prefix
+        :return: ordered dictionary of column name to array of samples
+        """
+        columns = OrderedDict()
+        byteorder = sys.byteorder
+
+        with open(prefix + ".bin", "rb") as data_file, open(prefix + ".csv") as header_file:
+            for line in header_file:
+                l = line.strip()
+                if l.startswith("# byteorder,"):
+                    byteorder = l.split(",")[1]
+                    continue
+                if len(l) == 0 or l.startswith("#") or l.startswith("name,"):
+                    continue
+                name, typecode, itemsize, offset, length = l.rsplit(",", 4)
+                values = array(typecode)
+                data_file.seek(int(offset))
+                values.fromfile(data_file, int(length))
+                if byteorder != sys.byteorder:
+                    values.byteswap()
+                columns[name] = values
+
+        return columns
+
+    def _add_column(self, name, typecode):
+        self.columns[name] = array(typecode, [0]) * self.capacity
+
+    def _grow(self):
+        for values in self._column_list:
+            values.extend(array(values.typecode, [0]) * self.capacity)
+        self.capacity *= 2
@@ -17,7 +17,10 @@
 #
 __author__ = "Rafael Ferreira da Silva"
 
+import heapq
+
 from controller import *
+from file import FileReferences
 from task import *
 
 log = logging.getLogger(__name__)
@@ -29,7 +32,14 @@ class ResourceStatus:
 
 
 class InsufficientSpace(Exception):
-    pass
+    def __init__(self, message, required_storage=0):
+        """
+
+        :param message: error message
+        :param required_storage: storage required by the task that could not be placed
+        """
+        Exception.__init__(self, message)
+        self.required_storage = required_storage
 
 
 class InsufficientMemory(Exception):
@@ -47,7 +57,7 @@ class ComputeResource:
         :param memory_capacity:
         """
         self.id = id
-        self.accepted_tasks = accepted_tasks
+        self.accepted_tasks = set(accepted_tasks)
         self.shared_storage = shared_storage
         if local_storage_capacity > 0:
             self.local_storage = Storage(local_storage_capacity)
@@ -58,7 +68,14 @@ class ComputeResource:
             'available': int(memory_capacity)
         }
         self.compute_units = {}
+        # min-heap of idle compute unit ids
+        self.idle_units = []
         self.mem_controller = None
+        # min-heap of (end_time, sequence, compute_unit, task) for running tasks, entries of preempted tasks are
+        # lazily discarded
+        self.running_heap = []
+        self.running_sequence = 0
+        self.file_references = FileReferences()
 
     def generate_compute_units(self, compute_units=20):
         """
@@ -69,45 +86,145 @@ class ComputeResource:
         for i in range(0, compute_units):
             self.compute_units[i] = ComputeUnit(i)
 
-    def run_task(self, task):
+        self.idle_units = [cu.id for cu in self.compute_units.values() if cu.status == ResourceStatus.IDLE]
+        heapq.heapify(self.idle_units)
+
+    def reset(self):
+        """
+        Release all compute units, memory, and local storage, so the resource can be used in a new simulation.
+        """
+        self.memory['available'] = self.memory['capacity']
+        for cu in self.compute_units.values():
+            cu.status = ResourceStatus.IDLE
+            cu.current_task = None
+        self.idle_units = sorted(self.compute_units)
+        self.running_heap = []
+        self.running_sequence = 0
+        if self.local_storage:
+            self.local_storage.reset()
+
+    def get_state(self):
+        """
+        Capture the per-run state of the resource: available memory, the task running in each compute unit, and
+        the local storage contents.
+        :return: resource state (tuple)
+        """
+        running = tuple(cu.current_task.id if cu.current_task else None
+                        for _, cu in sorted(self.compute_units.items()))
+        local_storage = self.local_storage.get_state() if self.local_storage else None
+        return self.memory['available'], running, local_storage
+
+    def set_state(self, state, tasks):
+        """
+        Restore a per-run state captured by get_state() from this resource or from a clone of it.
+        :param state: resource state (tuple)
+        :param tasks: dictionary of pending tasks (by id) in which running tasks are looked up
+        """
+        available_memory, running, local_storage = state
+        self.memory['available'] = available_memory
+        self.idle_units = []
+        self.running_heap = []
+        for (cu_id, cu), task_id in zip(sorted(self.compute_units.items()), running):
+            if task_id is None:
+                cu.status = ResourceStatus.IDLE
+                cu.current_task = None
+                self.idle_units.append(cu_id)
+            else:
+                task = tasks[task_id]
+                cu.run_task(task)
+                self.running_heap.append((task.end_time, self.running_sequence, cu, task))
+                self.running_sequence += 1
+        heapq.heapify(self.running_heap)
+        if self.local_storage:
+            self.local_storage.set_state(local_storage)
+
+    def clone(self, shared_storage):
+        """
+        Create an idle resource with the same configuration and compute units.
+        :param shared_storage: shared storage of the new resource
+        :return: compute resource object
+        """
+        cr = ComputeResource(self.id, self.accepted_tasks, shared_storage,
+                             self.local_storage.capacity if self.local_storage else 0, self.memory['capacity'])
+        cr.generate_compute_units(len(self.compute_units))
+        return cr
+
+    def accepts(self, task):
+        """
+        Whether tasks of a given transformation are allowed to run in this compute resource.
+        :param task: task object
+        :return: True if the task can run in this resource
+        """
+        return task.type == TaskType.CLEANUP or task.transformation in self.accepted_tasks
+
+    def run_task(self, task, current_time):
         """
         Try to schedule a task to a computing node. This method verifies if the task is allowed to run in the
         current compute resource, and if there is enough storage and memory available.
         :param task: task object
+        :param current_time: simulation time in which the task starts
         :return: compute resource where the task has been scheduled
         """
-        if task.transformation not in self.accepted_tasks and task.type != TaskType.CLEANUP:
+        if not self.accepts(task) or not self.idle_units:
             return None
 
-        for compute_unit in self.compute_units.values():
-            if compute_unit.status == ResourceStatus.IDLE:
-
-                if task.type != TaskType.CLEANUP:
-                    # evaluate disk and memory requirements
-                    required_storage = self._get_required_storage(task)
-
-                    if (self.local_storage and self.local_storage.available < required_storage) \
-                            or self.shared_storage.available < required_storage:
-                        # insufficient disk space in local and shared storage
-                        raise InsufficientSpace("Required storage (%s) is more than available space (%s)."
-                                                % (required_storage, self.shared_storage.available))
-
-                    if self.memory['available'] < task.peak_memory:
-                        raise InsufficientMemory("[%s] Required memory (%s) is more than available memory (%s)."
-                                                 % (self.id, task.peak_memory, self.memory['available']))
-
-                    # add task files to storage
-                    self._add_to_storage(task.input_data)
-                    self._add_to_storage(task.intermediate_data)
-                    self._add_to_storage(task.output_data)
-
-                    # memory usage
-                    self.memory['available'] -= task.peak_memory
+        if task.type != TaskType.CLEANUP:
+            # evaluate disk and memory requirements
+            required_storage = self._get_required_storage(task)
+
+            if (self.local_storage and self.local_storage.available < required_storage) \
+                    or self.shared_storage.available < required_storage:
+                # insufficient disk space in local and shared storage
+                raise InsufficientSpace("Required storage (%s) is more than available space (%s)."
+                                        % (required_storage, self.shared_storage.available), required_storage)
+
+            if self.memory['available'] < task.peak_memory:
+                raise InsufficientMemory("[%s] Required memory (%s) is more than available memory (%s)."
+                                         % (self.id, task.peak_memory, self.memory['available']))
+
+            # add task files to storage
+            self._add_to_storage(task.input_data)
+            self._add_to_storage(task.intermediate_data)
+            self._add_to_storage(task.output_data)
+
+            # memory usage
+            self.memory['available'] -= task.peak_memory
+
+        # run the task in the idle compute unit with the lowest id
+        compute_unit = self.compute_units[heapq.heappop(self.idle_units)]
+        compute_unit.run_task(task)
+        self.file_references.add_running_task(task)
+        task.run(current_time)
+        heapq.heappush(self.running_heap, (task.end_time, self.running_sequence, compute_unit, task))
+        self.running_sequence += 1
+
+        return compute_unit
+
+    def pop_finished_compute_units(self, current_time):
+        """
+        Get the compute units whose running task has finished by the current time.
+        :param current_time: current simulation time
+        :return: list of compute units (sorted by id) running finished tasks
+        """
+        finished_compute_units = []
+        while self.running_heap and self.running_heap[0][0] <= current_time:
+            end_time, _, compute_unit, task = heapq.heappop(self.running_heap)
+            if compute_unit.current_task is task and task.end_time == end_time:
+                finished_compute_units.append(compute_unit)
 
-                # run the task
-                compute_unit.run_task(task)
+        finished_compute_units.sort(key=lambda cu: cu.id)
+        return finished_compute_units
 
-                return compute_unit
+    def get_next_end_time(self):
+        """
+        Get the earliest end time of the tasks currently running in this resource.
+        :return: earliest end time, or None if no task is running
+        """
+        while self.running_heap:
+            end_time, _, compute_unit, task = self.running_heap[0]
+            if compute_unit.current_task is task and task.end_time == end_time:
+                return end_time
+            heapq.heappop(self.running_heap)
         return None
 
     def process_finished_task(self, compute_unit):
@@ -117,26 +234,44 @@ class ComputeResource:
         :return:
         """
         self.memory['available'] += compute_unit.current_task.peak_memory
+        self.file_references.remove_running_task(compute_unit.current_task)
         self._clean_files(compute_unit.current_task)
         compute_unit.process_finished_task()
+        heapq.heappush(self.idle_units, compute_unit.id)
 
-    def preempt_task(self, task, required_files):
+    def preempt_task(self, task, compute_unit=None):
         """
-        Preempt a task and remove its files.
+        Preempt a task and remove its files. Files required by pending tasks are not removed.
         :param task: task to be preempted
-        :param required_files: list of files that should not be removed during preemption
+        :param compute_unit: compute unit running the task (looked up if not given)
         :return: preempted task
         """
-        # find the compute node where the task is running
-        cu_to_preempt = None
-        for compute_unit in self.compute_units.values():
-            if compute_unit.current_task == task:
-                compute_unit.preempt_task()
-                self._clean_files(task, required_files)
-                self.memory['available'] += task.peak_memory
-                return task
+        if compute_unit is None:
+            # find the compute node where the task is running
+            for cu in self.compute_units.values():
+                if cu.current_task == task:
+                    compute_unit = cu
+                    break
+        if compute_unit is None or compute_unit.current_task is not task:
+            return None
 
-        return None
+        compute_unit.preempt_task()
+        heapq.heappush(self.idle_units, compute_unit.id)
+        self.file_references.remove_running_task(task)
+        self._clean_files(task, keep_required=True)
+        self.memory['available'] += task.peak_memory
+        return task
+
+    def set_file_references(self, file_references):
+        """
+        Set the file reference index shared with the workflow and the other compute resources.
+        :param file_references: file references object
+        """
+        self.file_references = file_references
+        if self.shared_storage:
+            file_references.add_storage(self.shared_storage)
+        if self.local_storage:
+            file_references.add_storage(self.local_storage)
 
     def get_list_of_current_used_files(self):
         """
@@ -144,13 +279,15 @@ class ComputeResource:
         :return: list of current used files
         """
         required_files = []
+        file_ids = set()
         for cu in self.compute_units.values():
             if cu.status == ResourceStatus.BUSY:
                 if cu.current_task.type == TaskType.CLEANUP:
                     continue
                 for l in [cu.current_task.input_data, cu.current_task.intermediate_data, cu.current_task.output_data]:
                     for f in l.values():
-                        if f not in required_files:
+                        if f.id not in file_ids:
+                            file_ids.add(f.id)
                             required_files.append(f)
 
         return required_files
@@ -199,8 +336,8 @@ class ComputeResource:
         required_storage = 0
         for l in [task.input_data, task.intermediate_data, task.output_data]:
             for f in l.values():
-                if (self.local_storage and f.name not in self.local_storage.files) \
-                        or f.name not in self.shared_storage.files:
+                if (self.local_storage and f.id not in self.local_storage.files) \
+                        or f.id not in self.shared_storage.files:
                     required_storage += f.size
 
         return required_storage
@@ -210,19 +347,18 @@ class ComputeResource:
         Add files to local (priority) or shared storage.
         :param files_list: list of files
         """
+        storage = self.shared_storage
+        if self.local_storage:
+            storage = self.local_storage
         for f in files_list.values():
-            storage = self.shared_storage
-            if self.local_storage:
-                storage = self.local_storage
-            if f.name not in storage.files:
-                storage.files[f.name] = f
-                storage.available -= f.size
+            storage.add_file(f)
 
-    def _clean_files(self, task, required_files=None):
+    def _clean_files(self, task, keep_required=False):
         """
-        Only remove files that are not used by current tasks.
+        Only remove files that are not used by current running tasks. The task itself should no longer be
+        counted as running in the file reference index.
         :param task: task object
-        :param required_files: list of required files that should not be removed
+        :param keep_required: whether files required by pending tasks should not be removed
         """
         tasks_to_be_removed = []
         tasks_to_be_removed.extend(task.input_data.values())
@@ -230,36 +366,17 @@ class ComputeResource:
         if task.type != TaskType.CLEANUP:
             tasks_to_be_removed.extend(task.intermediate_data.values())
 
-        # do not remove files required by pending tasks
-        if required_files:
-            for f in required_files:
-                if f in tasks_to_be_removed:
-                    tasks_to_be_removed.remove(f)
-
-        # do not remove files required by current running tasks
-        for cu in self.compute_units.values():
-            if cu.status == ResourceStatus.BUSY:
-                if cu.current_task.type == TaskType.CLEANUP or cu.current_task.id == task.id:
-                    continue
-                for l in [cu.current_task.input_data, cu.current_task.intermediate_data, cu.current_task.output_data]:
-                    for f in l.values():
-                        if f in tasks_to_be_removed:
-                            tasks_to_be_removed.remove(f)
-
         # remove files
         for f in tasks_to_be_removed:
-            if self.local_storage and f in self.local_storage.files.values():
-                self.local_storage.available += f.size
-                del self.local_storage.files[f.name]
+            # do not remove files required by pending tasks or by current running tasks
+            if self.file_references.is_used(f) or (keep_required and self.file_references.is_required(f)):
+                continue
 
-            elif f in self.shared_storage.files.values():
-                self.shared_storage.available += f.size
-                del self.shared_storage.files[f.name]
-                # print "REMOVED FROM SHARED: %s" % f
+            if self.local_storage and f.id in self.local_storage.files:
+                self.local_storage.remove_file(f)
 
-                # if required_files:
-                #     print "[Required files] %s" % print_dictionary_ids(required_files)
-                # print "[Files to be removed] %s" % print_dictionary_ids(tasks_to_be_removed)
+            elif f.id in self.shared_storage.files:
+                self.shared_storage.remove_file(f)
 
     def __str__(self):
         """
@@ -276,7 +393,7 @@ class ComputeResource:
             str += "  shared storage:\n"
             str += "    capacity: %s\n" % self.shared_storage.capacity
             str += "    available: %s\n" % self.shared_storage.available
-            str += "    files: (%s)\n" % print_dictionary_ids(self.shared_storage.files)
+            str += "    files: (%s)\n" % ", ".join(f.name for f in self.shared_storage.files.values())
         str += "  memory:\n"
         str += "    capacity: %s\n" % self.memory['capacity']
         str += "    available: %s\n" % self.memory['available']
@@ -288,7 +405,9 @@ class ComputeResource:
         return str
 
 
-class ComputeUnit:
+class ComputeUnit(object):
+    __slots__ = ("id", "status", "current_task")
+
     def __init__(self, id):
         self.id = id
         self.status = ResourceStatus.IDLE
@@ -315,11 +434,123 @@ class ComputeUnit:
         return "CU: {id: %s, status: %s, current_task_id: %s}" % (self.id, self.status, current_task_id)
 
 
-class Storage:
+class Storage(object):
+    """
+    Storage of files, which keeps track of its orphan files: resident files that are neither required by pending
+    tasks nor used by running tasks (i.e., files a cleanup task can remove), and of their total size.
+    """
+    __slots__ = ("capacity", "available", "files", "orphans", "orphan_size", "file_references")
+
     def __init__(self, capacity):
         self.capacity = capacity
         self.available = capacity
+        # stored files, by file id
+        self.files = {}
+        # stored files that are not referenced, by file id
+        self.orphans = {}
+        self.orphan_size = 0.0
+        self.file_references = None
+
+    def set_file_references(self, file_references):
+        """
+        Set the file reference index that notifies this storage of reference changes (see
+        FileReferences.add_storage()).
+        :param file_references: file references object
+        """
+        self.file_references = file_references
+        self.update_orphans()
+
+    def reset(self):
+        """
+        Remove all files from the storage.
+        """
+        self.available = self.capacity
         self.files = {}
+        self.orphans = {}
+        self.orphan_size = 0.0
+
+    def add_file(self, file):
+        """
+        Store a file (if it is not stored yet).
+        :param file: file object
+        """
+        if file.id not in self.files:
+            self.files[file.id] = file
+            self.available -= file.size
+            if self.file_references and not self.file_references.is_referenced(file):
+                self.orphans[file.id] = file
+                self.orphan_size += file.size
+
+    def remove_file(self, file):
+        """
+        Remove a stored file.
+        :param file: file object
+        """
+        del self.files[file.id]
+        self.available += file.size
+        self.discard_orphan(file)
+
+    def add_orphan(self, file):
+        """
+        Notify that a file is no longer referenced.
+        :param file: file object
+        """
+        if file.id in self.files and file.id not in self.orphans:
+            self.orphans[file.id] = file
+            self.orphan_size += file.size
+
+    def discard_orphan(self, file):
+        """
+        Notify that a file is referenced again (or has been removed).
+        :param file: file object
+        """
+        if self.orphans.pop(file.id, None) is not None:
+            self.orphan_size -= file.size
+            if not self.orphans:
+                # do not accumulate rounding errors
+                self.orphan_size = 0.0
+
+    def update_orphans(self):
+        """
+        Rebuild the orphan files from the stored files and the file reference index.
+        """
+        self.orphans = {}
+        self.orphan_size = 0.0
+        if self.file_references:
+            for f in self.files.values():
+                if not self.file_references.is_referenced(f):
+                    self.orphans[f.id] = f
+                    self.orphan_size += f.size
+
+    def get_orphans(self):
+        """
+        :return: list of stored files that are not referenced
+        """
+        return list(self.orphans.values())
+
+    def can_free(self, size):
+        """
+        Whether removing the orphan files would leave at least a given amount of available space.
+        :param size: required amount of space
+        :return: True if enough space can be made available
+        """
+        return self.available + self.orphan_size >= size
+
+    def get_state(self):
+        """
+        Capture the storage contents.
+        :return: storage state (tuple)
+        """
+        return self.available, tuple(self.files.values())
+
+    def set_state(self, state):
+        """
+        Restore the storage contents captured by get_state(). The file reference index should be restored first.
+        :param state: storage state (tuple)
+        """
+        self.available, files = state
+        self.files = dict((f.id, f) for f in files)
+        self.update_orphans()
 
     def current_used_storage(self):
         """
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+
+from array import array
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# version of the cache key and entry formats (bump it whenever the simulation results change)
+CACHE_VERSION = 2
+
+# default cache size bound (bytes)
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+def describe_platform(shared_storage, compute_resources):
+    """
+    Describe the simulated platform (as used in cache keys).
+    :param shared_storage: shared storage
+    :param compute_resources: list of compute resources
+    :return: list of platform properties
+    """
+    resources = []
+    for cr in compute_resources:
+        resources.append([cr.id, sorted(cr.accepted_tasks), cr.memory['capacity'], len(cr.compute_units),
+                          cr.local_storage.capacity if cr.local_storage else 0])
+    return [shared_storage.capacity, resources]
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of simulation results. Keys are hashes of everything a simulation depends on
+    (workflow structure, PID configuration, estimation tables, platform, seed, and scheduling options), and values
+    are the simulation summary (None for simulations that stall) and, optionally, the recorded telemetry. Entries
+    are json files written atomically (temporary file, then rename), thus concurrent worker processes never read
+    partial entries. The total size of the entries is bounded: once it is exceeded, the least recently used
+    entries are evicted (hits refresh the entry modification time). Writes and evictions are serialized across
+    processes with a lock file.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        """
+
+        :param directory: cache directory (created if needed)
+        :param max_size: bound of the total size of the entries (bytes)
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    @staticmethod
+    def key(workflow_digest, config, storage_estimation, memory_estimation, platform, seed, **options):
+        """
+        Compute the key of a simulation.
+        :param workflow_digest: hash of the workflow structure (see CompiledWorkflow.digest())
+        :param config: dictionary of PID configuration parameters
+        :param storage_estimation: dictionary of storage estimation by transformation
+        :param memory_estimation: dictionary of memory estimation by transformation
+        :param platform: platform description (see describe_platform())
+        :param seed: seed of the simulation
+        :param options: other options the results depend on (e.g., enable_pid, policy)
+        :return: hexadecimal key
+        """
+        description = {
+            'version': CACHE_VERSION,
+            'workflow': workflow_digest,
+            'config': config,
+            'storage_estimation': storage_estimation,
+            'memory_estimation': memory_estimation,
+            'platform': platform,
+            'seed': seed,
+            'options': options
+        }
+        return hashlib.sha1(json.dumps(description, sort_keys=True)).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a simulation result.
+        :param key: simulation key
+        :return: tuple of (summary, telemetry), or None if the result is not cached; telemetry is an ordered
+                 dictionary of column name to array of samples (None if it was not recorded)
+        """
+        path = self._get_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            # refresh the entry for the LRU eviction
+            os.utime(path, None)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except ValueError as e:
+            log.warning("Unable to read cache entry %s: %s", path, e)
+            self.misses += 1
+            return None
+
+        if entry.get('key') != key:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        telemetry = None
+        if entry.get('telemetry') is not None:
+            telemetry = OrderedDict((str(name), array(str(typecode), values))
+                                    for name, typecode, values in entry['telemetry'])
+        return entry['summary'], telemetry
+
+    def put(self, key, summary, recorder=None):
+        """
+        Store a simulation result.
+        :param key: simulation key
+        :param summary: dictionary of summary statistics (None for a simulation that has stalled)
+        :param recorder: telemetry recorder of the simulation (optional)
+        """
+        entry = {'key': key, 'summary': summary, 'telemetry': None}
+        if recorder is not None:
+            entry['telemetry'] = [[name, values.typecode, values[:recorder.size].tolist()]
+                                  for name, values in recorder.columns.items()]
+        data = json.dumps(entry, sort_keys=True)
+
+        path = self._get_path(key)
+        try:
+            os.mkdir(os.path.dirname(path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        tmp_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write(data)
+
+        with self._lock():
+            size = self._read_size()
+            if os.path.exists(path):
+                size -= os.path.getsize(path)
+            os.rename(tmp_path, path)
+            size += len(data)
+            if size > self.max_size:
+                size = self._evict()
+            self._write_size(size)
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        with self._lock():
+            for path, _, _ in self._entries():
+                os.remove(path)
+            self._write_size(0)
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _entries(self):
+        """
+        :return: list of (path, size, modification time) of the cache entries
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            subdirectory = os.path.join(self.directory, name)
+            if len(name) != 2 or not os.path.isdir(subdirectory):
+                continue
+            for entry_name in os.listdir(subdirectory):
+                if entry_name.endswith(".json"):
+                    path = os.path.join(subdirectory, entry_name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the total size is below 90% of the bound (so evictions are
+        not triggered at every write). The lock should be held.
+        :return: total size of the remaining entries
+        """
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        size = sum(e[1] for e in entries)
+        target = 0.9 * self.max_size
+        evicted = 0
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+            evicted += 1
+        log.debug("Evicted %s cache entries (%s bytes left)", evicted, size)
+        return size
+
+    def _lock(self):
+        return _FileLock(os.path.join(self.directory, "lock"))
+
+    def _read_size(self):
+        """
+        :return: total size of the entries, as recorded by the last write (rebuilt if missing)
+        """
+        try:
+            with open(os.path.join(self.directory, "size")) as f:
+                return int(f.read())
+        except (IOError, ValueError):
+            return sum(e[1] for e in self._entries())
+
+    def _write_size(self, size):
+        path = os.path.join(self.directory, "size")
+        with open(path + ".tmp", "w") as f:
+            f.write("%d" % size)
+        os.rename(path + ".tmp", path)
+
+
+class _FileLock:
+    """
+    Exclusive lock on a file, shared by all processes (context manager).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a")
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import argparse
+import json
+import logging
+
+from estimator import create_estimator
+from pid_scheduler import MEMORY_ESTIMATION, STORAGE_ESTIMATION, PIDConfiguration, PIDScheduler
+from resource import ComputeResource, Storage
+from task import TaskTransformation
+
+log = logging.getLogger(__name__)
+
+# default platform: shared storage capacity and compute resources
+DEFAULT_STORAGE_CAPACITY = 500000
+
+DEFAULT_COMPUTE_RESOURCES = [
+    # Large cluster, 2TB RAM, 32 cores
+    {'id': "cluster-large", 'accepted_tasks': [TaskTransformation.INDIVIDUALS], 'memory_capacity': 2000000,
+     'compute_units': 32},
+    # Intermediate cluster, 192GB RAM, 16 cores
+    {'id': "cluster-intermediate", 'accepted_tasks': [TaskTransformation.SIFTING], 'memory_capacity': 192000,
+     'compute_units': 16},
+    # Small cluster, 64GB RAM, 32 cores
+    {'id': "cluster-small", 'accepted_tasks': [TaskTransformation.POPULATION, TaskTransformation.PAIR,
+                                               TaskTransformation.FREQUENCY],
+     'memory_capacity': 100000, 'compute_units': 32}
+]
+
+SECTIONS = ["name", "shared_storage", "compute_resources", "controllers", "storage_estimation", "memory_estimation"]
+
+RESOURCE_PROPERTIES = ["id", "accepted_tasks", "memory_capacity", "compute_units", "local_storage_capacity"]
+
+
+class Scenario:
+    """
+    Description of a simulated scenario: shared storage, compute resources, PID controllers configuration, and
+    storage and memory estimation tables. A scenario is validated once, when it is created, and it is never modified
+    by the simulations, thus any number of platforms and schedulers can be instantiated from it in the same process
+    (e.g., against clones of a single parsed workflow).
+    """
+
+    def __init__(self, storage_capacity=DEFAULT_STORAGE_CAPACITY, compute_resources=None, config=None,
+                 storage_estimation=None, memory_estimation=None, name=None):
+        """
+
+        :param storage_capacity: shared storage capacity
+        :param compute_resources: list of compute resource descriptions (dictionaries with id, accepted_tasks,
+                                  memory_capacity, compute_units, and optionally local_storage_capacity)
+        :param config: PID controllers configuration (defaults to the module constants); its storage capacity is
+                       always the shared storage capacity of the scenario
+        :param storage_estimation: dictionary of storage estimation by transformation
+        :param memory_estimation: dictionary of memory estimation by transformation
+        :param name: scenario name
+        """
+        self.name = name
+        self.storage_capacity = storage_capacity
+        self.compute_resources = [_resource(r, i) for i, r in
+                                  enumerate(compute_resources if compute_resources is not None
+                                            else DEFAULT_COMPUTE_RESOURCES)]
+        self.config = _derive_config(config or PIDConfiguration(), storage_capacity)
+        self.storage_estimation = _estimation(storage_estimation if storage_estimation is not None
+                                              else STORAGE_ESTIMATION, "storage_estimation")
+        self.memory_estimation = _estimation(memory_estimation if memory_estimation is not None
+                                             else MEMORY_ESTIMATION, "memory_estimation")
+        self.validate()
+
+    def validate(self):
+        """
+        Check the consistency of the scenario.
+        """
+        _check_number(self.storage_capacity, "shared_storage.capacity", positive=True)
+        if not self.compute_resources:
+            raise ValueError("Invalid scenario: no compute resources")
+
+        ids = set()
+        for r in self.compute_resources:
+            if r['id'] in ids:
+                raise ValueError("Invalid scenario: duplicate compute resource id: %s" % r['id'])
+            ids.add(r['id'])
+            for transformation in r['accepted_tasks']:
+                for table, estimation in (("storage_estimation", self.storage_estimation),
+                                          ("memory_estimation", self.memory_estimation)):
+                    if transformation not in estimation:
+                        raise ValueError("Invalid scenario: transformation %s accepted by %s has no %s"
+                                         % (transformation, r['id'], table))
+
+        for p in PIDConfiguration.PARAMETERS:
+            _check_number(getattr(self.config, p), "controllers.%s" % p)
+        if self.config.storage_limit > self.storage_capacity:
+            raise ValueError("Invalid scenario: controllers.storage_limit (%s) should not exceed "
+                             "shared_storage.capacity (%s)" % (self.config.storage_limit, self.storage_capacity))
+        if not 0 < self.config.memory_threshold <= 1:
+            raise ValueError("Invalid scenario: controllers.memory_threshold should be a fraction of the memory "
+                             "capacity, in (0, 1] (got %r)" % self.config.memory_threshold)
+
+    def check_workflow(self, workflow):
+        """
+        Check that every transformation of a workflow is accepted by a compute resource of the scenario (otherwise
+        its tasks would never be scheduled).
+        :param workflow: workflow object
+        """
+        accepted = set()
+        for r in self.compute_resources:
+            accepted.update(r['accepted_tasks'])
+        missing = set(t.transformation for t in workflow.task_list) - accepted
+        if missing:
+            raise ValueError("Scenario %s has no compute resource for transformations: %s"
+                             % (self.name or "", ", ".join(sorted(missing))))
+
+    def create_resources(self):
+        """
+        Create the shared storage and compute resources of the scenario (new objects at every call).
+        :return: shared storage and list of compute resources
+        """
+        shared_storage = Storage(self.storage_capacity)
+        compute_resources = []
+        for r in self.compute_resources:
+            cr = ComputeResource(r['id'], accepted_tasks=r['accepted_tasks'], shared_storage=shared_storage,
+                                 local_storage_capacity=r['local_storage_capacity'],
+                                 memory_capacity=r['memory_capacity'])
+            cr.generate_compute_units(compute_units=r['compute_units'])
+            compute_resources.append(cr)
+        return shared_storage, compute_resources
+
+    def create_estimator(self, name="static", quantile=None):
+        """
+        Create a resource estimator seeded with the estimation tables of the scenario.
+        :param name: estimator name (static or online)
+        :param quantile: estimated quantile of the online estimator (None for the mean)
+        :return: estimator object
+        """
+        return create_estimator(name, self.storage_estimation, self.memory_estimation, quantile=quantile)
+
+    def create_scheduler(self, workflow, clone=False, config=None, **options):
+        """
+        Create a scheduler of a workflow on a new platform of the scenario.
+        :param workflow: workflow object
+        :param clone: whether the scheduler runs on a clone of the workflow (so several schedulers can share a
+                      single parsed workflow)
+        :param config: PID controllers configuration (default: the scenario configuration); its storage capacity is
+                       replaced by the shared storage capacity of the scenario
+        :param options: other scheduler options (e.g., seed, policy, preemption, estimator, recorder)
+        :return: scheduler object
+        """
+        self.check_workflow(workflow)
+        shared_storage, compute_resources = self.create_resources()
+        config = _derive_config(config, self.storage_capacity) if config else self.config
+        return PIDScheduler(workflow.clone() if clone else workflow, compute_resources, shared_storage,
+                            config=config, storage_estimation=self.storage_estimation,
+                            memory_estimation=self.memory_estimation, **options)
+
+    def to_dict(self):
+        controllers = self.config.to_dict()
+        del controllers['storage_capacity']
+        values = {
+            'shared_storage': {'capacity': self.storage_capacity},
+            'compute_resources': [dict(r) for r in self.compute_resources],
+            'controllers': controllers,
+            'storage_estimation': dict(self.storage_estimation),
+            'memory_estimation': dict(self.memory_estimation)
+        }
+        if self.name:
+            values['name'] = self.name
+        return values
+
+    def save(self, path):
+        """
+        Write the scenario to a json file.
+        :param path: file path
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True, separators=(",", ": "))
+            f.write("\n")
+
+    @staticmethod
+    def load(path):
+        """
+        Read and validate a scenario from a json file.
+        :param path: file path
+        :return: scenario object
+        """
+        with open(path) as f:
+            try:
+                values = json.load(f)
+            except ValueError as e:
+                raise ValueError("Invalid scenario file %s: %s" % (path, e))
+        return Scenario.from_dict(values)
+
+    @staticmethod
+    def from_dict(values):
+        """
+        Create a scenario from a dictionary, missing sections take their default value.
+        :param values: dictionary of scenario sections
+        :return: scenario object
+        """
+        if not isinstance(values, dict):
+            raise ValueError("Invalid scenario: expected an object, got %s" % type(values).__name__)
+        unknown = set(values) - set(SECTIONS)
+        if unknown:
+            raise ValueError("Unknown scenario sections: %s" % ", ".join(sorted(unknown)))
+
+        storage = values.get('shared_storage', {})
+        if not isinstance(storage, dict) or set(storage) - {"capacity"}:
+            raise ValueError("Invalid scenario: shared_storage should only have a capacity")
+        storage_capacity = storage.get('capacity', DEFAULT_STORAGE_CAPACITY)
+
+        controllers = values.get('controllers', {})
+        if not isinstance(controllers, dict):
+            raise ValueError("Invalid scenario: controllers should be an object")
+        if 'storage_capacity' in controllers:
+            raise ValueError("Invalid scenario: controllers.storage_capacity is derived from shared_storage.capacity")
+
+        compute_resources = values.get('compute_resources')
+        if compute_resources is not None and not isinstance(compute_resources, list):
+            raise ValueError("Invalid scenario: compute_resources should be a list")
+
+        return Scenario(storage_capacity, compute_resources, PIDConfiguration.from_dict(controllers),
+                        values.get('storage_estimation'), values.get('memory_estimation'), values.get('name'))
+
+    def __str__(self):
+        return "Scenario: {name: %s, shared storage: %s, compute resources: %s}" \
+               % (self.name, self.storage_capacity, ", ".join(r['id'] for r in self.compute_resources))
+
+
+def _derive_config(config, storage_capacity):
+    """
+    :return: copy of a PID controllers configuration with the storage capacity of a scenario
+    """
+    values = config.to_dict()
+    values['storage_capacity'] = storage_capacity
+    return PIDConfiguration.from_dict(values)
+
+
+def _check_number(value, name, positive=False):
+    if isinstance(value, bool) or not isinstance(value, (int, long, float)) or value < 0 \
+            or (positive and value == 0):
+        raise ValueError("Invalid scenario: %s should be a %s number (got %r)"
+                         % (name, "positive" if positive else "non-negative", value))
+
+
+def _resource(values, index):
+    """
+    Validate a compute resource description.
+    :param values: dictionary of compute resource properties
+    :param index: index of the resource in the scenario
+    :return: normalized dictionary of compute resource properties
+    """
+    if not isinstance(values, dict):
+        raise ValueError("Invalid scenario: compute_resources[%s] should be an object" % index)
+    unknown = set(values) - set(RESOURCE_PROPERTIES)
+    if unknown:
+        raise ValueError("Unknown properties of compute_resources[%s]: %s" % (index, ", ".join(sorted(unknown))))
+    for p in ("id", "accepted_tasks", "memory_capacity", "compute_units"):
+        if p not in values:
+            raise ValueError("Invalid scenario: compute_resources[%s] has no %s" % (index, p))
+
+    name = "compute_resources[%s]" % index
+    if not isinstance(values['accepted_tasks'], list) or not values['accepted_tasks']:
+        raise ValueError("Invalid scenario: %s.accepted_tasks should be a non-empty list" % name)
+    _check_number(values['memory_capacity'], name + ".memory_capacity", positive=True)
+    _check_number(values.get('local_storage_capacity', 0), name + ".local_storage_capacity")
+    if not isinstance(values['compute_units'], (int, long)) or isinstance(values['compute_units'], bool) \
+            or values['compute_units'] <= 0:
+        raise ValueError("Invalid scenario: %s.compute_units should be a positive integer" % name)
+
+    return {
+        'id': str(values['id']),
+        'accepted_tasks': [intern(str(t).lower()) for t in values['accepted_tasks']],
+        'memory_capacity': values['memory_capacity'],
+        'compute_units': values['compute_units'],
+        'local_storage_capacity': values.get('local_storage_capacity', 0)
+    }
+
+
+def _estimation(values, name):
+    """
+    Validate an estimation table.
+    :param values: dictionary of estimation by transformation
+    :param name: table name
+    :return: normalized dictionary of estimation by transformation
+    """
+    if not isinstance(values, dict):
+        raise ValueError("Invalid scenario: %s should be an object" % name)
+    table = {}
+    for transformation, value in values.items():
+        _check_number(value, "%s.%s" % (name, transformation))
+        table[intern(str(transformation).lower())] = value
+    return table
+
+
+def default_scenario():
+    """
+    :return: the default scenario (the platform of the 1000genome workflow experiments)
+    """
+    return Scenario(name="default")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a scenario file, or write the default scenario.")
+    parser.add_argument("scenario", nargs="?", help="scenario file (json) to be validated")
+    parser.add_argument("-o", "--output", help="write the (validated) scenario to this file")
+    args = parser.parse_args()
+
+    scenario = Scenario.load(args.scenario) if args.scenario else default_scenario()
+    if args.output:
+        scenario.save(args.output)
+    print scenario
+
+
+if __name__ == '__main__':
+    main()
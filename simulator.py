@@ -17,70 +17,98 @@
 #
 __author__ = "Rafael Ferreira da Silva"
 
-import sys
+import argparse
 
 from file import *
 from workflow import *
 from resource import *
-from pid_scheduler import PIDScheduler
+from compiled_workflow import load_workflow
+from pid_scheduler import PIDConfiguration
+from estimator import ESTIMATORS
+from policy import POLICIES, create_policy
+from preemption import PREEMPTIONS, create_preemption
+from recorder import TelemetryRecorder
+from scenario import Scenario, default_scenario
+from util import configure_logging
 
 log = logging.getLogger(__name__)
 
 
-def main():
-    args = sys.argv[1:]
-
-    wf = Workflow()
-
-    wf_file = open(args[0])
-    use_pid = True
-
-    if len(args) > 1 and "--no-pid" in args:
-        use_pid = False
-
-    for line in wf_file:
-        l = line.strip()
-        if len(l.strip()) > 0 and not l.startswith("#"):
-            v = l.lower().split(",")
-            element_type = str(v[0])
-
-            if element_type == Element.TASK:
-                wf.add_task(Task(v[1], v[2], v[3]))
-
-            elif element_type == Element.FILE:
-                wf.add_file(File(v[1], v[2]))
+def create_resources():
+    """
+    Create the shared storage and compute resources of the default scenario.
+    :return: shared storage and list of compute resources
+    """
+    return default_scenario().create_resources()
 
-            elif element_type == Element.USES:
-                wf.add_use(v[1], v[2], v[3])
 
-            elif element_type == Element.DEPENDS:
-                wf.add_dependency(v[1], v[2])
-
-    # shared storage
-    shared_storage = Storage(500000)
-
-    # compute resources
-    # Large cluster, 2TB RAM, 32 cores
-    cr_large = ComputeResource("cluster-large", accepted_tasks=[TaskTransformation.INDIVIDUALS],
-                               shared_storage=shared_storage, memory_capacity=2000000)
-    cr_large.generate_compute_units(compute_units=32)
-
-    # Intermediate cluster, 192GB RAM, 16 cores
-    cr_inter = ComputeResource("cluster-intermediate", accepted_tasks=[TaskTransformation.SIFTING],
-                               shared_storage=shared_storage, memory_capacity=192000)
-    cr_inter.generate_compute_units(compute_units=16)
-
-    # Small cluster, 64GB RAM, 32 cores
-    cr_small = ComputeResource("cluster-small", accepted_tasks=[TaskTransformation.POPULATION, TaskTransformation.PAIR,
-                                                                TaskTransformation.FREQUENCY],
-                               shared_storage=shared_storage, memory_capacity=100000)
-    cr_small.generate_compute_units(compute_units=32)
-
-    compute_resources = [cr_large, cr_inter, cr_small]
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the execution of a workflow with PID controllers.")
+    parser.add_argument("workflow", help="workflow file (csv)")
+    parser.add_argument("--no-pid", dest="use_pid", action="store_false", help="disable the PID controllers")
+    parser.add_argument("--event-driven", action="store_true",
+                        help="advance the clock to the next event instead of one time step at a time")
+    parser.add_argument("--telemetry", metavar="PREFIX",
+                        help="record controller and resource telemetry into PREFIX.bin and PREFIX.csv")
+    parser.add_argument("--profile", action="store_true",
+                        help="accumulate wall time and call/iteration counts per scheduling phase")
+    parser.add_argument("--seed", type=int, help="seed of the random task selection")
+    parser.add_argument("--policy", choices=list(POLICIES), default="random",
+                        help="order in which queued tasks are examined (default: random)")
+    parser.add_argument("--preemption", choices=list(PREEMPTIONS), default="latest-started",
+                        help="order in which running tasks are preempted on storage overflow (default: latest-started)")
+    parser.add_argument("--estimator", choices=list(ESTIMATORS), default="static",
+                        help="storage and memory estimations used to admit tasks: static tables, or online "
+                             "statistics learned from finished tasks (default: static)")
+    parser.add_argument("--quantile", type=float,
+                        help="quantile estimated by the online estimator (default: the mean)")
+    parser.add_argument("--controller-bank", action="store_true",
+                        help="update all PID controllers in a single vectorized call (requires numpy)")
+    parser.add_argument("--scenario", help="scenario file (json) describing the platform, controllers, and estimations")
+    parser.add_argument("--config", help="PID configuration file (json), e.g. a gains file written by tuner.py "
+                                         "(overrides the controllers of the scenario)")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument("-v", "--verbose", action="store_true",
+                           help="also log controller inputs and resource states at every time step")
+    verbosity.add_argument("-q", "--quiet", action="store_true", help="only print the makespan and summary")
+    args = parser.parse_args()
+    if args.quantile is not None and args.estimator != "online":
+        parser.error("--quantile requires the online estimator")
+
+    if args.quiet:
+        handler = configure_logging(logging.WARNING)
+    elif args.verbose:
+        handler = configure_logging(logging.DEBUG)
+    else:
+        handler = configure_logging(logging.INFO)
+
+    scenario = Scenario.load(args.scenario) if args.scenario else default_scenario()
+    wf = load_workflow(args.workflow)
+
+    config = None
+    if args.config:
+        config = PIDConfiguration.load(args.config)
 
     # create scheduler and start simulation
-    pid_scheduler = PIDScheduler(wf, compute_resources, shared_storage)
-    pid_scheduler.start(enable_pid=use_pid)
+    pid_scheduler = scenario.create_scheduler(wf, config=config, profile=args.profile, seed=args.seed,
+                                              policy=create_policy(args.policy),
+                                              preemption=create_preemption(args.preemption),
+                                              estimator=scenario.create_estimator(args.estimator, args.quantile),
+                                              controller_bank=args.controller_bank)
+    recorder = None
+    if args.telemetry:
+        recorder = TelemetryRecorder(pid_scheduler.compute_resources)
+        pid_scheduler.recorder = recorder
+    makespan = pid_scheduler.start(enable_pid=args.use_pid, event_driven=args.event_driven)
+    if recorder:
+        recorder.save(args.telemetry)
+    handler.flush()
+
+    summary = pid_scheduler.get_summary()
+    print "\nWorkflow Makespan: %s\n" % makespan
+    print "Time steps: %(steps)s, completed tasks: %(completed_tasks)s, preempted tasks: %(preempted_tasks)s, " \
+          "cleanup tasks: %(cleanup_tasks)s" % summary
+    print pid_scheduler.stats
 
 
 if __name__ == '__main__':
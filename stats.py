@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import ctypes
+import ctypes.util
+import logging
+import sys
+
+log = logging.getLogger(__name__)
+
+# clock id of clock_gettime() (Linux)
+CLOCK_MONOTONIC = 1
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _clock_gettime_timer():
+    """
+    Build a monotonic timer from clock_gettime(CLOCK_MONOTONIC), for Python versions without time.monotonic().
+    :return: timer function (seconds), or None if clock_gettime() is not available
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    for name in ["rt", "c"]:
+        path = ctypes.util.find_library(name)
+        if not path:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+        timespec = _Timespec()
+        pointer = ctypes.pointer(timespec)
+        if clock_gettime(CLOCK_MONOTONIC, pointer) != 0:
+            continue
+
+        def timer():
+            clock_gettime(CLOCK_MONOTONIC, pointer)
+            return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+        return timer
+    return None
+
+
+# whether phase times are measured with a monotonic clock (otherwise, the wall clock may jump, e.g., on NTP updates)
+MONOTONIC = True
+try:
+    from time import monotonic as timer
+except ImportError:
+    timer = _clock_gettime_timer()
+    if timer is None:
+        from timeit import default_timer as timer
+
+        MONOTONIC = False
+
+
+class Phase:
+    FINISHED_TASKS = "finished_tasks"
+    CONTROLLERS = "controllers"
+    READY_QUEUE = "ready_queue"
+    PLACEMENT = "placement"
+    PREEMPTION = "preemption"
+    CLEANUP = "cleanup"
+
+    ALL = [FINISHED_TASKS, CONTROLLERS, READY_QUEUE, PLACEMENT, PREEMPTION, CLEANUP]
+
+
+class SchedulerStats:
+    """
+    Counters of a simulation run. Per-phase wall time and call/iteration counts are only accumulated when
+    profiling is enabled.
+    """
+
+    def __init__(self, profile=False):
+        """
+
+        :param profile: whether per-phase wall time and call/iteration counts are accumulated
+        """
+        self.profile = profile
+        self.steps = 0
+        self.tasks_examined = 0
+        self.tasks_placed = 0
+        self.preempted_tasks = 0
+        self.overflow_steps = 0
+        self.insufficient_space = 0
+        self.insufficient_memory = 0
+        # cleanup tasks whose files are not enough to make room for any of the tasks that failed for lack of space
+        self.futile_cleanups = 0
+        self.peak_storage = 0
+        self.peak_memory = 0
+        self.phase_time = dict.fromkeys(Phase.ALL, 0.0)
+        self.phase_calls = dict.fromkeys(Phase.ALL, 0)
+        self.phase_iterations = dict.fromkeys(Phase.ALL, 0)
+
+    def update_peaks(self, used_storage, used_memory):
+        """
+        Update the peak storage and memory usage.
+        :param used_storage: current shared storage usage
+        :param used_memory: current memory usage (summed over all compute resources)
+        """
+        if used_storage > self.peak_storage:
+            self.peak_storage = used_storage
+        if used_memory > self.peak_memory:
+            self.peak_memory = used_memory
+
+    def add_phase(self, phase, start_time, iterations=0):
+        """
+        Account one call of a phase.
+        :param phase: phase name
+        :param start_time: timer value when the phase started
+        :param iterations: number of iterations performed in the phase
+        :return: current timer value, so it can be used as the start time of the next phase
+        """
+        now = timer()
+        self.phase_time[phase] += now - start_time
+        self.phase_calls[phase] += 1
+        self.phase_iterations[phase] += iterations
+        return now
+
+    def __str__(self):
+        """
+        Print the collected statistics.
+        :return: statistics in string format
+        """
+        str = "Stats {\n"
+        str += "  steps: %s\n" % self.steps
+        str += "  tasks examined: %s, placed: %s\n" % (self.tasks_examined, self.tasks_placed)
+        str += "  preempted tasks: %s, overflow steps: %s\n" % (self.preempted_tasks, self.overflow_steps)
+        str += "  InsufficientSpace: %s, InsufficientMemory: %s\n" % (self.insufficient_space,
+                                                                    self.insufficient_memory)
+        str += "  futile cleanup tasks: %s\n" % self.futile_cleanups
+        str += "  peak storage: %s, peak memory: %s\n" % (self.peak_storage, self.peak_memory)
+        if self.profile:
+            str += "  phases:%s\n" % ("" if MONOTONIC else " (wall clock, not monotonic)")
+            for phase in Phase.ALL:
+                str += "    %-15s %10.4fs  calls: %-8s iterations: %s\n" % (phase, self.phase_time[phase],
+                                                                          self.phase_calls[phase],
+                                                                          self.phase_iterations[phase])
+        str += "}"
+        return str
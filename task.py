@@ -46,16 +46,35 @@ class TaskTransformation:
     FREQUENCY = "frequency"
 
 
-class Task:
+class FileSet(TupleMapping):
+    """
+    Compact mapping of files by name.
+    """
+    __slots__ = ()
+    key = "name"
+
+
+class TaskSet(TupleMapping):
+    """
+    Compact mapping of tasks by id.
+    """
+    __slots__ = ()
+    key = "id"
+
+
+class Task(object):
+    __slots__ = ("id", "transformation", "duration", "peak_memory", "input_data", "intermediate_data", "output_data",
+                 "parent_tasks", "status", "start_time", "end_time", "type")
+
     def __init__(self, id, duration, peak_memory=0.0, type=TaskType.REGULAR):
         self.id = id
-        self.transformation = id.split('_')[0]
+        self.transformation = intern(id.split('_')[0])
         self.duration = float(duration)
         self.peak_memory = int(peak_memory)
-        self.input_data = {}
-        self.intermediate_data = {}
-        self.output_data = {}
-        self.parent_tasks = {}
+        self.input_data = FileSet()
+        self.intermediate_data = FileSet()
+        self.output_data = FileSet()
+        self.parent_tasks = TaskSet()
         self.status = TaskStatus.IDLE
         self.start_time = -1
         self.end_time = -1
@@ -64,6 +83,15 @@ class Task:
     def add_parent(self, parent_task):
         self.parent_tasks[parent_task.id] = parent_task
 
+    def freeze(self):
+        """
+        Compact the task data and parent mappings once the task has been built.
+        """
+        self.input_data.freeze()
+        self.intermediate_data.freeze()
+        self.output_data.freeze()
+        self.parent_tasks.freeze()
+
     def is_ready(self):
         for task in self.parent_tasks.values():
             if task.status != TaskStatus.COMPLETED:
@@ -80,6 +108,11 @@ class Task:
         self.start_time = -1
         self.end_time = -1
 
+    def reset(self):
+        self.status = TaskStatus.IDLE
+        self.start_time = -1
+        self.end_time = -1
+
     def __str__(self):
         input_data = print_dictionary_ids(self.input_data)
         intermediate_data = print_dictionary_ids(self.intermediate_data)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Rafael Ferreira da Silva
+# http://www.rafaelsilva.com/tools
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing,
+#  software distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+__author__ = "Rafael Ferreira da Silva"
+
+import argparse
+import logging
+import multiprocessing
+
+from experiment import _init_worker, simulate
+from pid_scheduler import PIDConfiguration
+from result_cache import DEFAULT_MAX_SIZE
+from scenario import Scenario, default_scenario
+
+log = logging.getLogger(__name__)
+
+# tuned parameters and their (lower, upper) bounds
+TUNED_PARAMETERS = [
+    ("sto_kp", 0.0, 10.0),
+    ("sto_ki", 0.0, 10.0),
+    ("sto_kd", 0.0, 10.0),
+    ("mem_kp", 0.0, 10.0),
+    ("mem_ki", 0.0, 10.0),
+    ("mem_kd", 0.0, 10.0),
+    ("memory_threshold", 0.05, 1.0)
+]
+
+
+def evaluate(job):
+    """
+    Evaluate a candidate configuration over a set of replicas in a worker process. Replicas run one after the
+    other, and the evaluation is aborted as soon as the sum of makespans exceeds the budget given by the best
+    objective so far (the penalties are non-negative, thus the candidate cannot be better). Candidates whose
+    simulations stall are discarded as well.
+    :param job: tuple of (candidate parameters, seeds, enable_pid, preemption penalty, overflow penalty, bound)
+    :return: tuple of (candidate parameters, objective value or None if aborted, number of simulations run)
+    """
+    parameters, seeds, enable_pid, preemption_penalty, overflow_penalty, bound = job
+    budget = None if bound is None else bound * len(seeds)
+    objective = 0.0
+    simulations = 0
+
+    for seed in seeds:
+        time_limit = None if budget is None else int(budget - objective)
+        summary = simulate(parameters, seed, enable_pid, time_limit=time_limit)
+        simulations += 1
+        if summary is None:
+            return parameters, None, simulations
+
+        objective += summary['makespan'] + preemption_penalty * summary['preempted_tasks'] \
+            + overflow_penalty * summary['overflow_steps']
+        if budget is not None and objective > budget:
+            return parameters, None, simulations
+
+    return parameters, objective / len(seeds), simulations
+
+
+def tune(workflow_path, seeds, initial=None, step=0.5, min_step=0.05, max_iterations=50, enable_pid=True,
+         preemption_penalty=0.0, overflow_penalty=0.0, processes=None, cache_directory=None,
+         cache_size=DEFAULT_MAX_SIZE, scenario=None):
+    """
+    Minimize the mean makespan (plus optional penalties) with a parallel coordinate (compass) search: at every
+    iteration, all candidates obtained by moving one parameter up or down by the current step are evaluated in
+    parallel. The search moves to the best improving candidate, or halves the step if none improves.
+    :param workflow_path: workflow file path
+    :param seeds: list of seeds used to evaluate every candidate
+    :param initial: dictionary of initial parameter values (default: the scenario configuration)
+    :param step: initial step (relative to the parameter range for the memory threshold, absolute for the gains)
+    :param min_step: the search stops once the step is smaller than this value
+    :param max_iterations: maximum number of iterations
+    :param enable_pid: whether the PID controllers are enabled
+    :param preemption_penalty: penalty added to the objective per preempted task
+    :param overflow_penalty: penalty added to the objective per time step in storage overflow
+    :param processes: number of worker processes (default: number of CPUs)
+    :param cache_directory: result cache directory (optional): cached simulations are not run again, thus an
+                            interrupted search resumes immediately
+    :param cache_size: bound of the result cache size (bytes)
+    :param scenario: scenario object (default: the default scenario)
+    :return: best configuration parameters and objective value (a ValueError is raised if the simulations of the
+             initial configuration stall)
+    """
+    scenario = scenario or default_scenario()
+    defaults = scenario.config.to_dict()
+    best = dict((name, defaults[name]) for name, _, _ in TUNED_PARAMETERS)
+    best.update(initial or {})
+    simulations = 0
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(workflow_path, cache_directory, cache_size, scenario))
+    try:
+        _, best_objective, n = pool.apply(evaluate, ((best, seeds, enable_pid, preemption_penalty,
+                                                      overflow_penalty, None),))
+        simulations += n
+        if best_objective is None:
+            # there is no objective to improve on: candidates cannot be compared against the starting point
+            raise ValueError("The simulations of the initial configuration stall (seeds: %s): %s"
+                             % (", ".join(str(s) for s in seeds),
+                                ", ".join("%s=%s" % (p, best[p]) for p in sorted(best))))
+        log.info("[0] initial objective: %s", best_objective)
+
+        for iteration in range(1, max_iterations + 1):
+            if step < min_step:
+                break
+
+            candidates = []
+            for name, lower, upper in TUNED_PARAMETERS:
+                delta = step * (upper - lower) if name == "memory_threshold" else step
+                for value in (best[name] - delta, best[name] + delta):
+                    value = min(max(value, lower), upper)
+                    if value != best[name]:
+                        candidate = dict(best)
+                        candidate[name] = value
+                        candidates.append(candidate)
+
+            jobs = [(c, seeds, enable_pid, preemption_penalty, overflow_penalty, best_objective) for c in candidates]
+            improved = False
+            for candidate, objective, n in pool.imap_unordered(evaluate, jobs):
+                simulations += n
+                if objective is not None and objective < best_objective:
+                    best, best_objective, improved = candidate, objective, True
+
+            if not improved:
+                step /= 2.0
+            log.info("[%s] objective: %s, step: %s, simulations: %s", iteration, best_objective, step, simulations)
+    finally:
+        pool.close()
+        pool.join()
+
+    return best, best_objective
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the PID gains and memory threshold to minimize the makespan.")
+    parser.add_argument("workflow", help="workflow file (csv)")
+    parser.add_argument("--scenario", help="scenario file (json) describing the platform, controllers, and "
+                                           "estimations (its controllers are the default starting point)")
+    parser.add_argument("--output", default="gains.json", help="gains file to be written (default: gains.json)")
+    parser.add_argument("--initial", help="configuration file (json) used as starting point")
+    parser.add_argument("--replicas", type=int, default=3, help="number of replicas per candidate")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first replica (seeds are consecutive)")
+    parser.add_argument("--step", type=float, default=0.5, help="initial search step")
+    parser.add_argument("--min-step", type=float, default=0.05, help="minimum search step")
+    parser.add_argument("--max-iterations", type=int, default=50, help="maximum number of iterations")
+    parser.add_argument("--preemption-penalty", type=float, default=0.0,
+                        help="penalty added to the objective per preempted task")
+    parser.add_argument("--overflow-penalty", type=float, default=0.0,
+                        help="penalty added to the objective per time step in storage overflow")
+    parser.add_argument("--processes", type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--cache", metavar="DIR", help="result cache directory (cached simulations are not run)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024), metavar="MB",
+                        help="bound of the result cache size (default: %(default)s MB)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    scenario = Scenario.load(args.scenario) if args.scenario else None
+    initial = None
+    if args.initial:
+        initial = PIDConfiguration.load(args.initial).to_dict()
+        initial = dict((name, initial[name]) for name, _, _ in TUNED_PARAMETERS)
+
+    try:
+        best, best_objective = tune(args.workflow, range(args.seed, args.seed + args.replicas), initial=initial,
+                                    step=args.step, min_step=args.min_step, max_iterations=args.max_iterations,
+                                    preemption_penalty=args.preemption_penalty,
+                                    overflow_penalty=args.overflow_penalty, processes=args.processes,
+                                    cache_directory=args.cache, cache_size=args.cache_size * 1024 * 1024,
+                                    scenario=scenario)
+    except ValueError as e:
+        parser.error("%s (use --initial to start from another configuration)" % e)
+
+    # parameters that are not tuned keep the value of the scenario configuration
+    values = (scenario or default_scenario()).config.to_dict()
+    values.update(best)
+    PIDConfiguration.from_dict(values).save(args.output)
+    print "Best objective: %s" % best_objective
+    print "Gains written to %s: %s" % (args.output, ", ".join("%s=%s" % (p, best[p]) for p in sorted(best)))
+
+
+if __name__ == '__main__':
+    main()
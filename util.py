@@ -17,6 +17,9 @@
 #
 __author__ = "Rafael Ferreira da Silva"
 
+import logging
+import sys
+
 
 def print_dictionary_ids(dict_obj):
     data = ""
@@ -24,4 +27,170 @@ def print_dictionary_ids(dict_obj):
         if len(data) > 0:
             data += ", "
         data += "%s" % id
-    return data
\ No newline at end of file
+    return data
+
+
+class TupleMapping(object):
+    """
+    Compact mapping of objects by one of their attributes, backed by a tuple. It supports the dictionary operations
+    used on task data and parent tasks, and is much smaller than a dictionary for the few entries a task has (lookups
+    are linear in the number of entries). values() returns the backing tuple without copying it. Mappings that grow
+    beyond a few entries while they are built (e.g., the parents of a task with a wide fan-in) are backed by a list
+    indexed by a dictionary instead, so that insertions and lookups stay O(1), until they are frozen back into a tuple
+    by freeze() or by the first call that reads all their entries.
+    """
+    __slots__ = ("_values",)
+
+    # name of the attribute used as key (defined by subclasses)
+    key = None
+
+    # mappings with this number of entries switch to an indexed list when an entry is added
+    BUILD_THRESHOLD = 8
+
+    def __init__(self, values=()):
+        self._values = tuple(values)
+
+    def __getitem__(self, key):
+        values = self._values
+        if values.__class__ is not tuple:
+            return values.entries[values.index[key]]
+        for value in values:
+            if getattr(value, self.key) == key:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        values = self._values
+        if values.__class__ is tuple:
+            if len(values) < TupleMapping.BUILD_THRESHOLD:
+                values = [v for v in values if getattr(v, self.key) != key]
+                values.append(value)
+                self._values = tuple(values)
+                return
+            values = self._values = _IndexedEntries([getattr(v, self.key) for v in values], values)
+        values.add(key, value)
+
+    def __contains__(self, key):
+        values = self._values
+        if values.__class__ is not tuple:
+            return key in values.index
+        for value in values:
+            if getattr(value, self.key) == key:
+                return True
+        return False
+
+    def __iter__(self):
+        for value in self.values():
+            yield getattr(value, self.key)
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, default=None):
+        values = self._values
+        if values.__class__ is not tuple:
+            i = values.index.get(key)
+            return default if i is None else values.entries[i]
+        for value in values:
+            if getattr(value, self.key) == key:
+                return value
+        return default
+
+    def freeze(self):
+        """
+        Store the entries in a tuple once the mapping has been built.
+        """
+        if self._values.__class__ is not tuple:
+            self._values = self._values.freeze()
+
+    def keys(self):
+        return [getattr(value, self.key) for value in self.values()]
+
+    def values(self):
+        values = self._values
+        if values.__class__ is not tuple:
+            values = self._values = values.freeze()
+        return values
+
+    def items(self):
+        return [(getattr(value, self.key), value) for value in self.values()]
+
+
+class _IndexedEntries(object):
+    """
+    Entries of a TupleMapping being built: values in insertion order, and position of each key. Replaced entries
+    leave a hole and move to the end, as in the tuple.
+    """
+    __slots__ = ("entries", "index", "holes")
+
+    def __init__(self, keys, values):
+        self.entries = list(values)
+        self.index = dict(zip(keys, range(0, len(self.entries))))
+        self.holes = 0
+
+    def add(self, key, value):
+        i = self.index.get(key)
+        if i is not None:
+            self.entries[i] = _HOLE
+            self.holes += 1
+        self.index[key] = len(self.entries)
+        self.entries.append(value)
+
+    def freeze(self):
+        if self.holes:
+            return tuple(v for v in self.entries if v is not _HOLE)
+        return tuple(self.entries)
+
+    def __len__(self):
+        return len(self.entries) - self.holes
+
+
+# placeholder of the replaced entries of an indexed list
+_HOLE = object()
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """
+    Logging handler that formats records as they are emitted, but only writes them to the stream once the buffer
+    reaches its capacity (or the handler is flushed or closed).
+    """
+
+    def __init__(self, stream=None, capacity=1000):
+        logging.StreamHandler.__init__(self, stream)
+        self.capacity = capacity
+        self.buffer = []
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record))
+            if len(self.buffer) >= self.capacity:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.buffer:
+                self.stream.write("\n".join(self.buffer) + "\n")
+                self.buffer = []
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+        finally:
+            self.release()
+
+
+def configure_logging(level=logging.INFO, stream=None, capacity=1000):
+    """
+    Route the simulator loggers through a buffered stream handler.
+    :param level: logging level (messages below this level are not formatted)
+    :param stream: output stream (default: standard output)
+    :param capacity: number of records kept in the buffer before writing them
+    :return: logging handler
+    """
+    handler = BufferedStreamHandler(stream or sys.stdout, capacity=capacity)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
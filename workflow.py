@@ -19,7 +19,9 @@ __author__ = "Rafael Ferreira da Silva"
 
 import logging
 
-from file import FileLink
+from collections import OrderedDict
+from file import File, FileLink, FileReferences
+from task import Task, TaskSet, TaskStatus, TaskType
 from util import *
 
 log = logging.getLogger(__name__)
@@ -35,8 +37,14 @@ class Element:
 class Workflow:
     def __init__(self):
         self.tasks = {}
+        self.task_list = []
         self.pending_tasks = {}
         self.files = {}
+        self.file_list = []
+        self.children = {}
+        self.unfinished_parents = {}
+        self.ready_tasks = OrderedDict()
+        self.file_references = FileReferences()
 
     def add_task(self, task):
         """
@@ -45,7 +53,20 @@ class Workflow:
         :return:
         """
         self.tasks[task.id] = task
+        self.task_list.append(task)
+        self.add_pending_task(task)
+
+    def add_pending_task(self, task):
+        """
+        Add a task to the list of pending tasks without making it part of the workflow structure (e.g., cleanup
+        tasks created during the simulation).
+        :param task: task object
+        """
         self.pending_tasks[task.id] = task
+        self.children[task.id] = []
+        self.unfinished_parents[task.id] = 0
+        self.ready_tasks[task.id] = task
+        self.file_references.add_pending_task(task)
 
     def add_file(self, file):
         """
@@ -54,7 +75,10 @@ class Workflow:
         :return:
         """
         if file.name not in self.files:
+            file.id = len(self.file_list)
             self.files[file.name] = file
+            self.file_list.append(file)
+            self.file_references.add_file(file)
 
     def add_use(self, task_id, file_name, link):
         """
@@ -68,6 +92,8 @@ class Workflow:
         file = self.files[file_name]
 
         if link == FileLink.INPUT:
+            if task.id in self.pending_tasks and file.name not in task.input_data:
+                self.file_references.add_required_file(file)
             task.input_data[file.name] = file
         elif link == FileLink.OUTPUT:
             task.output_data[file.name] = file
@@ -82,11 +108,151 @@ class Workflow:
         :return:
         """
         child_task = self.tasks[child_id]
-        child_task.add_parent(self.tasks[parent_id])
+        parent_task = self.tasks[parent_id]
+        if parent_id in child_task.parent_tasks:
+            return
+
+        child_task.add_parent(parent_task)
+        self.children[parent_id].append(child_task)
+        if parent_task.status != TaskStatus.COMPLETED:
+            self.unfinished_parents[child_id] += 1
+            self.ready_tasks.pop(child_id, None)
+
+    def complete_task(self, task):
+        """
+        Remove a finished task from the list of pending tasks, and release its children that have no
+        unfinished parents left.
+        :param task: finished task object
+        """
+        del self.pending_tasks[task.id]
+        self.file_references.remove_pending_task(task)
+        for child_task in self.children[task.id]:
+            self.unfinished_parents[child_task.id] -= 1
+            if self.unfinished_parents[child_task.id] == 0 and child_task.status == TaskStatus.IDLE:
+                self.ready_tasks[child_task.id] = child_task
+
+    def preempt_task(self, task):
+        """
+        Make a preempted task ready to run again. Its parents are still completed, and its children were never
+        released, so no unfinished-parent counter changes.
+        :param task: preempted task object
+        """
+        self.ready_tasks[task.id] = task
+
+    def pop_ready_tasks(self):
+        """
+        Get the tasks that became ready since the last call.
+        :return: list of ready tasks
+        """
+        ready_tasks = list(self.ready_tasks.values())
+        self.ready_tasks.clear()
+        return ready_tasks
+
+    def freeze(self):
+        """
+        Compact the task data and parent mappings once the workflow structure has been built.
+        """
+        for task in self.task_list:
+            task.freeze()
 
     def is_completed(self):
         return len(self.pending_tasks) == 0
 
+    def reset(self):
+        """
+        Reset the per-run state (task status, pending and ready tasks, unfinished-parent counters, and file
+        references) so the same workflow structure can be simulated again. Tasks added during the run (e.g.,
+        cleanup tasks) are discarded.
+        """
+        for task_id in list(self.children):
+            if task_id not in self.tasks:
+                del self.children[task_id]
+
+        self.pending_tasks = dict(self.tasks)
+        self.ready_tasks.clear()
+        self.file_references.clear()
+
+        for task in self.task_list:
+            task.reset()
+            self.unfinished_parents[task.id] = len(task.parent_tasks)
+            if not task.parent_tasks:
+                self.ready_tasks[task.id] = task
+            self.file_references.add_pending_task(task)
+
+    def get_state(self):
+        """
+        Capture the per-run state of the workflow: task status and times, pending cleanup tasks, unfinished-parent
+        counters, ready tasks, and file references. The workflow structure and the files are not copied.
+        :return: workflow state (tuple)
+        """
+        tasks = tuple((t.status, t.start_time, t.end_time) for t in self.task_list)
+        cleanup_tasks = tuple((t.id, t.duration, t.input_data, t.status, t.start_time, t.end_time)
+                              for t in self.pending_tasks.values() if t.id not in self.tasks)
+        references = (tuple(self.file_references.pending), tuple(self.file_references.running))
+        return tasks, cleanup_tasks, dict(self.unfinished_parents), tuple(self.ready_tasks), references
+
+    def set_state(self, state):
+        """
+        Restore a per-run state captured by get_state() from this workflow or from a clone of it.
+        :param state: workflow state (tuple)
+        """
+        tasks, cleanup_tasks, unfinished_parents, ready_tasks, references = state
+        if len(tasks) != len(self.task_list):
+            raise ValueError("Workflow state does not match the workflow structure (%s tasks, expected %s)"
+                             % (len(tasks), len(self.task_list)))
+
+        for task_id in list(self.children):
+            if task_id not in self.tasks:
+                del self.children[task_id]
+
+        self.pending_tasks = {}
+        for task, (status, start_time, end_time) in zip(self.task_list, tasks):
+            task.status, task.start_time, task.end_time = status, start_time, end_time
+            if status != TaskStatus.COMPLETED:
+                self.pending_tasks[task.id] = task
+
+        for task_id, duration, input_data, status, start_time, end_time in cleanup_tasks:
+            task = Task(task_id, duration, type=TaskType.CLEANUP)
+            # the input files of a cleanup task are never modified, thus they can be shared
+            task.input_data = input_data
+            task.status, task.start_time, task.end_time = status, start_time, end_time
+            self.pending_tasks[task.id] = task
+            self.children[task.id] = []
+
+        self.unfinished_parents = dict(unfinished_parents)
+        self.ready_tasks = OrderedDict((task_id, self.pending_tasks[task_id]) for task_id in ready_tasks)
+
+        self.file_references.set_counts(*references)
+
+    def clone(self):
+        """
+        Create a workflow with the same structure, in its initial state. Files and the task data dictionaries
+        are shared with this workflow, since they are not modified during a simulation.
+        :return: workflow object
+        """
+        wf = Workflow()
+        wf.files = self.files
+        wf.file_list = self.file_list
+        for f in self.file_list:
+            wf.file_references.add_file(f)
+        for task in self.task_list:
+            clone = Task(task.id, task.duration, task.peak_memory, type=task.type)
+            clone.input_data = task.input_data
+            clone.intermediate_data = task.intermediate_data
+            clone.output_data = task.output_data
+            wf.tasks[clone.id] = clone
+            wf.task_list.append(clone)
+            wf.children[clone.id] = []
+
+        for task in self.task_list:
+            clone = wf.tasks[task.id]
+            clone.parent_tasks = TaskSet([wf.tasks[parent.id] for parent in task.parent_tasks.values()])
+            for parent in task.parent_tasks.values():
+                wf.children[parent.id].append(clone)
+
+        wf.reset()
+        return wf
+
     def __str__(self):
         """
 
@@ -109,3 +275,37 @@ class Workflow:
 
         out_str += "}"
         return out_str
+
+
+def parse_workflow(wf_file):
+    """
+    Parse a workflow description (csv).
+    :param wf_file: workflow file path or file object
+    :return: workflow object
+    """
+    if isinstance(wf_file, basestring):
+        with open(wf_file) as f:
+            return parse_workflow(f)
+
+    wf = Workflow()
+
+    for line in wf_file:
+        l = line.strip()
+        if len(l.strip()) > 0 and not l.startswith("#"):
+            v = l.lower().split(",")
+            element_type = str(v[0])
+
+            if element_type == Element.TASK:
+                wf.add_task(Task(v[1], v[2], v[3]))
+
+            elif element_type == Element.FILE:
+                wf.add_file(File(v[1], v[2]))
+
+            elif element_type == Element.USES:
+                wf.add_use(v[1], v[2], v[3])
+
+            elif element_type == Element.DEPENDS:
+                wf.add_dependency(v[1], v[2])
+
+    wf.freeze()
+    return wf